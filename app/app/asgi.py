@@ -9,8 +9,25 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
+# Sync code runs in a new thread per request under ASGI, so persistent
+# connections would pile up; the pool hands connections between threads.
+os.environ.setdefault('DB_POOL', '1')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+# Django's handler, also cancelling the queries of clients that left,
+# and the event stream, which Django 4.0 can't serve as a coroutine.
+from core.events import with_event_stream  # noqa: E402
+from core.timeouts import ASGIHandler  # noqa: E402
+
+application = with_event_stream(ASGIHandler())
+
+# Servers loading the app before forking workers set WARM_BOOT=1.
+if os.environ.get('WARM_BOOT') == '1':
+    from core import warmup
+
+    warmup.warm()
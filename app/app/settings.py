@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'user',
     'book',
@@ -53,11 +55,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.HealthCheckMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.QueryWatchMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,17 +95,57 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# With DB_POOL=1 connections are handed back to an in-process pool at the
+# end of every request, so CONN_MAX_AGE is forced to 0 in that mode.
+
+DB_POOL = bool(int(os.environ.get('DB_POOL', 0)))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': bool(int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1))),
+        'POOL': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        } if DB_POOL else None,
+    }
+}
+
+# Read replicas share credentials with primary. Safe-method reads go to a
+# random replica unless the user wrote within DB_REPLICA_PIN_SECONDS.
+# Point DB_REPLICA_HOSTS at the primary host to try it out locally.
+
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    DATABASES[f'replica{index}'] = dict(
+        DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(f'replica{index}')
 
+DATABASE_ROUTERS = ['core.db.routers.PrimaryReplicaRouter']
+
+# The cache is shared by the uwsgi workers through the filesystem.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.InstrumentedFileBasedCache',
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'app-cache'),
+        ),
     }
 }
 
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -139,6 +188,8 @@ MEDIA_URL = '/static/media/'
 
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
+# Hashed names plus .gz/.br siblings for nginx gzip_static.
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
@@ -153,4 +204,140 @@ REST_FRAMEWORK = {
 }
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
-}
\ No newline at end of file
+}
+
+# Fraction of requests timed by ServerTimingMiddleware.
+
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', 0.1))
+
+# Thresholds of core.querywatch. The test runner turns query budget
+# warnings into failures.
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+QUERY_BUDGETS_ENFORCED = False
+
+TEST_RUNNER = 'core.runner.QueryBudgetRunner'
+
+# Responses smaller than this are not worth compressing.
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+
+# Most books fetched by one /api/book/books/batch/ request.
+
+BOOK_BATCH_MAX = int(os.environ.get('BOOK_BATCH_MAX', 100))
+
+# Most sub-requests run by one /api/batch/ request.
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+
+# Change log entries returned per sync page, and how long tombstones
+# are kept by compact_changelog before clients must fetch everything.
+
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 1000))
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', 30))
+
+# Event streams of core.events, served under ASGI only. EVENTS_BUS is
+# 'postgres' to be woken by LISTEN/NOTIFY, across processes, 'local' for
+# commits of the same process, or 'off', the default outside of
+# SERVER_MODE=asgi: every NOTIFY takes a database-wide lock at commit.
+# Idle streams get a heartbeat every EVENTS_HEARTBEAT_SECONDS; clients
+# reconnect after EVENTS_RETRY_MS.
+
+EVENTS_BUS = os.environ.get(
+    'EVENTS_BUS',
+    'postgres' if os.environ.get('SERVER_MODE') == 'asgi' else 'off',
+)
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+EVENTS_RETRY_MS = int(os.environ.get('EVENTS_RETRY_MS', 3000))
+
+# Responses stored for Idempotency-Key retries are kept this long. Claims
+# in flight longer than IDEMPOTENCY_LOCK_SECONDS are taken as abandoned;
+# duplicates wait up to IDEMPOTENCY_WAIT_SECONDS for the first request.
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 5))
+
+# Token buckets of core.throttling as 'requests/period': a bucket holds
+# that many requests and refills at that rate. Keys are a view's
+# throttle_scope with an optional action, the most specific one applies.
+# Set a variable empty to lift the limit.
+
+THROTTLE_RATES = {
+    'book': os.environ.get('THROTTLE_BOOK', '1200/min'),
+    'book.list': os.environ.get('THROTTLE_BOOK_LIST', '300/min'),
+    'book.create': os.environ.get('THROTTLE_BOOK_CREATE', '120/min'),
+    'book.upload_image': os.environ.get('THROTTLE_BOOK_UPLOAD_IMAGE', '20/min'),
+}
+
+# Requests of one user running at once, keyed like THROTTLE_RATES; 0
+# lifts the cap. Rejected requests are told to retry after
+# CONCURRENCY_RETRY_AFTER seconds.
+
+CONCURRENCY_LIMITS = {
+    'book': int(os.environ.get('CONCURRENCY_BOOK', 8)),
+    'book.list': int(os.environ.get('CONCURRENCY_BOOK_LIST', 2)),
+    'book.upload_image': int(os.environ.get('CONCURRENCY_BOOK_UPLOAD_IMAGE', 1)),
+}
+CONCURRENCY_RETRY_AFTER = int(os.environ.get('CONCURRENCY_RETRY_AFTER', 1))
+
+# Longest a single SQL statement of a view may run, in milliseconds,
+# keyed like THROTTLE_RATES; 0 lifts the limit. Slower statements are
+# cancelled and the request gets a 503.
+
+STATEMENT_TIMEOUTS = {
+    'book': int(os.environ.get('STATEMENT_TIMEOUT_BOOK', 10000)),
+    'book.list': int(os.environ.get('STATEMENT_TIMEOUT_BOOK_LIST', 5000)),
+    'tag': int(os.environ.get('STATEMENT_TIMEOUT_TAG', 3000)),
+    'review': int(os.environ.get('STATEMENT_TIMEOUT_REVIEW', 3000)),
+}
+
+# Throttle state shared by the workers of one host.
+
+THROTTLE_DIR = os.environ.get(
+    'THROTTLE_DIR', os.path.join(tempfile.gettempdir(), 'app-throttle'),
+)
+
+# Identical concurrent GETs of a user share one computation, see
+# core.coalescing; across the workers of a host through lock files in
+# COALESCE_DIR when COALESCE_ACROSS_WORKERS is set, worth it for
+# single-request workers (uwsgi) with bursts of identical reads.
+
+COALESCE_READS = bool(int(os.environ.get('COALESCE_READS', 1)))
+COALESCE_ACROSS_WORKERS = bool(int(os.environ.get('COALESCE_ACROSS_WORKERS', 0)))
+COALESCE_WAIT_SECONDS = float(os.environ.get('COALESCE_WAIT_SECONDS', 5))
+COALESCE_DIR = os.environ.get(
+    'COALESCE_DIR', os.path.join(tempfile.gettempdir(), 'app-coalesce'),
+)
+
+# /readyz results are shared by the workers for this many seconds.
+
+READYZ_CACHE_SECONDS = float(os.environ.get('READYZ_CACHE_SECONDS', 2))
+
+# Profiles requested by staff with X-Profile: 1 are kept this long.
+
+PROFILE_TTL_SECONDS = int(os.environ.get('PROFILE_TTL_SECONDS', 3600))
+
+# Page sizes of core.pagination, which only pages lists asked for
+# page_size or a cursor.
+
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 50))
+LIST_MAX_PAGE_SIZE = int(os.environ.get('LIST_MAX_PAGE_SIZE', 500))
+
+# Serve the read actions of viewsets using core.asyncviews as coroutines.
+# app/asgi.py enables it; under uwsgi the views stay sync.
+
+ASYNC_VIEWS = bool(int(os.environ.get('ASYNC_VIEWS', 0)))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.middleware': {'handlers': ['console'], 'level': 'INFO'},
+        'core.querywatch': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
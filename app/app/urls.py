@@ -1,13 +1,25 @@
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from drf_spectacular.views import SpectacularSwaggerView
 from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core import views as core_views
+
 urlpatterns = [
 	path('admin/', admin.site.urls),
-	path('api/schema/', SpectacularAPIView.as_view(), name='api_schema'),
+	path('metrics', core_views.metrics, name='metrics'),
+	path('api/schema/', core_views.CachedSchemaView.as_view(), name='api_schema'),
 	path('api/docs/', SpectacularSwaggerView.as_view(url_name='api_schema'), name='api_docs', ),
+	path(
+		'api/debug/profiles/<str:profile_id>/',
+		core_views.ProfileView.as_view(), name='debug_profile',
+	),
+	path(
+		'api/debug/memory/',
+		core_views.MemorySnapshotView.as_view(), name='debug_memory',
+	),
+	path('api/batch/', core_views.BatchView.as_view(), name='batch'),
 	path('api/user/', include('user.urls')),
 	path('api/book/', include('book.urls')),
 ]
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+# Servers loading the app before forking workers set WARM_BOOT=1.
+if os.environ.get('WARM_BOOT') == '1':
+    from core import warmup
+
+    warmup.warm()
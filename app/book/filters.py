@@ -0,0 +1,205 @@
+"""
+Filters and facet counts for the book list.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from core.models import Book, Tag
+
+FACETS = ('category', 'language', 'tags')
+# Sort keys of the book list, each backed by a (user, key, id) index.
+ORDERINGS = ('id', 'title', 'author', 'number_of_pages', 'cost')
+DEFAULT_ORDERING = '-id'
+
+# Counted per grouping set in one pass over the filtered books. Each book
+# is unnested into a row without a tag, which category and language count,
+# followed by a row per tag id. Tag names are joined to the counted ids;
+# hashing names for every book row costs more than the unnest itself.
+FACETS_SQL = """
+    SELECT {groupings}, {columns}, count(*) FILTER (WHERE {untagged}), count(*)
+    FROM ({books}) AS book
+    GROUP BY GROUPING SETS ({sets})
+"""
+TAGS_SQL = """
+    SELECT facet.*, tag.name
+    FROM ({facets}) AS facet
+    LEFT JOIN {tag_table} AS tag ON tag.id = facet.tag_id
+"""
+COLUMNS = {
+    'category': 'category',
+    'language': 'language',
+    'tags': 'tag_id',
+}
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class BookFilterBackend(BaseFilterBackend):
+    """Filter books by category, language, page range and cost range."""
+
+    def _number(self, request, name, convert):
+        """Return a numeric query parameter, or None."""
+        value = request.query_params.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            number = convert(value)
+        except (ValueError, InvalidOperation):
+            number = None
+        if number is None or (
+            isinstance(number, Decimal) and not number.is_finite()
+        ):
+            raise ValidationError({name: 'A valid number is required.'})
+        return number
+
+    def filter_queryset(self, request, queryset, view):
+        categories = _split(request.query_params.get('category', ''))
+        if categories:
+            queryset = queryset.filter(category__in=categories)
+        languages = _split(request.query_params.get('language', ''))
+        if languages:
+            queryset = queryset.filter(language__in=languages)
+        ranges = [
+            ('pages_min', 'number_of_pages__gte', int),
+            ('pages_max', 'number_of_pages__lte', int),
+            ('cost_min', 'cost__gte', Decimal),
+            ('cost_max', 'cost__lte', Decimal),
+        ]
+        for name, lookup, convert in ranges:
+            value = self._number(request, name, convert)
+            if value is not None:
+                queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [
+            ('category', 'string', 'Comma separated list of categories.'),
+            ('language', 'string', 'Comma separated list of languages.'),
+            ('pages_min', 'integer', 'Fewest pages.'),
+            ('pages_max', 'integer', 'Most pages.'),
+            ('cost_min', 'number', 'Lowest cost.'),
+            ('cost_max', 'number', 'Highest cost.'),
+        ]
+        return [
+            {
+                'name': name,
+                'required': False,
+                'in': 'query',
+                'description': description,
+                'schema': {'type': schema_type},
+            }
+            for name, schema_type, description in parameters
+        ]
+
+
+class BookOrderingFilter(BaseFilterBackend):
+    """Sort books by one whitelisted key, ties broken by id.
+
+    Both keys run in the same direction so that the ordering matches a
+    forward or backward scan of the key's index, and keyset pagination can
+    seek past a row with a single row comparison.
+    """
+
+    def get_ordering(self, request):
+        """Return the order_by() fields of ``?ordering=``."""
+        value = request.query_params.get('ordering') or DEFAULT_ORDERING
+        key = value[1:] if value.startswith('-') else value
+        if key not in ORDERINGS:
+            raise ValidationError({
+                'ordering': f'Choose from: {", ".join(ORDERINGS)}, '
+                            f'prefixed with - to sort descending.',
+            })
+        prefix = '-' if value.startswith('-') else ''
+        if key == 'id':
+            return [f'{prefix}{key}']
+        return [f'{prefix}{key}', f'{prefix}id']
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request)
+        names, deferred = queryset.query.deferred_loading
+        if names and not deferred:
+            # Keep the sort keys loaded under ?fields=, pagination reads
+            # them from the last row of a page.
+            queryset = queryset.only(
+                *names, *(field.lstrip('-') for field in ordering),
+            )
+        return queryset.order_by(*ordering)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': 'ordering',
+            'required': False,
+            'in': 'query',
+            'description': (
+                'Sort key, prefixed with - to sort descending. '
+                f'Default {DEFAULT_ORDERING}.'
+            ),
+            'schema': {
+                'type': 'string',
+                'enum': [
+                    f'{prefix}{key}'
+                    for key in ORDERINGS for prefix in ('', '-')
+                ],
+            },
+        }]
+
+
+def facet_counts(queryset, facets):
+    """Return {facet: [{value or id/name, count}]} of the ``queryset``."""
+    queryset = queryset.order_by().values('category', 'language')
+    if 'tags' in facets:
+        queryset = queryset.annotate(tag_id=RawSQL(
+            'unnest(array_prepend(NULL::bigint, '
+            f'{Book._meta.db_table}.tag_ids))',
+            [],
+        ))
+    books, params = queryset.query.sql_with_params()
+    sql = FACETS_SQL.format(
+        groupings=', '.join(f'GROUPING({COLUMNS[facet]})' for facet in facets),
+        columns=', '.join(COLUMNS[facet] for facet in facets),
+        untagged='tag_id IS NULL' if 'tags' in facets else 'true',
+        books=books,
+        sets=', '.join(f'({COLUMNS[facet]})' for facet in facets),
+    )
+    if 'tags' in facets:
+        sql = TAGS_SQL.format(facets=sql, tag_table=Tag._meta.db_table)
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    result = {facet: [] for facet in facets}
+    for row in rows:
+        groupings, values = row[:len(facets)], row[len(facets):]
+        # GROUPING() is 0 only for the column of the row's own set.
+        position = groupings.index(0)
+        facet, value = facets[position], values[position]
+        books_count, tag_count = values[len(facets):len(facets) + 2]
+        if facet != 'tags':
+            result[facet].append({'value': value, 'count': books_count})
+        elif value is not None:
+            result['tags'].append({
+                'id': value, 'name': values[-1], 'count': tag_count,
+            })
+    for facet, counts in result.items():
+        label = 'name' if facet == 'tags' else 'value'
+        counts.sort(key=lambda item: (-item['count'], item[label]))
+    return result
+
+
+def parse_facets(value):
+    """Return the requested facets in FACETS order, rejecting unknown ones."""
+    requested = set(_split(value))
+    unknown = requested - set(FACETS)
+    if unknown:
+        raise ValidationError({
+            'facets': f'Unknown facets: {", ".join(sorted(unknown))}. '
+                      f'Choose from: {", ".join(FACETS)}.',
+        })
+    return [facet for facet in FACETS if facet in requested]
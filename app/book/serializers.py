@@ -2,12 +2,15 @@
 Serializers for book APIs.
 """
 
+from django.conf import settings
 from rest_framework import serializers
 
+from core.fieldsets import FieldsetSerializerMixin
+from core.instrumentation import TimedSerializerMixin
 from core.models import Book, Tag, Review
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for reviews"""
 
     class Meta:
@@ -16,7 +19,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for tags"""
 
     class Meta:
@@ -25,9 +28,20 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookTagsSerializer(serializers.ListSerializer):
+    """Render book tags from Book.tag_ids/tag_names, not the M2M table."""
+
+    def get_attribute(self, instance):
+        return [
+            Tag(id=tag_id, name=name)
+            for tag_id, name in zip(instance.tag_ids, instance.tag_names)
+        ]
+
+
+class BookSerializer(FieldsetSerializerMixin, TimedSerializerMixin,
+                     serializers.ModelSerializer):
     """Serializer for books"""
-    tags = TagSerializer(many=True, required=False)
+    tags = BookTagsSerializer(child=TagSerializer(), required=False)
     reviews = ReviewSerializer(many=True, required=False)
 
     class Meta:
@@ -93,11 +107,51 @@ class BookDetailSerializer(BookSerializer):
         fields = BookSerializer.Meta.fields + ['description']
 
 
-class BookImageSerializer(serializers.ModelSerializer):
+class BookBatchSerializer(serializers.Serializer):
+    """IDs of books to fetch in one request."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+    )
+
+    def validate_ids(self, ids):
+        """Drop repeated IDs and enforce BOOK_BATCH_MAX."""
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > settings.BOOK_BATCH_MAX:
+            raise serializers.ValidationError(
+                'Ensure this field has no more than '
+                f'{settings.BOOK_BATCH_MAX} elements.'
+            )
+        return ids
+
+
+class BookBatchResultSerializer(serializers.Serializer):
+    """Books of a batch request in request order, and IDs not found."""
+    books = BookDetailSerializer(many=True)
+    missing = serializers.ListField(child=serializers.IntegerField())
+
+
+class BookImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for uploading images to books."""
 
     class Meta:
         model = Book
         fields = ['id', 'image']
         read_only_fields = ['id']
-        extra_kwargs = {'image': {'required': 'True'}}
\ No newline at end of file
+        extra_kwargs = {'image': {'required': 'True'}}
+
+
+class SyncDeletedSerializer(serializers.Serializer):
+    """IDs deleted since the sync cursor."""
+    books = serializers.ListField(child=serializers.IntegerField())
+    tags = serializers.ListField(child=serializers.IntegerField())
+    reviews = serializers.ListField(child=serializers.IntegerField())
+
+
+class SyncSerializer(serializers.Serializer):
+    """Changes of a library since a sync cursor."""
+    cursor = serializers.IntegerField()
+    has_more = serializers.BooleanField()
+    books = BookDetailSerializer(many=True)
+    tags = TagSerializer(many=True)
+    reviews = ReviewSerializer(many=True)
+    deleted = SyncDeletedSerializer()
@@ -1,13 +1,18 @@
 """ Test for books APIs."""
 
+import base64
+import json
 import tempfile
 import os
 
 from PIL import Image
 from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -18,6 +23,7 @@ from core.models import Book, Tag, Review
 from book.serializers import BookSerializer, BookDetailSerializer
 
 BOOKS_URL = reverse('book:book-list')
+BATCH_URL = reverse('book:book-batch')
 
 
 def detail_url(book_id):
@@ -116,6 +122,19 @@ class PrivateBookAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_list_within_query_budget(self):
+        """Test listing books with reviews does not query per book."""
+        for _ in range(6):
+            book = create_book(user=self.user)
+            book.reviews.add(
+                Review.objects.create(user=self.user, name='text'),
+            )
+
+        res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 6)
+
     def test_get_book_detail(self):
         """Test get book detail."""
         book = create_book(user=self.user)
@@ -419,6 +438,32 @@ class PrivateBookAPITests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_filter_by_tags_match_all(self):
+        """Filter books having all of the given tags Test"""
+        book1 = create_book(user=self.user, title='anotherbook7')
+        book2 = create_book(user=self.user, title='anotherbook8')
+        tag1 = Tag.objects.create(user=self.user, name='funny')
+        tag2 = Tag.objects.create(user=self.user, name='sad')
+        book1.tags.add(tag1, tag2)
+        book2.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        res = self.client.get(BOOKS_URL, params)
+
+        self.assertIn(BookSerializer(book1).data, res.data)
+        self.assertNotIn(BookSerializer(book2).data, res.data)
+
+    def test_list_renders_tags_without_join(self):
+        """Test book list reads tag names from the denormalized arrays."""
+        book = create_book(user=self.user)
+        book.tags.add(Tag.objects.create(user=self.user, name='Taleb'))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Taleb')
+        self.assertFalse(any('core_book_tags' in q['sql'] for q in queries))
+
     def test_filter_by_reviews(self):
         """Filter books by reviews Test"""
         book1 = create_book(user=self.user, title='anotherbook4')
@@ -440,6 +485,238 @@ class PrivateBookAPITests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_batch_retrieve(self):
+        """Test books are fetched in request order with missing IDs listed."""
+        book1 = create_book(user=self.user, title='first')
+        book2 = create_book(user=self.user, title='second')
+        other = create_book(
+            user=create_user(email='other@example.com', password='test123'),
+        )
+
+        ids = [book2.id, 999999, other.id, book1.id, book2.id]
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BATCH_URL, {'ids': ','.join(map(str, ids))})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['books'], [
+            BookDetailSerializer(book2).data, BookDetailSerializer(book1).data,
+        ])
+        self.assertEqual(res.data['missing'], [999999, other.id])
+        self.assertEqual(sum('core_book' in q['sql'] for q in queries), 2)
+
+    def test_batch_retrieve_post(self):
+        """Test the POST variant takes IDs in the body."""
+        book = create_book(user=self.user)
+
+        res = self.client.post(BATCH_URL, {'ids': [book.id]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['books'][0]['id'], book.id)
+
+    @override_settings(BOOK_BATCH_MAX=2)
+    def test_batch_retrieve_limits(self):
+        """Test batches over the cap and malformed IDs are rejected."""
+        res = self.client.post(BATCH_URL, {'ids': [1, 2, 3]}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(BATCH_URL, {'ids': '1,x'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(BATCH_URL)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sparse_fields(self):
+        """Test ?fields= limits the output and the selected columns."""
+        book = create_book(user=self.user, title='Sparse', author='Lem')
+        book.reviews.add(Review.objects.create(user=self.user, name='Great'))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BOOKS_URL, {'fields': 'id,title,author'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data, [{'id': book.id, 'title': 'Sparse', 'author': 'Lem'}],
+        )
+        sql = [q['sql'] for q in queries if 'FROM "core_book"' in q['sql']]
+        self.assertEqual(len(sql), 1)
+        self.assertNotIn('"core_book"."description"', sql[0])
+        self.assertNotIn('"core_book"."tag_names"', sql[0])
+        self.assertFalse(any('core_review' in q['sql'] for q in queries))
+
+    def test_expand_relations(self):
+        """Test ?expand= picks the nested relations to include."""
+        book = create_book(user=self.user)
+        book.tags.add(Tag.objects.create(user=self.user, name='Funny'))
+        book.reviews.add(Review.objects.create(user=self.user, name='Great'))
+
+        res = self.client.get(detail_url(book.id), {'expand': 'tags'})
+
+        self.assertEqual(res.data['tags'][0]['name'], 'Funny')
+        self.assertNotIn('reviews', res.data)
+        self.assertEqual(res.data['description'], book.description)
+
+        res = self.client.get(BOOKS_URL, {'fields': 'id', 'expand': 'reviews'})
+
+        self.assertEqual(set(res.data[0]), {'id', 'reviews'})
+        self.assertEqual(res.data[0]['reviews'][0]['name'], 'Great')
+
+        res = self.client.get(BATCH_URL, {'ids': book.id, 'fields': 'title'})
+
+        self.assertEqual(res.data['books'], [{'title': book.title}])
+
+    def test_sparse_fields_invalid(self):
+        """Test unknown fields and relations are rejected."""
+        res = self.client.get(BOOKS_URL, {'fields': 'id,secret'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
+        res = self.client.get(BOOKS_URL, {'expand': 'title'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', res.data)
+
+    def test_filter_by_attributes(self):
+        """Test filtering by category, language, pages and cost ranges."""
+        essay = {'user': self.user, 'category': 'Essay'}
+        match = create_book(**essay, number_of_pages=200)
+        create_book(user=self.user, category='Novel', number_of_pages=200)
+        create_book(**essay, number_of_pages=50)
+        create_book(**essay, language='Polski', number_of_pages=200)
+        create_book(**essay, number_of_pages=200, cost=Decimal('40'))
+
+        res = self.client.get(BOOKS_URL, {
+            'category': 'Essay,Drama', 'language': 'Hindi',
+            'pages_min': 100, 'pages_max': 300,
+            'cost_min': '1', 'cost_max': '10.50',
+        })
+
+        self.assertEqual([book['id'] for book in res.data], [match.id])
+
+        res = self.client.get(BOOKS_URL, {'pages_min': 'many'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_facet_counts(self):
+        """Test facet counts of the filtered books come from one query."""
+        tag1 = Tag.objects.create(user=self.user, name='Funny')
+        tag2 = Tag.objects.create(user=self.user, name='Long')
+        book1 = create_book(user=self.user, category='Essay')
+        book1.tags.add(tag1, tag2)
+        book2 = create_book(
+            user=self.user, category='Essay', language='Polski',
+        )
+        book2.tags.add(tag1)
+        create_book(user=self.user, category='Novel')
+        create_book(user=self.user, category='Drama', number_of_pages=10)
+        other = create_user(email='other@example.com', password='test123')
+        create_book(user=other)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BOOKS_URL, {
+                'pages_min': 100, 'facets': 'tags,category,language',
+            })
+
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertEqual(res.data['facets'], {
+            'category': [
+                {'value': 'Essay', 'count': 2},
+                {'value': 'Novel', 'count': 1},
+            ],
+            'language': [
+                {'value': 'Hindi', 'count': 2},
+                {'value': 'Polski', 'count': 1},
+            ],
+            'tags': [
+                {'id': tag1.id, 'name': 'Funny', 'count': 2},
+                {'id': tag2.id, 'name': 'Long', 'count': 1},
+            ],
+        })
+        self.assertEqual(sum('GROUPING SETS' in q['sql'] for q in queries), 1)
+
+        res = self.client.get(
+            BOOKS_URL, {'facets': 'category', 'category': 'Novel'},
+        )
+        self.assertEqual(
+            res.data['facets'], {'category': [{'value': 'Novel', 'count': 1}]},
+        )
+
+        res = self.client.get(BOOKS_URL, {'facets': 'author'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ordering(self):
+        """Test sorting by a whitelisted key with ties broken by id."""
+        book1 = create_book(user=self.user, title='B')
+        book2 = create_book(user=self.user, title='A')
+        book3 = create_book(user=self.user, title='B')
+
+        res = self.client.get(BOOKS_URL, {'ordering': 'title'})
+        ids = [book['id'] for book in res.data]
+        self.assertEqual(ids, [book2.id, book1.id, book3.id])
+
+        res = self.client.get(BOOKS_URL, {'ordering': '-title'})
+        ids = [book['id'] for book in res.data]
+        self.assertEqual(ids, [book3.id, book1.id, book2.id])
+
+        res = self.client.get(BOOKS_URL, {'ordering': 'description'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_keyset_pages(self):
+        """Test walking pages forwards and back over ties and NULLs."""
+        costs = ['3.00', None, '1.00', '3.00', None, '2.00', '3.00']
+        for cost in costs:
+            create_book(user=self.user, cost=Decimal(cost) if cost else None)
+        for ordering, tie_breaker in [('cost', 'id'), ('-cost', '-id')]:
+            books = Book.objects.order_by(ordering, tie_breaker)
+            expected = list(books.values_list('id', flat=True))
+            pages, url = [], f'{BOOKS_URL}?ordering={ordering}&page_size=2'
+            with CaptureQueriesContext(connection) as queries:
+                while url:
+                    res = self.client.get(url)
+                    self.assertEqual(res.status_code, status.HTTP_200_OK)
+                    pages.append(res.data)
+                    url = res.data['next']
+            ids = [book['id'] for page in pages for book in page['results']]
+            self.assertEqual(ids, expected)
+            self.assertEqual(len(pages), 4)
+            self.assertIsNone(pages[0]['previous'])
+            self.assertNotIn('OFFSET', ' '.join(q['sql'] for q in queries))
+
+            res = self.client.get(pages[-1]['previous'])
+            self.assertEqual(res.data['results'], pages[-2]['results'])
+            res = self.client.get(res.data['previous'])
+            self.assertEqual(res.data['results'], pages[-3]['results'])
+
+    def test_keyset_invalid(self):
+        """Test bad cursors and page sizes are rejected."""
+        create_book(user=self.user)
+        create_book(user=self.user)
+        res = self.client.get(BOOKS_URL, {'page_size': 1, 'ordering': 'title'})
+        url = res.data['next'].replace('ordering=title', 'ordering=author')
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(BOOKS_URL, {'cursor': 'nonsense'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(BOOKS_URL, {'page_size': 0})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_keyset_tampered(self):
+        """Test cursors with values of the wrong type are rejected."""
+        create_book(user=self.user, cost=Decimal('1.00'))
+        create_book(user=self.user, cost=Decimal('2.00'))
+        res = self.client.get(BOOKS_URL, {'page_size': 1, 'ordering': 'cost'})
+        query = parse_qs(urlparse(res.data['next']).query)
+        payload = json.loads(base64.urlsafe_b64decode(query['cursor'][0]))
+
+        for values in (['abc', 1], [{}, 1], ['1.00', None], ['1.00', 'zz'],
+                       '12'):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(dict(payload, v=values)).encode(),
+            ).decode()
+            res = self.client.get(
+                BOOKS_URL, {'ordering': 'cost', 'cursor': cursor},
+            )
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(res.data, {'cursor': 'Invalid cursor.'})
+
 
 class ImageUploadTests(TestCase):
     """Tests for the image upload API."""
@@ -0,0 +1,213 @@
+"""
+Tests for the delta sync API.
+"""
+
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.db.models.sql import DeleteQuery
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Book, Change, Review, SyncState, Tag
+
+SYNC_URL = reverse('book:sync')
+BOOKS_URL = reverse('book:book-list')
+
+
+def book_url(book_id):
+    """Create and return a book detail url."""
+    return reverse('book:book-detail', args=[book_id])
+
+
+def create_user(email='user@example.com', password='test123'):
+    """Create a return a new user."""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+class PublicSyncApiTests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test authentication is required for sync."""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateSyncApiTests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _cursor(self):
+        """Return the current cursor."""
+        return self.client.get(SYNC_URL).data['cursor']
+
+    def _create_book(self, **params):
+        """Create a book through the API and return its id."""
+        payload = {
+            'title': 'Sample title',
+            'category': 'Drama',
+            'number_of_pages': 121,
+            'language': 'Polski',
+        }
+        payload.update(params)
+        res = self.client.post(BOOKS_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def test_changes_since_cursor(self):
+        """Test only objects changed after the cursor are returned."""
+        self._create_book(title='Old')
+        cursor = self._cursor()
+        book_id = self._create_book(tags=[{'name': 'Funny'}])
+
+        res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['id'] for book in res.data['books']], [book_id])
+        self.assertEqual(res.data['books'][0]['tags'][0]['name'], 'Funny')
+        self.assertEqual([tag['name'] for tag in res.data['tags']], ['Funny'])
+        self.assertFalse(res.data['has_more'])
+        self.assertGreater(res.data['cursor'], cursor)
+
+        res = self.client.get(SYNC_URL, {'since': res.data['cursor']})
+
+        self.assertEqual(res.data['books'], [])
+
+    def test_book_logged_once_per_request(self):
+        """Test a book created with tags is logged in one entry."""
+        cursor = self._cursor()
+        book_id = self._create_book(tags=[{'name': 'A'}, {'name': 'B'}])
+
+        entries = Change.objects.filter(
+            user=self.user, seq__gt=cursor, kind=Change.BOOK,
+        )
+
+        self.assertEqual(
+            list(entries.values_list('object_id', flat=True)), [book_id],
+        )
+
+    def test_tombstones(self):
+        """Test deleted objects are reported as tombstones."""
+        book_id = self._create_book()
+        tag = Tag.objects.create(user=self.user, name='Funny')
+        cursor = self._cursor()
+
+        tag_id = tag.id
+        self.client.delete(book_url(book_id))
+        tag.delete()
+        res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertEqual(res.data['books'], [])
+        self.assertEqual(res.data['deleted'], {
+            'books': [book_id], 'tags': [tag_id], 'reviews': [],
+        })
+
+    def test_other_users_changes_hidden(self):
+        """Test the log is per user."""
+        cursor = self._cursor()
+        other = create_user('other@example.com')
+        Review.objects.create(user=other, name='Not mine')
+
+        res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertEqual(res.data['reviews'], [])
+        self.assertEqual(res.data['cursor'], cursor)
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_paging(self):
+        """Test large change sets are returned in pages."""
+        cursor = self._cursor()
+        for index in range(3):
+            Tag.objects.create(user=self.user, name=f'Tag {index}')
+
+        first = self.client.get(SYNC_URL, {'since': cursor}).data
+        second = self.client.get(SYNC_URL, {'since': first['cursor']}).data
+
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        self.assertEqual(
+            [tag['name'] for tag in first['tags'] + second['tags']],
+            ['Tag 0', 'Tag 1', 'Tag 2'],
+        )
+
+    def test_invalid_cursor(self):
+        """Test unknown and malformed cursors are rejected."""
+        res = self.client.get(SYNC_URL, {'since': self._cursor() + 10})
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+        res = self.client.get(SYNC_URL, {'since': 'abc'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_compaction(self):
+        """Test compaction keeps the latest entries and expires tombstones."""
+        cursor = self._cursor()
+        book_id = self._create_book()
+        self.client.patch(book_url(book_id), {'title': 'New'}, format='json')
+        tag = Tag.objects.create(user=self.user, name='Funny')
+        tag.delete()
+        Change.objects.filter(deleted=True).update(
+            created_at=timezone.now() - timedelta(days=60),
+        )
+
+        call_command('compact_changelog', days=30, stdout=StringIO())
+
+        self.assertEqual(
+            list(Change.objects.filter(user=self.user).values_list(
+                'kind', 'object_id',
+            )),
+            [(Change.BOOK, book_id)],
+        )
+        res = self.client.get(SYNC_URL, {'since': cursor})
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+        floor = SyncState.objects.get(user=self.user).floor_seq
+        res = self.client.get(SYNC_URL, {'since': floor})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deleting_user_allowed(self):
+        """Test deleting a user does not log its cascaded deletes."""
+        self._create_book()
+
+        self.user.delete()
+
+        self.assertFalse(Change.objects.exists())
+        self.assertFalse(Book.objects.exists())
+
+    def test_failed_user_delete(self):
+        """Test changes are logged again after a user delete failed."""
+        with self.assertRaises(DatabaseError), mock.patch.object(
+            DeleteQuery, 'delete_batch', side_effect=DatabaseError,
+        ), transaction.atomic():
+            self.user.delete()
+
+        book_id = self._create_book()
+
+        self.assertTrue(
+            Change.objects.filter(user=self.user, object_id=book_id).exists()
+        )
+
+    def test_seq_rolled_back_with_entries(self):
+        """Test a failed log write outside a transaction keeps its seqs."""
+        self._create_book()
+        last_seq = SyncState.objects.get(user=self.user).last_seq
+
+        with self.assertRaises(DatabaseError), mock.patch.object(
+            Change.objects, 'bulk_create', side_effect=DatabaseError,
+        ):
+            Tag.objects.create(user=self.user, name='Funny')
+
+        state = SyncState.objects.get(user=self.user)
+        self.assertEqual(state.last_seq, last_seq)
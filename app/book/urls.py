@@ -16,6 +16,7 @@ router.register('reviews', views.ReviewViewSet)
 app_name = 'book'
 
 urlpatterns = [
+	path('sync/', views.SyncView.as_view(), name='sync'),
 	path('', include(router.urls)),
 
 ]
@@ -2,22 +2,76 @@
 Views for books APIs.
 """
 
-from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter, OpenApiTypes
+from collections import defaultdict
+
+from drf_spectacular.utils import (
+    extend_schema_view, extend_schema, OpenApiParameter, OpenApiTypes,
+)
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
 from rest_framework import viewsets, mixins, status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from core.models import Book, Tag, Review
+from core import changelog, instrumentation, metrics
+from core.asyncviews import AsyncReadMixin
+from core.coalescing import CoalescingMixin
+from core.fieldsets import FieldsetViewMixin
+from core.idempotency import IdempotencyMixin
+from core.pagination import KeysetPagination
+from core.throttling import ConcurrencyLimitMixin, TokenBucketThrottle
+from core.timeouts import StatementTimeoutMixin
+from core.models import Book, Change, SyncState, Tag, Review
 from book import serializers
+from book.filters import (
+    BookFilterBackend, BookOrderingFilter, facet_counts, parse_facets,
+)
 
 """class BaseBookAttrViewSet()"""
 
+FIELDSET_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description=(
+            'Comma separated list of fields to return, e.g. id,title,author. '
+            'Only the columns behind them are loaded.'
+        ),
+    ),
+    OpenApiParameter(
+        'expand',
+        OpenApiTypes.STR,
+        description=(
+            'Comma separated list of relations to include: tags, reviews. '
+            'With fields or expand given, relations not listed are left out '
+            'and not fetched.'
+        ),
+    ),
+]
+
+
+IDEMPOTENCY_PARAMETERS = [
+    OpenApiParameter(
+        'Idempotency-Key',
+        OpenApiTypes.STR,
+        location=OpenApiParameter.HEADER,
+        description=(
+            'Client generated key, e.g. a UUID. Retries with the same key get '
+            'the first response back, marked with Idempotent-Replayed, '
+            'instead of repeating the change.'
+        ),
+    ),
+]
+
 
 @extend_schema_view(
     list=extend_schema(
-        parameters=[
+        parameters=FIELDSET_PARAMETERS + [
             OpenApiParameter(
                 'tags',
                 OpenApiTypes.STR,
@@ -28,15 +82,48 @@ from book import serializers
                 OpenApiTypes.STR,
                 description='Comma separated list of reviews IDs to filter',
             ),
+            OpenApiParameter(
+                'match',
+                OpenApiTypes.STR, enum=['any', 'all'],
+                description=(
+                    'Match books with any (default) or all of the given IDs.'
+                ),
+            ),
+            OpenApiParameter(
+                'facets',
+                OpenApiTypes.STR,
+                description=(
+                    'Comma separated list of facets to count over the '
+                    'filtered books: category, language, tags. The response '
+                    'then becomes '
+                    '{"results": [...], "facets": {...}}.'
+                ),
+            ),
         ]
-    )
+    ),
+    retrieve=extend_schema(parameters=FIELDSET_PARAMETERS),
+    create=extend_schema(parameters=IDEMPOTENCY_PARAMETERS),
+    update=extend_schema(parameters=IDEMPOTENCY_PARAMETERS),
+    partial_update=extend_schema(parameters=IDEMPOTENCY_PARAMETERS),
 )
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(AsyncReadMixin, FieldsetViewMixin, IdempotencyMixin,
+                  ConcurrencyLimitMixin, StatementTimeoutMixin,
+                  CoalescingMixin, viewsets.ModelViewSet):
     """View for manage book APIs"""
     serializer_class = serializers.BookDetailSerializer
     queryset = Book.objects.all()
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'book'
+    filter_backends = [BookFilterBackend, BookOrderingFilter]
+    pagination_class = KeysetPagination
+    # Token lookup, books and prefetched reviews, plus facet counts.
+    query_budgets = {'list': 4, 'retrieve': 3, 'batch': 3}
+    fieldset_actions = ('list', 'retrieve', 'batch')
+    expandable_fields = {'tags': None, 'reviews': 'reviews'}
+    # Tags are rendered from the denormalized arrays.
+    field_columns = {'tags': ['tag_ids', 'tag_names'], 'reviews': []}
 
     def _params_to_ints(self, qs):
         """Convert a list of strings to integers."""
@@ -46,15 +133,44 @@ class BookViewSet(viewsets.ModelViewSet):
         """Retrieve books fot auth user."""
         tags = self.request.query_params.get('tags')
         reviews = self.request.query_params.get('reviews')
+        # Filter on the GIN-indexed arrays: @> for all, && for any.
+        match = self.request.query_params.get('match')
+        lookup = 'contains' if match == 'all' else 'overlap'
         queryset = self.queryset
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = queryset.filter(**{f'tag_ids__{lookup}': tag_ids})
         if reviews:
             review_ids = self._params_to_ints(reviews)
-            queryset = queryset.filter(reviews__id__in=review_ids)
+            queryset = queryset.filter(**{f'review_ids__{lookup}': review_ids})
 
-        return queryset.filter(user=self.request.user).order_by('-id').distinct()
+        return self.apply_fieldset(queryset.filter(
+            user=self.request.user,
+        ).prefetch_related('reviews'))
+
+    def add_facets(self, response):
+        """Wrap the list with facet counts when ?facets= asks for them."""
+        facets = self.request.query_params.get('facets')
+        if facets is None or response.status_code != status.HTTP_200_OK:
+            return response
+        counts = facet_counts(
+            self.filter_queryset(self.get_queryset()), parse_facets(facets),
+        )
+        if isinstance(response.data, dict):
+            # Paginated already; facets count the whole filtered list.
+            response.data['facets'] = counts
+        else:
+            response.data = {'results': response.data, 'facets': counts}
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """List books, with facet counts if requested."""
+        return self.add_facets(super().list(request, *args, **kwargs))
+
+    async def alist(self, request, *args, **kwargs):
+        """Async counterpart of ``list``."""
+        response = await super().alist(request, *args, **kwargs)
+        return await sync_to_async(self.add_facets)(response)
 
     def get_serializer_class(self):
         """Return the serializer class for request."""
@@ -68,7 +184,62 @@ class BookViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         """Create a new annotation of book."""
-        serializer.save(user=self.request.user)
+        with instrumentation.span('save'), transaction.atomic(), \
+                changelog.batch():
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        """Update a book."""
+        with instrumentation.span('save'), transaction.atomic(), \
+                changelog.batch():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        """Delete a book."""
+        with transaction.atomic(), changelog.batch():
+            instance.delete()
+
+    @extend_schema(
+        methods=['GET'],
+        parameters=FIELDSET_PARAMETERS + [
+            OpenApiParameter(
+                'ids',
+                OpenApiTypes.STR,
+                required=True,
+                description=(
+                    'Comma separated list of book IDs, in the order to '
+                    'return them.'
+                ),
+            ),
+        ],
+        responses=serializers.BookBatchResultSerializer,
+    )
+    @extend_schema(
+        methods=['POST'],
+        parameters=FIELDSET_PARAMETERS,
+        request=serializers.BookBatchSerializer,
+        responses=serializers.BookBatchResultSerializer,
+    )
+    @action(methods=['GET', 'POST'], detail=False, url_path='batch')
+    def batch(self, request):
+        """Retrieve several books by ID, POST takes long ID lists."""
+        if request.method == 'GET':
+            ids = request.query_params.get('ids', '')
+            data = {'ids': ids.split(',') if ids else []}
+        else:
+            data = request.data
+        params = serializers.BookBatchSerializer(data=data)
+        params.is_valid(raise_exception=True)
+        ids = params.validated_data['ids']
+
+        books = {
+            book.id: book for book in self.get_queryset().filter(id__in=ids)
+        }
+        result = serializers.BookBatchResultSerializer({
+            'books': [books[book_id] for book_id in ids if book_id in books],
+            'missing': [book_id for book_id in ids if book_id not in books],
+        }, context=self.get_serializer_context())
+        return Response(result.data)
 
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
@@ -77,11 +248,18 @@ class BookViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(book, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            with instrumentation.span('image'):
+                with metrics.IMAGES_IN_PROGRESS.track_inprogress():
+                    with transaction.atomic(), changelog.batch():
+                        serializer.save()
+            metrics.UPLOAD_BYTES.labels(
+                metrics.route_name(request)
+            ).inc(book.image.size)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
 @extend_schema_view(
     list=extend_schema(
         parameters=[
@@ -91,15 +269,22 @@ class BookViewSet(viewsets.ModelViewSet):
                 description='Filter by items assigned to books.',
             ),
         ]
-    )
+    ),
+    update=extend_schema(parameters=IDEMPOTENCY_PARAMETERS),
+    partial_update=extend_schema(parameters=IDEMPOTENCY_PARAMETERS),
 )
-class BaseBookAttrViewSet(mixins.UpdateModelMixin,
+class BaseBookAttrViewSet(AsyncReadMixin,
+                          IdempotencyMixin,
+                          StatementTimeoutMixin,
+                          CoalescingMixin,
+                          mixins.UpdateModelMixin,
                           mixins.DestroyModelMixin,
                           mixins.ListModelMixin,
                           viewsets.GenericViewSet):
     """Base viewsets for books atributes."""
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 2}
 
     def get_queryset(self):
         """Filter queryset to  auth user."""
@@ -112,14 +297,117 @@ class BaseBookAttrViewSet(mixins.UpdateModelMixin,
 
         return queryset.filter(user=self.request.user).order_by('-name').distinct()
 
+    def perform_update(self, serializer):
+        """Update the object and log the change in one transaction."""
+        with transaction.atomic(), changelog.batch():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        """Delete the object and log the change in one transaction."""
+        with transaction.atomic(), changelog.batch():
+            instance.delete()
+
 
 class TagViewSet(BaseBookAttrViewSet):
     """Manage tags in the DB"""
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
+    throttle_scope = 'tag'
 
 
 class ReviewViewSet(BaseBookAttrViewSet):
     """Manage reviews in the DB."""
     serializer_class = serializers.ReviewSerializer
     queryset = Review.objects.all()
+    throttle_scope = 'review'
+
+
+class CursorExpired(APIException):
+    """The cursor predates compacted tombstones or is unknown."""
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Sync cursor is no longer valid, fetch the library again.'
+    default_code = 'cursor_expired'
+
+
+class SyncView(APIView):
+    """Books, tags and reviews changed or deleted since a cursor."""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # Token, sync state, log, books with reviews, tags and reviews.
+    query_budgets = {'get': 7}
+
+    def _since(self):
+        """Return the since cursor as int, or None."""
+        since = self.request.query_params.get('since')
+        if since is None:
+            return None
+        try:
+            return int(since)
+        except ValueError:
+            raise ValidationError({'since': 'A valid integer is required.'})
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'since',
+                OpenApiTypes.INT,
+                description=(
+                    'Cursor returned by the previous sync. Without it only '
+                    'the current cursor is returned; fetch the library after '
+                    'taking it.'
+                ),
+            ),
+        ],
+        responses=serializers.SyncSerializer,
+    )
+    def get(self, request):
+        """Return the changes after ``since`` and the next cursor."""
+        since = self._since()
+        state = (
+            SyncState.objects.filter(user=request.user).first() or SyncState()
+        )
+        payload = {
+            'cursor': state.last_seq,
+            'has_more': False,
+            'books': [], 'tags': [], 'reviews': [],
+            'deleted': {'books': [], 'tags': [], 'reviews': []},
+        }
+        if since is not None:
+            if not state.floor_seq <= since <= state.last_seq:
+                raise CursorExpired()
+            self._add_changes(payload, since)
+        return Response(serializers.SyncSerializer(
+            payload, context={'request': request},
+        ).data)
+
+    def _add_changes(self, payload, since):
+        """Fill ``payload`` with the objects changed after ``since``."""
+        page_size = settings.SYNC_PAGE_SIZE
+        changes = list(
+            Change.objects.filter(user=self.request.user, seq__gt=since)
+            .order_by('seq')
+            .values_list('seq', 'kind', 'object_id', 'deleted')[:page_size + 1]
+        )
+        payload['has_more'] = len(changes) > page_size
+        changes = changes[:page_size]
+        payload['cursor'] = changes[-1][0] if changes else since
+
+        latest = {}
+        for _, kind, object_id, deleted in changes:
+            latest[kind, object_id] = deleted
+        changed = defaultdict(list)
+        for (kind, object_id), deleted in sorted(latest.items()):
+            if deleted:
+                payload['deleted'][f'{kind}s'].append(object_id)
+            else:
+                changed[kind].append(object_id)
+
+        querysets = {
+            Change.BOOK: Book.objects.prefetch_related('reviews'),
+            Change.TAG: Tag.objects.all(),
+            Change.REVIEW: Review.objects.all(),
+        }
+        for kind, object_ids in changed.items():
+            payload[f'{kind}s'] = querysets[kind].filter(
+                user=self.request.user, id__in=object_ids,
+            ).order_by('id')
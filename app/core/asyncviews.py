@@ -0,0 +1,92 @@
+"""
+Coroutine versions of the read actions of DRF viewsets for ASGI serving.
+
+With ``ASYNC_VIEWS`` enabled, ``as_view`` of a viewset using
+``AsyncReadMixin`` returns a coroutine view: the actions listed in
+``async_actions`` are dispatched without holding a thread while the
+request waits, and every other action falls back to the regular sync view.
+Django 4.0 has no async ORM, so the pieces that touch the database
+(authentication, permissions, querysets and serialization) run through
+``sync_to_async``. They stay thread sensitive, sharing the request's
+thread and database connection with the database work of the middleware,
+which is async capable (core.middleware) so the chain stays on the loop.
+"""
+
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.decorators import classonlymethod
+from rest_framework.response import Response
+
+
+class AsyncReadMixin:
+    """Serve ``list`` and ``retrieve`` as coroutines when enabled."""
+    async_actions = ('list', 'retrieve')
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        served = set(actions.values()) & set(cls.async_actions)
+        if not settings.ASYNC_VIEWS or not served:
+            return view
+        if 'get' in actions:
+            actions.setdefault('head', actions['get'])
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if actions.get(request.method.lower()) not in cls.async_actions:
+                return await sync_view(request, *args, **kwargs)
+            self = cls(**initkwargs)
+            self.action_map = actions
+            return await self.adispatch(request, *args, **kwargs)
+
+        update_wrapper(async_view, cls, updated=())
+        async_view.cls = cls
+        async_view.initkwargs = initkwargs
+        async_view.actions = actions
+        # csrf_exempt() would wrap the coroutine in a sync function.
+        async_view.csrf_exempt = True
+        return async_view
+
+    async def adispatch(self, request, *args, **kwargs):
+        """Async counterpart of ``APIView.dispatch`` for read actions."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, f'a{self.action}')
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs,
+        )
+        return self.response
+
+    def _serialize(self, instance, many=False):
+        """Return serialized data; evaluates querysets."""
+        return self.get_serializer(instance, many=many).data
+
+    async def alist(self, request, *args, **kwargs):
+        """Async counterpart of ``ListModelMixin.list``."""
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = await sync_to_async(self.paginate_queryset)(queryset)
+        if page is not None:
+            data = await sync_to_async(self._serialize)(page, many=True)
+            return self.get_paginated_response(data)
+
+        data = await sync_to_async(self._serialize)(queryset, many=True)
+        return Response(data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """Async counterpart of ``RetrieveModelMixin.retrieve``."""
+        instance = await sync_to_async(self.get_object)()
+        data = await sync_to_async(self._serialize)(instance)
+        return Response(data)
@@ -0,0 +1,199 @@
+"""
+Several API requests in one round trip.
+
+``POST /api/batch/`` takes a list of sub-requests (method, path and JSON
+body) and runs them in order, in-process, against the URLconf. The batch
+is authenticated once and its user is handed to every sub-request, which
+then runs its view's permissions, throttles and limits as usual; all of
+them share the thread, and so the database connection, of the batch.
+
+With ``atomic`` the sub-requests run in one transaction: the first one
+answering 400 or above rolls back all of them, and the rest are not run
+and answer 424. Otherwise each commits on its own. A statement timeout
+set by one sub-request's view (core.timeouts) would last until commit,
+so it is reset before the next one runs.
+
+Sub-requests go past the middleware of the batch, but are counted in
+http_requests_total under their own route.
+"""
+
+import asyncio
+import io
+import json
+import logging
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, transaction
+from django.urls import Resolver404, resolve
+from rest_framework import serializers, status
+from rest_framework.views import APIView
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+PATH_PREFIX = '/api/'
+BATCH_PATH = '/api/batch/'
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+# Headers of the batch that belong to it alone.
+_OWN_HEADERS = (
+    'CONTENT_LENGTH', 'CONTENT_TYPE', 'HTTP_IDEMPOTENCY_KEY',
+    'HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH', 'HTTP_X_PROFILE',
+)
+
+
+class SubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(METHODS)
+    path = serializers.CharField(max_length=2048)
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        path = urlsplit(value).path
+        if not path.startswith(PATH_PREFIX) or path == BATCH_PATH:
+            raise serializers.ValidationError(
+                f'Only paths under {PATH_PREFIX} other than '
+                f'{BATCH_PATH} can be batched.'
+            )
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True, allow_empty=False)
+    atomic = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f'At most {settings.BATCH_MAX_REQUESTS} requests per batch.'
+            )
+        return value
+
+
+class SubResponseSerializer(serializers.Serializer):
+    status = serializers.IntegerField()
+    headers = serializers.DictField(child=serializers.CharField())
+    body = serializers.JSONField(allow_null=True)
+
+
+NOT_RUN = {
+    'status': status.HTTP_424_FAILED_DEPENDENCY,
+    'headers': {},
+    'body': {'detail': 'Not run, an earlier request of the batch failed.'},
+}
+
+
+def _error(status_code, detail):
+    return {
+        'status': status_code, 'headers': {}, 'body': {'detail': detail},
+    }
+
+
+def _reset_statement_timeout():
+    """End a ``SET LOCAL statement_timeout`` of the sub-request before."""
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL statement_timeout = DEFAULT')
+
+
+def _sub_request(request, method, path, body):
+    """Return a WSGIRequest for a sub-request of ``request``."""
+    url = urlsplit(path)
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in request.META.items()
+        if key not in _OWN_HEADERS and not key.startswith('wsgi.')
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': io.BytesIO(content),
+        'wsgi.url_scheme': request.scheme,
+    })
+    sub = WSGIRequest(environ)
+    # DRF authenticates requests carrying these with the given user alone.
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    return sub
+
+
+def _body(response):
+    if hasattr(response, 'data'):
+        return response.data
+    if response.streaming:
+        return None
+    content = response.content.decode(
+        response.charset, errors='replace',
+    )
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(content or 'null')
+    return content or None
+
+
+def run(request, method, path, body=None):
+    """Run one sub-request of ``request``, return it as a dict."""
+    sub = _sub_request(request, method, path, body)
+    try:
+        match = resolve(sub.path_info)
+    except Resolver404:
+        return _error(status.HTTP_404_NOT_FOUND, 'Not found.')
+    if not issubclass(getattr(match.func, 'cls', object), APIView):
+        return _error(
+            status.HTTP_400_BAD_REQUEST, 'This path can not be batched.',
+        )
+    sub.resolver_match = match
+    view = match.func
+    if asyncio.iscoroutinefunction(view):
+        # Runs on the event loop of the batch, coming back to this
+        # thread for the database.
+        view = async_to_sync(view)
+    try:
+        response = view(sub, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception(
+            'Sub-request %s %s of a batch failed.', method, path,
+        )
+        response = None
+    if response is None:
+        result = _error(
+            status.HTTP_500_INTERNAL_SERVER_ERROR, 'A server error occurred.',
+        )
+    else:
+        result = {
+            'status': response.status_code,
+            'headers': {
+                key: value for key, value in response.items()
+                if key != 'Content-Type'
+            },
+            'body': _body(response),
+        }
+    route = metrics.route_name(sub)
+    metrics.REQUESTS.labels(route, method, result['status']).inc()
+    return result
+
+
+def execute(request, requests, atomic=False):
+    """Run validated sub-requests in order, return their responses."""
+    results = []
+    failed = False
+    with transaction.atomic() if atomic else nullcontext():
+        for item in requests:
+            if failed:
+                results.append(NOT_RUN)
+                continue
+            if results and atomic:
+                _reset_statement_timeout()
+            result = run(
+                request, item['method'], item['path'], item.get('body'),
+            )
+            results.append(result)
+            failed = atomic and result['status'] >= 400
+        if failed:
+            transaction.set_rollback(True)
+    return results
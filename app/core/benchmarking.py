@@ -0,0 +1,64 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+
+import json
+import math
+import statistics
+import subprocess
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(timings_ms):
+    """Return count, mean and p50/p95/p99 of durations in milliseconds."""
+    values = sorted(timings_ms)
+    return {
+        'count': len(values),
+        'mean_ms': round(statistics.mean(values), 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 0.50), 3),
+        'p95_ms': round(percentile(values, 0.95), 3),
+        'p99_ms': round(percentile(values, 0.99), 3),
+    }
+
+
+def git_revision():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Return per-scenario relative changes of p95 and throughput."""
+    changes = {}
+    for name, stats in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            'p95_change': _relative(stats['p95_ms'], before['p95_ms']),
+            'rps_change': _relative(stats['rps'], before['rps']),
+        }
+    return changes
+
+
+def _relative(new, old):
+    """Return the change from ``old`` to ``new`` as a fraction."""
+    return round((new - old) / old, 4) if old else None
+
+
+def load(path):
+    """Read a saved benchmark result."""
+    with open(path) as result_file:
+        return json.load(result_file)
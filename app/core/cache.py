@@ -0,0 +1,28 @@
+"""
+Cache backends reporting hits and misses to the metrics endpoint.
+"""
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+from core import metrics
+
+_missing = object()
+
+
+class InstrumentedFileBasedCache(FileBasedCache):
+    """File-based cache shared by workers that counts hits and misses.
+
+    OPTIONS['METRICS_NAME'] sets the ``cache`` label, 'default' if unset.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self.metrics_name = params.get('OPTIONS', {}).get(
+            'METRICS_NAME', 'default',
+        )
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        result = 'miss' if value is _missing else 'hit'
+        metrics.CACHE_REQUESTS.labels(self.metrics_name, result).inc()
+        return default if value is _missing else value
@@ -0,0 +1,161 @@
+"""
+Per-user change log behind the delta sync endpoint.
+
+Every save or delete of a Book, Tag or Review appends an entry numbered
+from the user's SyncState counter. The counter row is bumped with an
+upsert whose row lock is held until commit, so a user's writers commit in
+seq order and a reader that has seen seq N has seen everything before it.
+Entries are written in the caller's transaction: a change and its log
+entry commit or roll back together. Outside of one, the counter bump and
+the entries it numbers still commit together.
+
+Inside ``batch()``, used by the API views within their transaction,
+entries are buffered and written once on exit, so a book saved and then
+tagged several times is logged once.
+
+Unless EVENTS_BUS is 'off', taking seqs also tells the event streams of
+core.events that the user's log grew, once the transaction commits.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core import events
+from core.models import Book, Change, Review, Tag
+
+BATCH_SIZE = 500
+
+KINDS = {Book: Change.BOOK, Tag: Change.TAG, Review: Change.REVIEW}
+
+_pending = ContextVar('changelog_pending', default=None)
+# {user_id: on_commit hook} of users being deleted in this context.
+_deleting = ContextVar('changelog_deleting', default=None)
+
+RESERVE_SQL = (
+    'INSERT INTO core_syncstate (user_id, last_seq, floor_seq) '
+    'VALUES (%s, %s, 0) '
+    'ON CONFLICT (user_id) DO UPDATE '
+    'SET last_seq = core_syncstate.last_seq + EXCLUDED.last_seq '
+    'RETURNING last_seq'
+)
+# The same round trip queues the NOTIFY, which Postgres sends on commit.
+RESERVE_AND_NOTIFY_SQL = (
+    f'WITH reserved AS ({RESERVE_SQL}) '
+    f"SELECT last_seq, pg_notify('{events.CHANNEL}', %s || ':' || last_seq) "
+    'FROM reserved'
+)
+
+
+def reserve(user_id, count):
+    """Take ``count`` consecutive seqs of the user's log, return the first."""
+    with connection.cursor() as cursor:
+        if settings.EVENTS_BUS == 'postgres':
+            cursor.execute(
+                RESERVE_AND_NOTIFY_SQL, [user_id, count, str(user_id)],
+            )
+        else:
+            cursor.execute(RESERVE_SQL, [user_id, count])
+            if settings.EVENTS_BUS == 'local':
+                transaction.on_commit(lambda: events.hub.wake(user_id))
+        return cursor.fetchone()[0] - count + 1
+
+
+def deleting_user(user_id):
+    """Log nothing for ``user_id`` until its deletion commits.
+
+    The cascade of a deleted user must not write entries pointing at it.
+    Django calls no hook on rollback, but drops the on_commit hooks of a
+    rolled back transaction or savepoint, so the user counts as being
+    deleted while the hook registered here is pending.
+    """
+    deleting = _deleting.get()
+    if deleting is None:
+        deleting = {}
+        _deleting.set(deleting)
+
+    def deleted():
+        deleting.pop(user_id, None)
+
+    deleting[user_id] = deleted
+    transaction.on_commit(deleted)
+
+
+def is_deleting(user_id):
+    """Return whether ``user_id`` is deleted in the current transaction."""
+    deleting = _deleting.get()
+    hook = deleting and deleting.get(user_id)
+    if not hook:
+        return False
+    if any(func is hook for _, func in connection.run_on_commit):
+        return True
+    del deleting[user_id]
+    return False
+
+
+def write(entries):
+    """Write {(user_id, kind, object_id): deleted} as log entries."""
+    by_user = defaultdict(list)
+    for (user_id, kind, object_id), deleted in sorted(entries.items()):
+        if not is_deleting(user_id):
+            by_user[user_id].append((kind, object_id, deleted))
+    # A reader must never see a seq before its entry.
+    with transaction.atomic():
+        changes = []
+        for user_id, items in by_user.items():
+            first = reserve(user_id, len(items))
+            changes.extend(
+                Change(
+                    user_id=user_id, seq=first + offset, kind=kind,
+                    object_id=object_id, deleted=deleted,
+                )
+                for offset, (kind, object_id, deleted) in enumerate(items)
+            )
+        Change.objects.bulk_create(changes, batch_size=BATCH_SIZE)
+
+
+def record(kind, ids_by_user, deleted=False):
+    """Append entries for {user_id: object ids} of one kind."""
+    entries = {
+        (user_id, kind, object_id): deleted
+        for user_id, object_ids in ids_by_user.items()
+        for object_id in object_ids
+    }
+    pending = _pending.get()
+    if pending is not None:
+        pending.update(entries)
+    elif entries:
+        write(entries)
+
+
+@contextmanager
+def batch():
+    """Buffer entries recorded inside and write them together on exit."""
+    if _pending.get() is not None:
+        yield
+        return
+    pending = {}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    write(pending)
+
+
+def record_instance(instance, deleted=False):
+    """Append an entry for a saved or deleted Book, Tag or Review."""
+    record(
+        KINDS[type(instance)], {instance.user_id: [instance.pk]}, deleted,
+    )
+
+
+def record_books(user_ids):
+    """Append entries for books given as {book_id: user_id}."""
+    ids_by_user = defaultdict(list)
+    for book_id, user_id in user_ids.items():
+        ids_by_user[user_id].append(book_id)
+    record(Change.BOOK, ids_by_user)
@@ -0,0 +1,294 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+When many clients of one account ask for the same list at the same
+moment, e.g. right after an app release, only the first request runs the
+queries and serialization; identical requests arriving while it is in
+flight wait for it and answer with its data. Requests are identical when
+they are GETs of the same user, path and query string.
+
+Within a worker, waiting requests share a thread event, or a future on
+the event loop for coroutine views. With COALESCE_ACROSS_WORKERS the
+first request of a key also holds a flock on a file of that key in
+COALESCE_DIR; requests of other workers poll the lock and take the data
+it left in the shared cache, as long as it was computed after they
+arrived. uwsgi workers serve one request at a time, so there this is the
+only way requests are coalesced. The first request only writes the cache
+when a waiter left a marker file next to the lock, and removes both
+files before unlocking.
+
+Only 200 responses are shared. If the first request fails or takes over
+COALESCE_WAIT_SECONDS, the ones waiting on it compute their own.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from core import metrics
+
+# Checks for a free lock of another worker, a few times per query.
+POLL_SECONDS = 0.005
+
+_flights = {}
+_flights_lock = threading.Lock()
+_futures = {}
+
+
+class Flight:
+    """A computation of one key that identical requests wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+
+
+def request_key(request):
+    """Return the coalescing key of an authenticated GET."""
+    raw = f'{request.user.pk}:{request.get_full_path()}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _shareable(response):
+    return response.status_code == status.HTTP_200_OK
+
+
+def _result_key(key):
+    return f'coalesce:{key}'
+
+
+def _lock_path(key):
+    return os.path.join(settings.COALESCE_DIR, key)
+
+
+def _waiting_path(key):
+    return _lock_path(key) + '.waiting'
+
+
+def _try_lock(lock):
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _is_current(lock, key):
+    """Return whether ``lock`` is still the file at the path of ``key``."""
+    try:
+        path_inode = os.stat(_lock_path(key)).st_ino
+    except FileNotFoundError:
+        return False
+    return path_inode == os.fstat(lock.fileno()).st_ino
+
+
+def _lock(key):
+    """Open the lock file of ``key``, return it and whether it is ours.
+
+    A file locked after its holder unlinked it is a stale one, the lock
+    is taken again on a new file at the path.
+    """
+    os.makedirs(settings.COALESCE_DIR, exist_ok=True)
+    while True:
+        lock = open(_lock_path(key), 'ab')
+        if not _try_lock(lock):
+            return lock, False
+        if _is_current(lock, key):
+            return lock, True
+        lock.close()
+
+
+def _wait(key):
+    """Ask the holder of the lock of ``key`` to publish its data."""
+    open(_waiting_path(key), 'ab').close()
+
+
+def _unlock(key, lock, response):
+    """Publish ``response`` if a worker waits for it, release the lock."""
+    try:
+        os.unlink(_waiting_path(key))
+    except FileNotFoundError:
+        pass
+    else:
+        if response is not None:
+            _publish(key, response)
+    os.unlink(_lock_path(key))
+    lock.close()
+
+
+def _shared_since(key, arrived):
+    """Return data another worker computed after ``arrived``, or None."""
+    result = cache.get(_result_key(key))
+    if result is not None and result['finished'] >= arrived:
+        return result['data']
+    return None
+
+
+def _publish(key, response):
+    if _shareable(response):
+        cache.set(_result_key(key), {
+            'data': response.data, 'finished': time.time(),
+        }, settings.COALESCE_WAIT_SECONDS)
+
+
+def across_workers(key, compute):
+    """Run ``compute`` unless another worker is computing ``key``.
+
+    Returns the response and whether its data came from another worker.
+    """
+    if not settings.COALESCE_ACROSS_WORKERS:
+        return compute(), False
+    arrived = time.time()
+    lock, leader = _lock(key)
+    if leader:
+        response = None
+        try:
+            response = compute()
+            return response, False
+        finally:
+            _unlock(key, lock, response)
+    # Waiters let go of the lock before computing their own response, or
+    # they would queue on each other.
+    with lock:
+        _wait(key)
+        deadline = time.monotonic() + settings.COALESCE_WAIT_SECONDS
+        while not _try_lock(lock):
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(POLL_SECONDS)
+        else:
+            data = _shared_since(key, arrived)
+            if data is not None:
+                return Response(data), True
+    return compute(), False
+
+
+async def across_workers_async(key, compute):
+    """Coroutine version of ``across_workers``."""
+    if not settings.COALESCE_ACROSS_WORKERS:
+        return await compute(), False
+    arrived = time.time()
+    lock, leader = _lock(key)
+    if leader:
+        response = None
+        try:
+            response = await compute()
+            return response, False
+        finally:
+            await sync_to_async(_unlock)(key, lock, response)
+    with lock:
+        _wait(key)
+        deadline = time.monotonic() + settings.COALESCE_WAIT_SECONDS
+        while not _try_lock(lock):
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(POLL_SECONDS)
+        else:
+            data = await sync_to_async(_shared_since)(key, arrived)
+            if data is not None:
+                return Response(data), True
+    return await compute(), False
+
+
+def single_flight(key, compute, route):
+    """Return the response of ``compute``, shared by concurrent callers."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+    if not leader:
+        finished = flight.done.wait(settings.COALESCE_WAIT_SECONDS)
+        if finished and flight.data is not None:
+            metrics.COALESCED_REQUESTS.labels(route, 'worker').inc()
+            return Response(flight.data)
+        return compute()
+    try:
+        response, shared = across_workers(key, compute)
+        if shared:
+            metrics.COALESCED_REQUESTS.labels(route, 'host').inc()
+        if _shareable(response):
+            flight.data = response.data
+        return response
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+async def single_flight_async(key, compute, route):
+    """Coroutine version of ``single_flight`` for one event loop."""
+    future = _futures.get(key)
+    if future is not None:
+        try:
+            data = await asyncio.wait_for(
+                asyncio.shield(future), settings.COALESCE_WAIT_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            data = None
+        if data is not None:
+            metrics.COALESCED_REQUESTS.labels(route, 'worker').inc()
+            return Response(data)
+        return await compute()
+    future = _futures[key] = asyncio.get_running_loop().create_future()
+    data = None
+    try:
+        response, shared = await across_workers_async(key, compute)
+        if shared:
+            metrics.COALESCED_REQUESTS.labels(route, 'host').inc()
+        if _shareable(response):
+            data = response.data
+        return response
+    finally:
+        del _futures[key]
+        future.set_result(data)
+
+
+class CoalescingMixin:
+    """Coalesce concurrent identical GETs of the ``coalesce_actions``.
+
+    The action's handler, and its coroutine version under ASGI, are
+    wrapped in ``initial``, after authentication, permissions and
+    throttles ran for every request.
+    """
+    coalesce_actions = ('list',)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            not settings.COALESCE_READS
+            or request.method != 'GET'
+            or self.action not in self.coalesce_actions
+        ):
+            return
+        key = request_key(request)
+        route = metrics.route_name(request)
+        # ViewSet.as_view binds the action to the method name, adispatch
+        # looks up the coroutine version by action.
+        for name in ('get', f'a{self.action}'):
+            handler = getattr(self, name, None)
+            if handler is not None:
+                setattr(self, name, self._coalesced(handler, key, route))
+
+    def _coalesced(self, handler, key, route):
+        if asyncio.iscoroutinefunction(handler):
+            async def coalesced_async(request, *args, **kwargs):
+                return await single_flight_async(
+                    key, lambda: handler(request, *args, **kwargs), route,
+                )
+            return coalesced_async
+
+        def coalesced(request, *args, **kwargs):
+            return single_flight(
+                key, lambda: handler(request, *args, **kwargs), route,
+            )
+        return coalesced
@@ -0,0 +1,87 @@
+"""
+Content-Encoding negotiation and gzip/brotli encoders.
+
+Brotli is optional: without the ``brotli`` package only gzip is offered.
+"""
+
+import gzip
+import re
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Fast levels for responses; static files are compressed once at the
+# highest levels by core.storage.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/vnd.oai.openapi',
+    'image/svg+xml',
+)
+
+_CODING = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*')
+
+
+def available_encodings():
+    """Return supported encodings, preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    """Return the best supported encoding the client accepts, or None."""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        match = _CODING.fullmatch(part)
+        if not match:
+            continue
+        try:
+            accepted[match[1].lower()] = float(match[2] or 1)
+        except ValueError:
+            continue
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def is_compressible(content_type):
+    """Return whether a response of ``content_type`` is worth compressing."""
+    return content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data, encoding, level=None):
+    """Compress ``data`` in one go."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level or BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=level or GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of chunks, flushing after each one.
+
+    Every input chunk produces output right away, so streamed responses
+    keep reaching the client while they are generated.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    # wbits 31 writes the gzip header and trailer.
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
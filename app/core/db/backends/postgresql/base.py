@@ -0,0 +1,112 @@
+"""
+PostgreSQL backend with connection health checks and optional pooling.
+
+Set ``CONN_HEALTH_CHECKS`` on a database to ping persistent connections
+once per request before reusing them, and add a ``POOL`` dict (min_size,
+max_size, timeout, max_idle, check_interval) to hand out connections from
+an in-process pool instead of opening a new one every time.
+"""
+
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+from core.db.backends.postgresql.creation import DatabaseCreation
+from core.db.backends.postgresql.pool import get_pool
+
+
+def _connect(conn_params, isolation_level=None):
+    """Open a raw connection the way Django's postgresql backend does."""
+    connection = base.Database.connect(**conn_params)
+    if (
+        isolation_level is not None
+        and isolation_level != connection.isolation_level
+    ):
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(
+        conn_or_curs=connection, loads=lambda x: x
+    )
+    return connection
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Django's postgresql wrapper with health checks and pooling."""
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_enabled = self.settings_dict.get(
+            'CONN_HEALTH_CHECKS', False,
+        )
+        self.health_check_done = False
+        self._pool = None
+        self._pool_name = None
+
+    @property
+    def pool(self):
+        """Return the pool for this database, or None if pooling is off."""
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        # The test runner swaps NAME after the wrapper has been created.
+        if self._pool is None or self._pool_name != self.settings_dict['NAME']:
+            params = self.get_connection_params()
+            isolation_level = self.settings_dict['OPTIONS'].get(
+                'isolation_level',
+            )
+            key = (
+                self.alias,
+                tuple(sorted((k, str(v)) for k, v in params.items())),
+            )
+            self._pool = get_pool(
+                key, lambda: _connect(params, isolation_level), **options
+            )
+            self._pool_name = self.settings_dict['NAME']
+        return self._pool
+
+    def get_new_connection(self, conn_params):
+        """Borrow a connection from the pool when pooling is enabled."""
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.getconn()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level,
+        )
+        return connection
+
+    def _close(self):
+        """Return the connection to the pool instead of closing it."""
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.putconn(self.connection, discard=self.errors_occurred)
+
+    def connect(self):
+        """Open a connection; it is known to be healthy until next request."""
+        # set_autocommit() in the parent calls ensure_connection().
+        self.health_check_done = True
+        super().connect()
+
+    def close_if_unusable_or_obsolete(self):
+        """Check the connection again on first use in the next request."""
+        # get_autocommit() in the parent calls ensure_connection().
+        self.health_check_done = True
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    @async_unsafe
+    def ensure_connection(self):
+        """Drop a persistent connection that died since the last request."""
+        if (
+            self.connection is not None
+            and self.health_check_enabled
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
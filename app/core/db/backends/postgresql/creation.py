@@ -0,0 +1,11 @@
+from django.db.backends.postgresql import creation
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """Test database creation that knows about pooled connections."""
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        """Close idle pooled connections so the database can be dropped."""
+        if self.connection.pool is not None:
+            self.connection.pool.closeall()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,210 @@
+"""
+Thread-safe in-process pool of raw psycopg2 connections.
+"""
+
+import os
+import threading
+import time
+
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+class PoolTimeout(OperationalError):
+    """Raised when no connection became free within the acquire timeout."""
+
+
+class ConnectionPool:
+    """Pool of open connections shared by the threads of one process.
+
+    Connections are opened on demand, up to ``max_size``. ``min_size`` is
+    a floor for pruning: that many connections are kept open once they
+    exist, but none are opened ahead of time.
+    """
+
+    def __init__(self, connect, min_size=0, max_size=10, timeout=5.0,
+                 max_idle=300.0, check_interval=30.0):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError(
+                'Pool needs 0 <= min_size <= max_size, 1 <= max_size.'
+            )
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self._lock = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        """Forget every connection, e.g. after the process was forked."""
+        self._pid = os.getpid()
+        self._idle = []
+        self._in_use = 0
+        self._counters = {
+            'created': 0,
+            'closed': 0,
+            'acquired': 0,
+            'released': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_seconds': 0.0,
+        }
+
+    def _check_pid(self):
+        """Drop connections inherited from the parent process.
+
+        They share a socket with the parent, so they are abandoned instead
+        of being closed, which would terminate the parent's session.
+        """
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _is_alive(self, conn, idle_since):
+        """Check whether an idle connection can be handed out again."""
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, conn):
+        """Close a connection and forget about it."""
+        self._counters['closed'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Return an open connection, waiting up to ``timeout`` seconds."""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            conn = None
+            with self._lock:
+                self._check_pid()
+                while not self._idle and self._in_use >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'No database connection available within '
+                            f'{self.timeout}s (max_size={self.max_size}).'
+                        )
+                    if not waited:
+                        waited = True
+                        self._counters['waits'] += 1
+                    self._lock.wait(remaining)
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                # Reserve the slot so the ping or connect below can run
+                # without holding the lock.
+                self._in_use += 1
+            if conn is None:
+                break
+            if self._is_alive(conn, idle_since):
+                with self._lock:
+                    return self._checkout(conn, waited, deadline)
+            with self._lock:
+                self._in_use -= 1
+                self._discard(conn)
+                self._lock.notify()
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._counters['created'] += 1
+            return self._checkout(conn, waited, deadline)
+
+    def _checkout(self, conn, waited, deadline):
+        """Account for a connection being handed out in a reserved slot."""
+        self._counters['acquired'] += 1
+        if waited:
+            self._counters['wait_seconds'] += (
+                time.monotonic() - deadline + self.timeout
+            )
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Give a connection back; broken or dirty connections are closed."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Checked out before a fork; not ours to reuse or close.
+                return
+            self._in_use -= 1
+            self._counters['released'] += 1
+            if not discard and not conn.closed:
+                try:
+                    status = conn.get_transaction_status()
+                    if status != TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except Exception:
+                    discard = True
+            if discard or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._prune()
+            self._lock.notify()
+
+    def _prune(self):
+        """Close idle connections above ``min_size`` unused for too long."""
+        now = time.monotonic()
+        keep = []
+        for conn, idle_since in self._idle:
+            total = self._in_use + len(keep)
+            if total >= self.min_size and now - idle_since > self.max_idle:
+                self._discard(conn)
+            else:
+                keep.append((conn, idle_since))
+        self._idle = keep
+
+    def closeall(self):
+        """Close every idle connection, e.g. before the process forks."""
+        with self._lock:
+            self._check_pid()
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+
+    def stats(self):
+        """Return a snapshot of the pool counters and gauges."""
+        with self._lock:
+            self._check_pid()
+            return dict(
+                self._counters,
+                in_use=self._in_use,
+                idle=len(self._idle),
+                size=self._in_use + len(self._idle),
+                max_size=self.max_size,
+            )
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, connect, **options):
+    """Return the process-wide pool for ``key``, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(connect, **options)
+        return pool
+
+
+def all_pools():
+    """Return the pools created in this process, keyed like ``get_pool``."""
+    with _pools_lock:
+        return dict(_pools)
@@ -0,0 +1,101 @@
+"""
+Database router sending safe-method reads to replicas.
+
+``ReplicaRoutingMiddleware`` marks which requests may read from a replica;
+everything else, including management commands and tests, uses primary.
+A user who wrote recently is pinned to primary for
+``REPLICA_PIN_SECONDS`` so they always read their own writes.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Models that must never lag behind, e.g. a token created a moment ago.
+PRIMARY_ONLY_APPS = {'authtoken', 'sessions', 'auth', 'contenttypes'}
+
+_request_state = ContextVar('replica_routing_state', default=None)
+
+
+def pin_key(user_id):
+    """Return the cache key pinning a user's reads to primary."""
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Send the user's reads to primary for the read-your-writes window."""
+    cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def begin_request(request):
+    """Start routing for a request; return a token for ``end_request``."""
+    return _request_state.set({
+        'request': request,
+        'safe': request.method in ('GET', 'HEAD', 'OPTIONS'),
+        'pinned': None,
+        'wrote': False,
+    })
+
+
+def end_request(token):
+    """Stop routing for a request and pin its user if it wrote anything."""
+    pin_writer(finish_request(token))
+
+
+def finish_request(token):
+    """Stop routing for a request; return its state for ``pin_writer``."""
+    state = _request_state.get()
+    _request_state.reset(token)
+    return state
+
+
+def pin_writer(state):
+    """Pin the user of a finished request to primary if it wrote."""
+    user = getattr(state['request'], 'user', None)
+    if state['wrote'] and user is not None and user.is_authenticated:
+        pin_to_primary(user.pk)
+
+
+def _is_pinned(state):
+    """Check, once per request, whether the user must read from primary."""
+    if state['pinned'] is None:
+        user = getattr(state['request'], 'user', None)
+        if user is None or not user.is_authenticated:
+            # Authentication has not run yet, decide again on the next read.
+            return False
+        state['pinned'] = bool(cache.get(pin_key(user.pk)))
+    return state['pinned']
+
+
+class PrimaryReplicaRouter:
+    """Route reads to ``DATABASE_REPLICAS`` and writes to primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        replicas = settings.DATABASE_REPLICAS
+        if (
+            not replicas
+            or state is None
+            or not state['safe']
+            or state['wrote']
+            or model._meta.app_label in PRIMARY_ONLY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+            or _is_pinned(state)
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,342 @@
+"""
+Server-sent event stream of a user's library changes.
+
+``GET /api/book/events/`` keeps the response open and pushes an event for
+every entry of the user's change log (see core.changelog): the event name
+is the kind (book, tag or review), the data the object id and whether it
+was deleted, and the event id the entry's seq. The seq is a sync cursor,
+so a client may fetch the changed objects with ``/api/book/sync/?since=``
+the id of the last event it handled.
+
+Browsers reconnect on their own and send the last id they received as
+``Last-Event-ID``; clients may pass it as ``since`` instead. The stream
+then starts with the entries after it, or answers 410 like the sync
+endpoint when the id predates compacted tombstones. Without either only
+new changes are sent. Idle streams get a comment every
+EVENTS_HEARTBEAT_SECONDS, so proxies keep them open and clients notice
+dead connections.
+
+``changelog.reserve`` sends a NOTIFY with the user id in the statement
+that takes the seqs; Postgres delivers it on commit. Each process runs
+one listener thread with its own connection, which wakes the streams of
+that user; they read the new entries from the log, so a notification
+lost while reconnecting only delays events until the next one. With
+EVENTS_BUS set to 'local', commits wake the streams of the same process
+instead, which suits single process servers and tests. With 'off', the
+default unless SERVER_MODE is asgi, nothing is sent and the path is not
+served.
+
+Django 4.0 can't stream from coroutines, so the stream is a plain ASGI
+app that app/asgi.py routes to; under uwsgi the path is not served.
+"""
+
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from core import metrics
+from core.models import Change, SyncState
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'library_changes'
+PATH = '/api/book/events/'
+
+# How often the listener checks it should stop, and waits to reconnect.
+POLL_SECONDS = 1
+
+
+class Waiter:
+    """Wakes one stream, from any thread."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    def wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # The loop closed under a stream that is going away anyway.
+            pass
+
+    async def wait(self):
+        await self.event.wait()
+        self.event.clear()
+
+
+class Listener(threading.Thread):
+    """LISTENs on CHANNEL and wakes the streams of notified users."""
+
+    def __init__(self, hub):
+        super().__init__(name='events-listener', daemon=True)
+        self.hub = hub
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except psycopg2.Error:
+                logger.exception('Event listener lost its connection.')
+                self.stopped.wait(POLL_SECONDS)
+
+    def listen(self):
+        params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+        connection = psycopg2.connect(**params)
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            # Changes committed while reconnecting were not notified.
+            self.hub.wake_all()
+            while not self.stopped.is_set():
+                if select.select([connection], [], [], POLL_SECONDS)[0]:
+                    connection.poll()
+                    users = {
+                        int(n.payload.split(':')[0])
+                        for n in connection.notifies
+                    }
+                    connection.notifies.clear()
+                    for user_id in users:
+                        self.hub.wake(user_id)
+        finally:
+            connection.close()
+
+
+class Hub:
+    """The streams open in this process, by user."""
+
+    def __init__(self):
+        self._waiters = defaultdict(set)
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, user_id):
+        """Return a Waiter woken when the user's log grows."""
+        waiter = Waiter(asyncio.get_running_loop())
+        with self._lock:
+            self._waiters[user_id].add(waiter)
+            if settings.EVENTS_BUS == 'postgres' and self._listener is None:
+                self._listener = Listener(self)
+                self._listener.start()
+        return waiter
+
+    def unsubscribe(self, user_id, waiter):
+        with self._lock:
+            waiters = self._waiters[user_id]
+            waiters.discard(waiter)
+            if not waiters:
+                del self._waiters[user_id]
+
+    def wake(self, user_id):
+        with self._lock:
+            waiters = list(self._waiters.get(user_id, ()))
+        for waiter in waiters:
+            waiter.wake()
+
+    def wake_all(self):
+        with self._lock:
+            waiters = [
+                waiter for user_waiters in self._waiters.values()
+                for waiter in user_waiters
+            ]
+        for waiter in waiters:
+            waiter.wake()
+
+    def stop(self):
+        """Stop the listener; the next subscriber starts a new one."""
+        with self._lock:
+            listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stopped.set()
+            listener.join()
+
+
+hub = Hub()
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _authenticate(scope):
+    """Return the user of the request's token, or None."""
+    try:
+        keyword, key = (_header(scope, b'authorization') or '').split()
+    except ValueError:
+        return None
+    if keyword != TokenAuthentication.keyword:
+        return None
+    try:
+        return TokenAuthentication().authenticate_credentials(key)[0]
+    except AuthenticationFailed:
+        return None
+    finally:
+        close_old_connections()
+
+
+def _since(scope):
+    """Return the id to resume after, or None; ValueError if invalid."""
+    since = _header(scope, b'last-event-id')
+    if since is None:
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        since = query.get('since', [None])[0]
+    return None if since is None else int(since)
+
+
+def _state(user_id):
+    try:
+        state = SyncState.objects.filter(user_id=user_id).first()
+        return state or SyncState()
+    finally:
+        close_old_connections()
+
+
+def _changes(user_id, since):
+    """Return a page of the user's log entries after ``since``."""
+    try:
+        changes = (
+            Change.objects.filter(user_id=user_id, seq__gt=since)
+            .order_by('seq')
+            .values_list('seq', 'kind', 'object_id', 'deleted')
+        )
+        return list(changes[:settings.SYNC_PAGE_SIZE])
+    finally:
+        close_old_connections()
+
+
+def format_event(seq, kind, object_id, deleted):
+    """Return a log entry as an event of the stream."""
+    data = json.dumps({'id': object_id, 'deleted': deleted})
+    return f'id: {seq}\nevent: {kind}\ndata: {data}\n\n'.encode()
+
+
+async def _reject(send, status_code, detail):
+    await send({
+        'type': 'http.response.start',
+        'status': status_code,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'detail': detail}).encode(),
+    })
+
+
+async def _disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream(scope, receive, send):
+    """ASGI app streaming the changes of the authenticated user."""
+    if scope['method'] != 'GET':
+        return await _reject(
+            send, status.HTTP_405_METHOD_NOT_ALLOWED,
+            f'Method "{scope["method"]}" not allowed.',
+        )
+    user = await sync_to_async(_authenticate)(scope)
+    if user is None:
+        metrics.AUTH_FAILURES.labels('unauthorized').inc()
+        return await _reject(
+            send, status.HTTP_401_UNAUTHORIZED,
+            'Authentication credentials were not provided.',
+        )
+    try:
+        since = _since(scope)
+    except ValueError:
+        return await _reject(
+            send, status.HTTP_400_BAD_REQUEST, 'A valid integer is required.',
+        )
+
+    # Subscribed before reading the log, so no commit falls in between.
+    waiter = hub.subscribe(user.pk)
+    disconnected = asyncio.ensure_future(_disconnect(receive))
+    wake = None
+    metrics.EVENT_STREAMS.inc()
+    try:
+        state = await sync_to_async(_state)(user.pk)
+        if since is None:
+            since = state.last_seq
+        elif not state.floor_seq <= since <= state.last_seq:
+            return await _reject(
+                send, status.HTTP_410_GONE,
+                'Sync cursor is no longer valid, fetch the library again.',
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': status.HTTP_200_OK,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Tells nginx not to buffer the stream.
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {settings.EVENTS_RETRY_MS}\n\n'.encode(),
+            'more_body': True,
+        })
+        if since < state.last_seq:
+            waiter.event.set()
+        while True:
+            if wake is None:
+                wake = asyncio.ensure_future(waiter.wait())
+            done, _ = await asyncio.wait(
+                {wake, disconnected},
+                timeout=settings.EVENTS_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                return
+            if wake not in done:
+                body = b': heartbeat\n\n'
+            else:
+                wake = None
+                changes = await sync_to_async(_changes)(user.pk, since)
+                if len(changes) == settings.SYNC_PAGE_SIZE:
+                    waiter.event.set()
+                if not changes:
+                    continue
+                since = changes[-1][0]
+                body = b''.join(format_event(*change) for change in changes)
+            await send({
+                'type': 'http.response.body', 'body': body, 'more_body': True,
+            })
+    finally:
+        metrics.EVENT_STREAMS.dec()
+        hub.unsubscribe(user.pk, waiter)
+        disconnected.cancel()
+        if wake is not None:
+            wake.cancel()
+
+
+def with_event_stream(application):
+    """Wrap an ASGI app to serve the event stream at PATH."""
+    async def app(scope, receive, send):
+        if (
+            scope['type'] == 'http'
+            and scope['path'] == PATH
+            and settings.EVENTS_BUS != 'off'
+        ):
+            return await stream(scope, receive, send)
+        return await application(scope, receive, send)
+
+    return app
@@ -0,0 +1,96 @@
+"""
+Sparse fieldsets for read endpoints.
+
+``?fields=id,title`` limits the output to the listed fields and
+``?expand=tags,reviews`` picks the nested relations to include; without
+either parameter every field is returned. The choice also trims the SQL:
+only the columns behind the selected fields are loaded and prefetches of
+relations left out are skipped.
+"""
+
+from functools import cached_property
+
+from rest_framework.exceptions import ValidationError
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class FieldsetSerializerMixin:
+    """Serializer dropping fields missing from ``context['fields']``."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        if selected is not None:
+            for name in list(fields):
+                if name not in selected:
+                    del fields[name]
+        return fields
+
+
+class FieldsetViewMixin:
+    """Parse ``fields``/``expand`` and trim querysets of read actions.
+
+    ``expandable_fields`` maps relation fields to their prefetch lookup;
+    ``field_columns`` maps fields to the model columns they read when the
+    names differ.
+    """
+    fieldset_actions = ('list', 'retrieve')
+    expandable_fields = {}
+    field_columns = {}
+
+    @cached_property
+    def fieldset(self):
+        """Return the selected field names, or None for all fields."""
+        params = self.request.query_params
+        fields, expand = params.get('fields'), params.get('expand')
+        if (
+            self.action not in self.fieldset_actions
+            or (fields is None and expand is None)
+        ):
+            return None
+        available = list(self.get_serializer_class().Meta.fields)
+        relations = set(self.expandable_fields)
+        if fields is None:
+            requested = [name for name in available if name not in relations]
+        else:
+            requested = _split(fields)
+        expanded = _split(expand) if expand is not None else []
+
+        errors = {}
+        unknown = set(requested) - set(available)
+        if unknown:
+            errors['fields'] = (
+                f'Unknown fields: {", ".join(sorted(unknown))}. '
+                f'Choose from: {", ".join(available)}.'
+            )
+        unknown = set(expanded) - relations
+        if unknown:
+            errors['expand'] = (
+                f'Cannot expand: {", ".join(sorted(unknown))}. '
+                f'Choose from: {", ".join(sorted(relations))}.'
+            )
+        if errors:
+            raise ValidationError(errors)
+        return set(requested) | set(expanded)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.fieldset
+        return context
+
+    def apply_fieldset(self, queryset):
+        """Load only the columns and prefetches the fieldset needs."""
+        if self.fieldset is None:
+            return queryset
+        columns = []
+        prefetches = []
+        for name in self.fieldset:
+            if name in self.expandable_fields:
+                prefetches.append(self.expandable_fields[name])
+            columns.extend(self.field_columns.get(name, [name]))
+        return queryset.prefetch_related(None).prefetch_related(
+            *filter(None, prefetches)
+        ).only(*columns)
@@ -0,0 +1,51 @@
+"""
+Readiness checks behind /readyz.
+
+The result is kept in the shared cache for READYZ_CACHE_SECONDS, so a
+burst of probes from the proxy and the orchestrator costs one round of
+queries per interval for all workers. Failures are cached too: probes
+must not pile onto a struggling database.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.migrations.executor import MigrationExecutor
+
+CACHE_KEY = 'readyz'
+
+
+def ping(alias=DEFAULT_DB_ALIAS):
+    """Run a trivial query, raising the driver's error when it fails."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def unapplied_migrations(alias=DEFAULT_DB_ALIAS):
+    """Return the names of migrations not applied yet."""
+    executor = MigrationExecutor(connections[alias])
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return [f'{migration.app_label}.{migration.name}' for migration, _ in plan]
+
+
+def check():
+    """Return {check: problem or 'ok'} for the database and migrations."""
+    checks = {'database': 'ok', 'migrations': 'ok'}
+    try:
+        ping()
+    except DatabaseError:
+        checks['database'] = checks['migrations'] = 'unreachable'
+        return checks
+    pending = unapplied_migrations()
+    if pending:
+        checks['migrations'] = f'{len(pending)} unapplied'
+    return checks
+
+
+def readiness():
+    """Return (ready, checks), from the cache when recent."""
+    checks = cache.get(CACHE_KEY)
+    if checks is None:
+        checks = check()
+        cache.set(CACHE_KEY, checks, settings.READYZ_CACHE_SECONDS)
+    return all(value == 'ok' for value in checks.values()), checks
@@ -0,0 +1,170 @@
+"""
+Idempotency-Key support for unsafe API actions.
+
+The first request with a key claims it by inserting an in-flight row and
+runs; its response is then stored with the row. Retries with the same key
+and request get the stored response back without running the action
+again, and duplicates arriving while the first is in flight wait for it
+up to IDEMPOTENCY_WAIT_SECONDS before they are rejected with 409. Keys
+are kept per user for IDEMPOTENCY_TTL_HOURS and removed by
+purge_idempotency_keys.
+
+Server errors are not stored: the claim is released so a retry can run.
+"""
+
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from core.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+POLL_SECONDS = 0.05
+
+# Inserts a claim, or takes over an expired key or an abandoned claim.
+# Returns the id only when this request now owns the key.
+CLAIM = """
+    INSERT INTO core_idempotencykey
+        (user_id, key, fingerprint, status_code, body, created_at, expires_at)
+    VALUES
+        (%(user_id)s, %(key)s, %(fingerprint)s, NULL, NULL, %(now)s,
+         %(expires)s)
+    ON CONFLICT (user_id, key) DO UPDATE
+    SET fingerprint = EXCLUDED.fingerprint, status_code = NULL, body = NULL,
+        created_at = EXCLUDED.created_at, expires_at = EXCLUDED.expires_at
+    WHERE core_idempotencykey.expires_at <= %(now)s
+        OR (core_idempotencykey.status_code IS NULL
+            AND core_idempotencykey.created_at < %(abandoned)s)
+    RETURNING id
+"""
+
+
+class IdempotencyConflict(APIException):
+    """Another request with the same key is still running."""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = (
+        'A request with this Idempotency-Key is in progress, retry later.'
+    )
+    default_code = 'idempotency_conflict'
+
+
+class IdempotencyMismatch(APIException):
+    """The key was used before for a different request."""
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was used for a different request.'
+    default_code = 'idempotency_mismatch'
+
+
+def fingerprint(request):
+    """Return a digest identifying the method, path and body of a request."""
+    digest = hashlib.sha256()
+    parts = (
+        request.method.encode(), request.get_full_path().encode(),
+        request.body,
+    )
+    for part in parts:
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def claim(user_id, key, digest):
+    """Claim ``key`` for a new request; return the row id or None."""
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(CLAIM, {
+            'user_id': user_id,
+            'key': key,
+            'fingerprint': digest,
+            'now': now,
+            'expires': now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS),
+            'abandoned': now - timedelta(
+                seconds=settings.IDEMPOTENCY_LOCK_SECONDS,
+            ),
+        })
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def wait_for(user_id, key, digest):
+    """Return the stored response of ``key``, waiting while it is in flight."""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        record = IdempotencyKey.objects.filter(
+            user_id=user_id, key=key, expires_at__gt=timezone.now(),
+        ).first()
+        if record is None:
+            # Released after a server error or expired meanwhile.
+            return None
+        if record.fingerprint != digest:
+            raise IdempotencyMismatch()
+        if record.status_code is not None:
+            response = Response(
+                json.loads(record.body), status=record.status_code,
+            )
+            response[REPLAYED_HEADER] = 'true'
+            return response
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict()
+        time.sleep(POLL_SECONDS)
+
+
+class IdempotencyMixin:
+    """Honour the Idempotency-Key header on ``idempotent_actions``.
+
+    The key is claimed in ``initial``, after authentication, and the
+    response recorded in ``finalize_response``. Claims are committed on
+    their own, outside the action's transaction, so that duplicates see
+    them.
+    """
+    idempotent_actions = ('create', 'update', 'partial_update')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.idempotency_claim = None
+        key = request.headers.get(HEADER)
+        if key is None or self.action not in self.idempotent_actions:
+            return
+        max_length = IdempotencyKey._meta.get_field('key').max_length
+        if not 0 < len(key) <= max_length:
+            raise ValidationError({
+                HEADER: f'Must be 1 to {max_length} characters long.',
+            })
+        digest = fingerprint(request)
+        while True:
+            self.idempotency_claim = claim(request.user.id, key, digest)
+            if self.idempotency_claim is not None:
+                return
+            replay = wait_for(request.user.id, key, digest)
+            if replay is not None:
+                # Swap the handler as ViewSet.as_view binds actions, so the
+                # stored response is returned without running the action.
+                setattr(
+                    self, request.method.lower(),
+                    lambda *args, **kwargs: replay,
+                )
+                return
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        claimed = getattr(self, 'idempotency_claim', None)
+        if claimed is not None:
+            self.idempotency_claim = None
+            records = IdempotencyKey.objects.filter(pk=claimed)
+            if response.status_code >= 500:
+                records.delete()
+            else:
+                records.update(
+                    status_code=response.status_code,
+                    body=json.dumps(response.data, cls=DjangoJSONEncoder),
+                )
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,118 @@
+"""
+Per-request timing of SQL, serialization, rendering and custom spans.
+
+``ServerTimingMiddleware`` starts a ``RequestTimings`` record for a sample
+of requests. Code anywhere in the request can add to it with::
+
+    with instrumentation.span('thumbnail'):
+        ...
+
+When the request is not sampled ``span`` does nothing but a context
+variable lookup, so it is safe to leave in hot paths.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Durations collected while handling one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total_ms = None
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.spans = {}
+        self._active = set()
+
+    def add(self, name, duration_ms):
+        """Add a duration to the named span."""
+        count, total = self.spans.get(name, (0, 0.0))
+        self.spans[name] = (count + 1, total + duration_ms)
+
+    def finish(self):
+        """Stop the request clock."""
+        self.total_ms = (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self):
+        """Format the timings as a Server-Timing header value."""
+        metrics = [
+            f'total;dur={self.total_ms:.1f}',
+            f'db;dur={self.sql_ms:.1f};desc="{self.sql_count} queries"',
+        ]
+        metrics.extend(
+            f'{name};dur={total:.1f}'
+            for name, (_, total) in self.spans.items()
+        )
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        """Return the timings as a JSON-serializable dict."""
+        return {
+            'total_ms': round(self.total_ms, 2),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_ms, 2),
+            'spans': {
+                name: {'count': count, 'ms': round(total, 2)}
+                for name, (count, total) in self.spans.items()
+            },
+        }
+
+
+def current():
+    """Return the timings of the sampled request in progress, if any."""
+    return _current.get()
+
+
+def start():
+    """Start collecting timings; return a token for ``stop``."""
+    return _current.set(RequestTimings())
+
+
+def stop(token):
+    """Stop collecting timings and return them."""
+    timings = _current.get()
+    _current.reset(token)
+    timings.finish()
+    return timings
+
+
+@contextmanager
+def span(name):
+    """Time the block under ``name``; nested spans of one name count once."""
+    timings = _current.get()
+    if timings is None or name in timings._active:
+        yield
+        return
+    timings._active.add(name)
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._active.discard(name)
+        timings.add(name, (time.perf_counter() - began) * 1000)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper counting queries and their duration."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.sql_count += 1
+        timings.sql_ms += (time.perf_counter() - began) * 1000
+
+
+class TimedSerializerMixin:
+    """Serializer mixin recording representation time as 'serialize'."""
+
+    def to_representation(self, instance):
+        with span('serialize'):
+            return super().to_representation(instance)
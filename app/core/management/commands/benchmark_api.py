@@ -0,0 +1,283 @@
+"""
+Django command to load test a running API through its real URL routes.
+"""
+
+import http.client
+import json
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from core import benchmarking
+from core.management.commands.seed_perf_data import PASSWORD
+from core.models import Book, Tag
+
+SCENARIOS = ['list', 'sparse', 'filter', 'detail', 'create', 'token']
+
+# Fields a list view needs, for the sparse fieldset scenario.
+SPARSE_FIELDS = 'id,title,author'
+
+
+class Client:
+	"""Keep-alive HTTP client used by one benchmark thread."""
+
+	def __init__(self, base_url):
+		parts = urlsplit(base_url)
+		self.host = parts.hostname
+		self.port = parts.port
+		self.connection = None
+
+	def request(self, method, path, body=None, token=None):
+		"""Send a request and return (status, seconds, body bytes)."""
+		headers = {'Content-Type': 'application/json'}
+		if token:
+			headers['Authorization'] = f'Token {token}'
+		payload = json.dumps(body) if body is not None else None
+		began = time.perf_counter()
+		# A kept-alive connection the server has closed is retried once.
+		for attempt in range(2):
+			reused = self.connection is not None
+			try:
+				if not reused:
+					self.connection = http.client.HTTPConnection(
+						self.host, self.port, timeout=60,
+					)
+				self.connection.request(method, path, payload, headers)
+				response = self.connection.getresponse()
+				size = len(response.read())
+				if response.will_close:
+					self.connection.close()
+					self.connection = None
+				return response.status, time.perf_counter() - began, size
+			except (OSError, http.client.HTTPException):
+				self.connection = None
+				if not reused:
+					break
+		return 0, time.perf_counter() - began, 0
+
+
+def trickle(base_url, path, token, interval, stop):
+	"""Hold a connection open, sending a request body a byte at a time."""
+	parts = urlsplit(base_url)
+	body = json.dumps({'title': 'Slow client', 'number_of_pages': 1}).encode()
+	head = (
+		f'POST {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+		f'Authorization: Token {token}\r\nContent-Type: application/json\r\n'
+		f'Content-Length: {len(body)}\r\n\r\n'
+	).encode()
+	while not stop.is_set():
+		try:
+			address = (parts.hostname, parts.port)
+			with socket.create_connection(address, timeout=60) as sock:
+				sock.sendall(head)
+				for byte in body:
+					if stop.wait(interval):
+						break
+					sock.sendall(bytes([byte]))
+				else:
+					sock.recv(4096)
+		except OSError:
+			stop.wait(interval)
+
+
+def percent(change):
+	"""Format a relative change, n/a when the baseline was zero."""
+	return 'n/a' if change is None else f'{change:+.1%}'
+
+
+class Command(BaseCommand):
+	"""Command to drive list, sparse, filter, detail, create and token"""
+
+	def add_arguments(self, parser):
+		parser.add_argument('--base-url', default='http://localhost:8000')
+		parser.add_argument('--concurrency', type=int, default=8)
+		parser.add_argument('--requests', type=int, default=1000)
+		parser.add_argument(
+			'--users', type=int, default=10,
+			help='Seeded users to spread the load over.',
+		)
+		parser.add_argument('--prefix', default='perf')
+		parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+		parser.add_argument('--seed', type=int, default=1)
+		parser.add_argument(
+			'--slow-clients', type=int, default=0,
+			help='Connections uploading slowly during the run.',
+		)
+		parser.add_argument(
+			'--slow-interval', type=float, default=1.0,
+			help='Seconds between bytes sent by slow clients.',
+		)
+		parser.add_argument('--output', help='Write the JSON result here.')
+		parser.add_argument('--baseline', help='Compare with a saved result.')
+
+	def _fixtures(self, options):
+		"""Log in seeded users and collect ids to request."""
+		users = list(
+			get_user_model().objects.filter(
+				email__startswith=f'{options["prefix"]}-',
+			).order_by('id')[:options['users']]
+		)
+		if not users:
+			raise CommandError('No seeded users found, run seed_perf_data first.')
+		fixtures = []
+		for user in users:
+			fixtures.append({
+				'email': user.email,
+				'token': self._token(options['base_url'], user.email),
+				'books': list(Book.objects.filter(
+					user=user,
+				).values_list('id', flat=True)[:200]),
+				'tags': list(Tag.objects.filter(
+					user=user,
+				).values_list('id', flat=True)[:50]),
+			})
+		return fixtures
+
+	def _token(self, base_url, email):
+		"""Fetch a token through the token route and return it."""
+		parts = urlsplit(base_url)
+		connection = http.client.HTTPConnection(
+			parts.hostname, parts.port, timeout=60,
+		)
+		connection.request(
+			'POST', reverse('user:token'),
+			json.dumps({'email': email, 'password': PASSWORD}),
+			{'Content-Type': 'application/json'},
+		)
+		response = connection.getresponse()
+		body = response.read()
+		connection.close()
+		if response.status != 200:
+			raise CommandError(f'Could not log in {email}: HTTP {response.status}')
+		return json.loads(body)['token']
+
+	def _build(self, scenario, fixture, rng):
+		"""Return (method, path, body, token) for one request."""
+		books_url = reverse('book:book-list')
+		token = fixture['token']
+		if scenario == 'list':
+			return 'GET', books_url, None, token
+		if scenario == 'sparse':
+			query = urlencode({'fields': SPARSE_FIELDS})
+			return 'GET', f'{books_url}?{query}', None, token
+		if scenario == 'filter':
+			tag_ids = rng.sample(fixture['tags'], min(2, len(fixture['tags'])))
+			query = urlencode({'tags': ','.join(map(str, tag_ids))})
+			return 'GET', f'{books_url}?{query}', None, token
+		if scenario == 'detail':
+			book_id = rng.choice(fixture['books'])
+			return 'GET', reverse('book:book-detail', args=[book_id]), None, token
+		if scenario == 'token':
+			credentials = {'email': fixture['email'], 'password': PASSWORD}
+			return 'POST', reverse('user:token'), credentials, None
+		return 'POST', books_url, {
+			'title': 'Benchmark book', 'author': 'Load Test', 'category': 'Essay',
+			'number_of_pages': 100, 'language': 'English', 'cost': '9.99',
+			'tags': [{'name': 'benchmark'}],
+		}, token
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		scenarios = [name for name in options['scenarios'].split(',') if name]
+		unknown = set(scenarios) - set(SCENARIOS)
+		if unknown:
+			raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+		fixtures = self._fixtures(options)
+		if 'detail' in scenarios:
+			bookless = [f['email'] for f in fixtures if not f['books']]
+			if bookless:
+				raise CommandError(
+					f'No books to request details of for {", ".join(bookless)}; '
+					'seed more books or leave out the detail scenario.'
+				)
+		results = {name: [] for name in scenarios}
+		errors = {name: 0 for name in scenarios}
+		sizes = {name: [] for name in scenarios}
+		lock = threading.Lock()
+		local = threading.local()
+
+		def run(index):
+			rng = random.Random(options['seed'] * 1000003 + index)
+			scenario = scenarios[index % len(scenarios)]
+			if not hasattr(local, 'client'):
+				local.client = Client(options['base_url'])
+			method, path, body, token = self._build(scenario, rng.choice(fixtures), rng)
+			status, seconds, size = local.client.request(method, path, body, token)
+			with lock:
+				results[scenario].append(seconds * 1000)
+				sizes[scenario].append(size)
+				if not 200 <= status < 300:
+					errors[scenario] += 1
+
+		stop = threading.Event()
+		slow_clients = [
+			threading.Thread(
+				target=trickle, daemon=True,
+				args=(
+					options['base_url'], reverse('book:book-list'),
+					fixtures[index % len(fixtures)]['token'],
+					options['slow_interval'], stop,
+				),
+			)
+			for index in range(options['slow_clients'])
+		]
+		for client in slow_clients:
+			client.start()
+		started = time.perf_counter()
+		try:
+			with ThreadPoolExecutor(options['concurrency']) as executor:
+				list(executor.map(run, range(options['requests'])))
+		finally:
+			stop.set()
+		elapsed = time.perf_counter() - started
+
+		report = {
+			'revision': benchmarking.git_revision(),
+			'finished_at': datetime.now(timezone.utc).isoformat(),
+			'options': {
+				key: options[key]
+				for key in (
+					'base_url', 'concurrency', 'requests', 'users', 'seed',
+					'slow_clients', 'slow_interval',
+				)
+			},
+			'elapsed_s': round(elapsed, 3),
+			'rps': round(options['requests'] / elapsed, 2),
+			'scenarios': {
+				name: dict(
+					benchmarking.summarize(timings),
+					rps=round(len(timings) / elapsed, 2),
+					errors=errors[name],
+					bytes_mean=round(sum(sizes[name]) / max(len(sizes[name]), 1)),
+				)
+				for name, timings in results.items()
+			},
+		}
+		for name, stats in report['scenarios'].items():
+			self.stdout.write(
+				f'{name:<7} n={stats["count"]} rps={stats["rps"]} '
+				f'p50={stats["p50_ms"]}ms p95={stats["p95_ms"]}ms '
+				f'p99={stats["p99_ms"]}ms bytes={stats["bytes_mean"]} '
+				f'errors={stats["errors"]}'
+			)
+		self.stdout.write(f'total   rps={report["rps"]} in {report["elapsed_s"]}s')
+		if options['baseline']:
+			report['baseline_changes'] = benchmarking.compare(
+				report, benchmarking.load(options['baseline']),
+			)
+			for name, change in report['baseline_changes'].items():
+				self.stdout.write(
+					f'{name:<7} p95 {percent(change["p95_change"])} '
+					f'rps {percent(change["rps_change"])} vs baseline'
+				)
+		if options['output']:
+			with open(options['output'], 'w') as output:
+				json.dump(report, output, indent=2)
@@ -0,0 +1,171 @@
+"""
+Django command to compare worker start-up with and without warm boot.
+"""
+
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core.benchmarking import summarize
+
+MODES = {'cold': '0', 'warm': '1'}
+
+
+def server_command(server, port, workers):
+	"""Return the argv starting ``server`` the way scripts/run.sh does."""
+	if server == 'gunicorn':
+		return [
+			'gunicorn', 'app.asgi:application',
+			'--worker-class', 'uvicorn.workers.UvicornWorker', '--preload',
+			'--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+		]
+	return [
+		'uwsgi', '--http-socket', f'127.0.0.1:{port}', '--workers', str(workers),
+		'--master', '--enable-threads', '--module', 'app.wsgi', '--disable-logging',
+	]
+
+
+def children(pid):
+	"""Return the pids of the direct children of ``pid``."""
+	found = []
+	for entry in os.listdir('/proc'):
+		if not entry.isdigit():
+			continue
+		try:
+			with open(f'/proc/{entry}/stat') as stat:
+				# The command name may hold spaces; fields resume after ')'.
+				ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+		except (OSError, IndexError, ValueError):
+			continue
+		if ppid == pid:
+			found.append(int(entry))
+	return found
+
+
+def memory(pid):
+	"""Return Rss, Pss and private memory of ``pid`` in KiB."""
+	values = {}
+	with open(f'/proc/{pid}/smaps_rollup') as rollup:
+		for line in rollup:
+			name, _, rest = line.partition(':')
+			if rest.strip().endswith('kB'):
+				values[name] = int(rest.split()[0])
+	return {
+		'rss_kb': values['Rss'],
+		'pss_kb': values['Pss'],
+		'private_kb': values['Private_Clean'] + values['Private_Dirty'],
+	}
+
+
+class Command(BaseCommand):
+	"""Command to measure boot time, first requests and worker memory"""
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--server', choices=['uwsgi', 'gunicorn'], default='uwsgi',
+		)
+		parser.add_argument('--workers', type=int, default=4)
+		parser.add_argument('--port', type=int, default=8020)
+		parser.add_argument('--requests', type=int, default=200)
+		parser.add_argument(
+			'--mode', action='append', choices=sorted(MODES),
+			help='Mode to run, may be repeated (default: both).',
+		)
+
+	def _request(self, port, path, token=None):
+		"""Send one GET and return (status, ms)."""
+		connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+		headers = {'Authorization': f'Token {token}'} if token else {}
+		began = time.perf_counter()
+		try:
+			connection.request('GET', path, headers=headers)
+			response = connection.getresponse()
+			response.read()
+			return response.status, (time.perf_counter() - began) * 1000
+		finally:
+			connection.close()
+
+	def _wait_ready(self, process, port, timeout=60):
+		"""Poll /healthz until it answers; return seconds since start."""
+		began = time.perf_counter()
+		while time.perf_counter() - began < timeout:
+			if process.poll() is not None:
+				raise CommandError(f'Server exited with {process.returncode}.')
+			try:
+				if self._request(port, '/healthz')[0] == 200:
+					return time.perf_counter() - began
+			except OSError:
+				pass
+			time.sleep(0.02)
+		raise CommandError('Server did not become ready.')
+
+	def _run(self, mode, options, token):
+		"""Start the server in ``mode`` and return its measurements."""
+		env = dict(
+			os.environ, WARM_BOOT=MODES[mode], ALLOWED_HOSTS='127.0.0.1',
+			SERVER_MODE='asgi' if options['server'] == 'gunicorn' else 'uwsgi',
+		)
+		process = subprocess.Popen(
+			server_command(options['server'], options['port'], options['workers']),
+			env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+		)
+		path = reverse('book:book-list') + '?fields=id'
+		try:
+			boot = self._wait_ready(process, options['port'])
+			# One request per worker: each is the first that worker serves.
+			with ThreadPoolExecutor(options['workers']) as executor:
+				first = list(executor.map(
+					lambda _: self._request(options['port'], path, token)[1],
+					range(options['workers']),
+				))
+			later = [
+				self._request(options['port'], path, token)[1]
+				for _ in range(options['requests'])
+			]
+			workers = [memory(pid) for pid in children(process.pid)]
+		finally:
+			process.send_signal(signal.SIGINT)
+			process.wait(30)
+		return {
+			'boot_s': round(boot, 3),
+			'first': dict(summarize(first), max_ms=round(max(first), 3)),
+			'later': summarize(later),
+			'workers': workers,
+		}
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		if not sys.platform.startswith('linux'):
+			raise CommandError('Worker memory is read from /proc, Linux only.')
+		users = get_user_model().objects.filter(book__isnull=False)
+		user = users.order_by('id').first()
+		if user is None:
+			raise CommandError('No user with books, run seed_perf_data first.')
+		token = Token.objects.get_or_create(user=user)[0].key
+		for mode in options['mode'] or list(MODES):
+			result = self._run(mode, options, token)
+			workers = result['workers'] or [{}]
+			mean = {
+				key: round(
+					sum(worker.get(key, 0) for worker in workers)
+					/ len(workers) / 1024, 1,
+				)
+				for key in ('rss_kb', 'pss_kb', 'private_kb')
+			}
+			self.stdout.write(
+				f'{mode:<5} boot={result["boot_s"]}s '
+				f'first p50={result["first"]["p50_ms"]}ms '
+				f'max={result["first"]["max_ms"]}ms '
+				f'later p50={result["later"]["p50_ms"]}ms '
+				f'worker rss={mean["rss_kb"]}MiB pss={mean["pss_kb"]}MiB '
+				f'private={mean["private_kb"]}MiB'
+			)
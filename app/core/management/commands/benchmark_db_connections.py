@@ -0,0 +1,64 @@
+"""
+Django command to measure DB connection overhead per request.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.benchmarking import summarize
+
+
+MODES = {
+	'new': {'CONN_MAX_AGE': 0, 'POOL': None},
+	'persistent': {'CONN_MAX_AGE': None, 'POOL': None},
+	'pooled': {'CONN_MAX_AGE': 0, 'POOL': {'min_size': 1, 'max_size': 4}},
+}
+
+
+class Command(BaseCommand):
+	"""Command to compare new, persistent and pooled connections"""
+
+	def add_arguments(self, parser):
+		parser.add_argument('--requests', type=int, default=200)
+		parser.add_argument('--database', default='default')
+		parser.add_argument(
+			'--mode', action='append', choices=sorted(MODES),
+			help='Mode to run, may be repeated (default: all).',
+		)
+
+	def _wrapper(self, database, mode):
+		"""Build a standalone connection wrapper for one mode."""
+		base = connections[database]
+		settings_dict = dict(base.settings_dict, **MODES[mode])
+		return type(base)(settings_dict, alias=f'{database}-bench-{mode}')
+
+	def _simulate_requests(self, wrapper, count):
+		"""Run ``count`` request cycles and return their durations in ms."""
+		timings = []
+		for _ in range(count):
+			start = time.perf_counter()
+			wrapper.close_if_unusable_or_obsolete()
+			with wrapper.cursor() as cursor:
+				cursor.execute('SELECT 1')
+				cursor.fetchone()
+			wrapper.close_if_unusable_or_obsolete()
+			timings.append((time.perf_counter() - start) * 1000)
+		return timings
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		for mode in options['mode'] or list(MODES):
+			wrapper = self._wrapper(options['database'], mode)
+			try:
+				timings = self._simulate_requests(wrapper, options['requests'])
+			finally:
+				wrapper.close()
+				if wrapper.pool is not None:
+					wrapper.pool.closeall()
+			stats = summarize(timings)
+			self.stdout.write(
+				f'{mode:<11} mean={stats["mean_ms"]:.3f}ms '
+				f'p50={stats["p50_ms"]:.3f}ms p95={stats["p95_ms"]:.3f}ms'
+			)
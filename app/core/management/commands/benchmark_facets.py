@@ -0,0 +1,85 @@
+"""
+Django command to compare facet counting in one grouped pass and per facet.
+"""
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Func
+
+from book.filters import FACETS, facet_counts
+from core.benchmarking import summarize
+from core.models import Book
+
+
+class Unnest(Func):
+	"""Postgres unnest(), one row per array element."""
+
+	function = 'unnest'
+
+
+def separate_counts(queryset, facets):
+	"""Count each facet in its own GROUP BY query, the naive way."""
+	result = {}
+	for facet in facets:
+		if facet == 'tags':
+			rows = queryset.order_by().annotate(
+				tag=Unnest('tag_ids'),
+			).values('tag').annotate(count=Count('id'))
+		else:
+			rows = queryset.order_by().values(facet).annotate(count=Count('id'))
+		result[facet] = list(rows)
+	return result
+
+
+class Command(BaseCommand):
+	"""Command to time facet counts over the books of the largest user"""
+
+	def add_arguments(self, parser):
+		parser.add_argument('--runs', type=int, default=30)
+		parser.add_argument(
+			'--filter', action='append', default=[], metavar='FIELD=VALUE',
+			help='Book filter applied before counting, may be repeated.',
+		)
+
+	def _time(self, function, runs):
+		"""Call ``function`` ``runs`` times and return durations in ms."""
+		timings = []
+		for _ in range(runs):
+			began = time.perf_counter()
+			function()
+			timings.append((time.perf_counter() - began) * 1000)
+		return timings
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		user = get_user_model().objects.filter(book__isnull=False).annotate(
+			books=Count('book'),
+		).order_by('-books').first()
+		if user is None:
+			raise CommandError('No user with books, run seed_perf_data first.')
+		filters = dict(item.split('=', 1) for item in options['filter'])
+		queryset = Book.objects.filter(user=user, **filters)
+		self.stdout.write(
+			f'user={user.email} books={queryset.count()} filters={filters}'
+		)
+
+		facets = list(FACETS)
+		for name, function in [
+			('grouped', lambda: facet_counts(queryset, facets)),
+			('separate', lambda: separate_counts(queryset, facets)),
+		]:
+			function()
+			stats = summarize(self._time(function, options['runs']))
+			self.stdout.write(
+				f'{name:<8} p50={stats["p50_ms"]}ms p95={stats["p95_ms"]}ms '
+				f'mean={stats["mean_ms"]}ms'
+			)
+
+		sql, params = queryset.order_by().values('id').query.sql_with_params()
+		with connection.cursor() as cursor:
+			cursor.execute(f'EXPLAIN {sql}', params)
+			plan = '\n'.join(row[0] for row in cursor.fetchall())
+		self.stdout.write(plan)
@@ -0,0 +1,18 @@
+"""
+Django command to precompute the OpenAPI schema before serving requests.
+"""
+
+from django.core.management.base import BaseCommand
+
+from core import schema
+
+
+class Command(BaseCommand):
+	"""Command to build and cache the OpenAPI schema"""
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		schema.warm()
+		self.stdout.write(self.style.SUCCESS(
+			f'Schema cached for code version {schema.code_version()}'
+		))
@@ -0,0 +1,180 @@
+"""
+Django command to create users from a CSV file in bulk.
+"""
+
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections, transaction
+from rest_framework.authtoken.models import Token
+
+# Passwords handed to a worker at a time, small enough to keep every
+# worker busy on short files.
+HASH_CHUNK = 50
+
+
+def hash_password(password):
+	"""Hash one password; runs in a worker process."""
+	# Empty passwords get an unusable one, like create_user(password=None).
+	return make_password(password or None)
+
+
+def read_rows(path):
+	"""Return {email: row} of the CSV, normalized and deduplicated."""
+	normalize = get_user_model().objects.normalize_email
+	rows = {}
+	with open(path, newline='', encoding='utf-8') as file:
+		reader = csv.DictReader(file)
+		missing = {'email', 'password'} - set(reader.fieldnames or ())
+		if missing:
+			raise CommandError(f'Missing columns: {", ".join(sorted(missing))}.')
+		for line, row in enumerate(reader, start=2):
+			email = normalize((row['email'] or '').strip())
+			if not email:
+				raise CommandError(f'Line {line}: an email is required.')
+			# A later line for the same email wins.
+			rows[email] = {
+				'email': email,
+				'password': row['password'] or '',
+				'name': (row.get('name') or '').strip(),
+			}
+	return rows
+
+
+def find_users(emails):
+	"""Return {email: user} of the users with ``emails``."""
+	users = get_user_model().objects.filter(email__in=emails)
+	return {user.email: user for user in users.only('pk', 'email', 'name')}
+
+
+def batches(items, size):
+	for start in range(0, len(items), size):
+		yield items[start:start + size]
+
+
+class Command(BaseCommand):
+	"""Command to create users from email,password[,name] rows"""
+
+	def add_arguments(self, parser):
+		parser.add_argument('path', help='CSV file with a header row.')
+		parser.add_argument(
+			'--batch', type=int, default=1000,
+			help='Users written per transaction.',
+		)
+		parser.add_argument(
+			'--workers', type=int, default=os.cpu_count(),
+			help='Processes hashing passwords in parallel.',
+		)
+		parser.add_argument(
+			'--update', action='store_true',
+			help='Set password and name of existing emails instead of '
+			'skipping them.',
+		)
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		started = time.perf_counter()
+		self.update = options['update']
+		rows = read_rows(options['path'])
+		existing = {}
+		for emails in batches(list(rows), options['batch']):
+			existing.update(find_users(emails))
+		if not self.update:
+			rows = {
+				email: row for email, row in rows.items()
+				if email not in existing
+			}
+		passwords = [row['password'] for row in rows.values()]
+
+		pool = None
+		if options['workers'] > 1 and len(passwords) > HASH_CHUNK:
+			# Children only hash; they must not share the parent's connections.
+			connections.close_all()
+			pool = multiprocessing.get_context('fork').Pool(options['workers'])
+		created = updated = 0
+		try:
+			# With a pool, batches are written while it hashes the next ones.
+			hashed = (
+				pool.imap(hash_password, passwords, HASH_CHUNK) if pool
+				else map(hash_password, passwords)
+			)
+			for job in batches(list(rows.values()), options['batch']):
+				batch = list(itertools.islice(hashed, len(job)))
+				created, updated = self.write(
+					job, batch, existing, created, updated,
+				)
+			if pool is not None:
+				pool.close()
+				pool.join()
+		finally:
+			if pool is not None:
+				# Stops the workers still hashing after an error.
+				pool.terminate()
+
+		elapsed = time.perf_counter() - started
+		done = created + updated
+		self.stdout.write(self.style.SUCCESS(
+			f'Created {created} users, updated {updated}, skipped '
+			f'{len(existing) - updated} in {elapsed:.1f}s '
+			f'({done / elapsed:.0f} users/s).'
+		))
+
+	def write(self, job, hashed, existing, created, updated):
+		"""Write one batch of rows with hashed passwords, return counts."""
+		try:
+			return self.write_batch(job, hashed, existing, created, updated)
+		except IntegrityError:
+			# Some emails may have been created by someone else since they
+			# were looked up; they are existing users from now on.
+			raced = find_users([
+				row['email'] for row in job if row['email'] not in existing
+			])
+			if not raced:
+				raise
+		existing.update(raced)
+		self.stderr.write(
+			f'{len(raced)} users were created meanwhile, '
+			f'{"updating" if self.update else "skipping"} them.'
+		)
+		if not self.update:
+			pairs = [
+				(row, password) for row, password in zip(job, hashed)
+				if row['email'] not in raced
+			]
+			job = [row for row, _ in pairs]
+			hashed = [password for _, password in pairs]
+		return self.write_batch(job, hashed, existing, created, updated)
+
+	def write_batch(self, job, hashed, existing, created, updated):
+		"""Write rows in one transaction, return counts."""
+		user_model = get_user_model()
+		new, changed = [], []
+		for row, password in zip(job, hashed):
+			user = existing.get(row['email'])
+			if user is None:
+				new.append(user_model(
+					email=row['email'], name=row['name'], password=password,
+				))
+			else:
+				user.name = row['name'] or user.name
+				user.password = password
+				changed.append(user)
+		with transaction.atomic():
+			user_model.objects.bulk_create(new)
+			user_model.objects.bulk_update(changed, ['name', 'password'])
+			Token.objects.bulk_create(
+				[
+					Token(user=user, key=Token.generate_key())
+					for user in new + changed
+				],
+				# Updated users may have a token already.
+				ignore_conflicts=True,
+			)
+		self.stdout.write(f'{created + updated + len(job)} users')
+		return created + len(new), updated + len(changed)
@@ -0,0 +1,60 @@
+"""
+Django command to compact the sync change log.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+# An entry is superseded by a later one for the same object: clients at
+# any cursor before it receive the later entry and the current state.
+DELETE_SUPERSEDED = """
+	DELETE FROM core_change AS old
+	USING core_change AS new
+	WHERE new.user_id = old.user_id
+		AND new.kind = old.kind
+		AND new.object_id = old.object_id
+		AND new.seq > old.seq
+"""
+
+# Clients with a cursor before a dropped tombstone would miss the delete,
+# so the floor moves past it and their next sync asks for a full fetch.
+DELETE_TOMBSTONES = """
+	WITH expired AS (
+		DELETE FROM core_change
+		WHERE deleted AND created_at < %s
+		RETURNING user_id, seq
+	)
+	UPDATE core_syncstate AS state
+	SET floor_seq = GREATEST(state.floor_seq, expired.seq)
+	FROM (
+		SELECT user_id, max(seq) AS seq FROM expired GROUP BY user_id
+	) AS expired
+	WHERE state.user_id = expired.user_id
+"""
+
+
+class Command(BaseCommand):
+	"""Command to drop superseded entries and old tombstones"""
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--days', type=int, default=settings.SYNC_TOMBSTONE_DAYS,
+			help='Keep tombstones younger than this.',
+		)
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		cutoff = timezone.now() - timedelta(days=options['days'])
+		with transaction.atomic(), connection.cursor() as cursor:
+			cursor.execute(DELETE_SUPERSEDED)
+			superseded = cursor.rowcount
+			cursor.execute(DELETE_TOMBSTONES, [cutoff])
+			floors = cursor.rowcount
+		self.stdout.write(self.style.SUCCESS(
+			f'Removed {superseded} superseded entries, '
+			f'expired tombstones of {floors} users.'
+		))
@@ -0,0 +1,19 @@
+"""
+Django command to delete expired idempotency keys.
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+	"""Command to sweep stored Idempotency-Key responses past their TTL"""
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		deleted, _ = IdempotencyKey.objects.filter(
+			expires_at__lte=timezone.now(),
+		).delete()
+		self.stdout.write(self.style.SUCCESS(f'Removed {deleted} expired keys.'))
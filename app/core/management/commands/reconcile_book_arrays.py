@@ -0,0 +1,50 @@
+"""
+Django command to repair the denormalized tag/review arrays on books.
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.models import Book
+from core.signals import BATCH_SIZE, collect_book_arrays
+
+
+class Command(BaseCommand):
+	"""Command to rebuild Book.tag_ids, tag_names and review_ids"""
+
+	def add_arguments(self, parser):
+		parser.add_argument('--user', type=int, help='Only check this user id.')
+		parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+		parser.add_argument(
+			'--dry-run', action='store_true',
+			help='Report drifted books without fixing them.',
+		)
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		queryset = Book.objects.only('pk', 'tag_ids', 'tag_names', 'review_ids')
+		if options['user'] is not None:
+			queryset = queryset.filter(user_id=options['user'])
+		checked = drifted = 0
+		last_pk = 0
+		while True:
+			batch = list(
+				queryset.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']]
+			)
+			if not batch:
+				break
+			last_pk = batch[-1].pk
+			expected = collect_book_arrays([book.pk for book in batch])
+			stale = []
+			for book in batch:
+				arrays = expected[book.pk]
+				if (book.tag_ids, book.tag_names, book.review_ids) != arrays:
+					book.tag_ids, book.tag_names, book.review_ids = arrays
+					stale.append(book)
+			if stale and not options['dry_run']:
+				Book.objects.bulk_update(stale, ['tag_ids', 'tag_names', 'review_ids'])
+			checked += len(batch)
+			drifted += len(stale)
+		action = 'found' if options['dry_run'] else 'fixed'
+		self.stdout.write(self.style.SUCCESS(
+			f'Checked {checked} books, {action} {drifted} out of sync.'
+		))
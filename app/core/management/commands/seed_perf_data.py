@@ -0,0 +1,207 @@
+"""
+Django command to generate a large synthetic library for benchmarks.
+"""
+
+import io
+import multiprocessing
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+
+from core.models import Book, Tag
+
+PASSWORD = 'perfpass123'
+CATEGORIES = [choice for choice, _ in Book.TYPES_OF_BOOKS]
+LANGUAGES = ['Polski', 'English', 'Deutsch', 'Cesky', 'Hindi', 'Espanol']
+WORDS = [
+	'night', 'river', 'empire', 'garden', 'winter', 'stone', 'letter', 'war',
+	'silence', 'city', 'sea', 'mountain', 'shadow', 'journey', 'house', 'fire',
+]
+
+
+def power_law_split(total, parts, alpha, rng):
+	"""Split ``total`` into ``parts`` Pareto-distributed non-negative ints."""
+	weights = [rng.paretovariate(alpha) for _ in range(parts)]
+	scale = total / sum(weights)
+	counts = [int(weight * scale) for weight in weights]
+	for index in rng.sample(range(parts), total - sum(counts)):
+		counts[index] += 1
+	return counts
+
+
+def copy_rows(cursor, table, columns, rows):
+	"""Stream rows into ``table`` with COPY, much faster than INSERT."""
+	buffer = io.StringIO()
+	for row in rows:
+		buffer.write('\t'.join(row))
+		buffer.write('\n')
+	buffer.seek(0)
+	cursor.copy_expert(
+		f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer,
+	)
+
+
+def pg_array(values):
+	"""Format values as a PostgreSQL array literal for COPY."""
+	return '{' + ','.join(f'"{value}"' for value in values) + '}'
+
+
+def reserve_ids(cursor, table, count):
+	"""Take ``count`` ids from the table's sequence, safe across processes."""
+	cursor.execute(
+		f"SELECT nextval(pg_get_serial_sequence('{table}', 'id')) "
+		f"FROM generate_series(1, %s)",
+		[count],
+	)
+	return [row[0] for row in cursor.fetchall()]
+
+
+def seed_chunk(job):
+	"""Seed one chunk of users; runs in a worker process."""
+	chunk_index, first, counts, options = job
+	rng = random.Random(f'{options["seed"]}-{chunk_index}')
+	user_model = get_user_model()
+	users = [
+		user_model(
+			email=f'{options["prefix"]}-{first + offset}@example.com',
+			name=f'Perf user {first + offset}',
+			password=options['password'],
+		)
+		for offset in range(len(counts))
+	]
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute('SET LOCAL synchronous_commit TO OFF')
+		user_model.objects.bulk_create(users)
+		seed_libraries(cursor, users, counts, rng)
+	return sum(counts)
+
+
+def seed_libraries(cursor, users, counts, rng):
+	"""Create tags, reviews, books and M2M links for a chunk of users."""
+	tags = []
+	for user in users:
+		for index in range(min(50, 3 + int(rng.paretovariate(1.5)))):
+			tags.append(Tag(user=user, name=f'{rng.choice(WORDS)}-{index}'))
+	Tag.objects.bulk_create(tags)
+	tags_by_user = {}
+	for tag in tags:
+		tags_by_user.setdefault(tag.user_id, []).append(tag)
+
+	review_rows = [
+		(user.pk, ' '.join(rng.choices(WORDS, k=12)))
+		for user, count in zip(users, counts)
+		for _ in range(int(count * 0.3))
+	]
+	review_ids = reserve_ids(cursor, 'core_review', len(review_rows))
+	reviews_by_user = {}
+	for review_id, (user_id, _) in zip(review_ids, review_rows):
+		reviews_by_user.setdefault(user_id, []).append(review_id)
+	copy_rows(cursor, 'core_review', ['id', 'user_id', 'name'], (
+		(str(review_id), str(user_id), name)
+		for review_id, (user_id, name) in zip(review_ids, review_rows)
+	))
+
+	book_ids = iter(reserve_ids(cursor, 'core_book', sum(counts)))
+	books, book_tags, book_reviews = [], [], []
+	for user, count in zip(users, counts):
+		user_tags = tags_by_user.get(user.pk, [])
+		# Zipf-like preference for a user's first tags.
+		weights = [1 / (rank + 1) for rank in range(len(user_tags))]
+		user_reviews = reviews_by_user.get(user.pk, [])
+		for _ in range(count):
+			book_id = next(book_ids)
+			chosen = sorted(
+				set(rng.choices(user_tags, weights, k=rng.randint(0, 4))),
+				key=lambda tag: tag.pk,
+			) if user_tags else []
+			linked = [user_reviews.pop()] if user_reviews and rng.random() < 0.5 else []
+			books.append((
+				str(book_id), str(user.pk),
+				' '.join(rng.choices(WORDS, k=3)).title(),
+				f'Author {rng.randint(1, 5000)}', '',
+				rng.choice(CATEGORIES), str(rng.randint(40, 1200)),
+				rng.choice(LANGUAGES), str(Decimal(rng.randint(100, 9999)) / 100),
+				'',
+				pg_array(tag.pk for tag in chosen),
+				pg_array(tag.name for tag in chosen),
+				pg_array(linked),
+			))
+			book_tags.extend((str(book_id), str(tag.pk)) for tag in chosen)
+			book_reviews.extend((str(book_id), str(pk)) for pk in linked)
+	copy_rows(cursor, 'core_book', [
+		'id', 'user_id', 'title', 'author', 'description', 'category',
+		'number_of_pages', 'language', 'cost', 'link',
+		'tag_ids', 'tag_names', 'review_ids',
+	], books)
+	copy_rows(cursor, 'core_book_tags', ['book_id', 'tag_id'], book_tags)
+	copy_rows(cursor, 'core_book_reviews', ['book_id', 'review_id'], book_reviews)
+
+
+class Command(BaseCommand):
+	"""Command to seed users, books, tags and reviews in bulk"""
+
+	def add_arguments(self, parser):
+		parser.add_argument('--users', type=int, default=1000)
+		parser.add_argument('--books', type=int, default=100000)
+		parser.add_argument(
+			'--alpha', type=float, default=1.3,
+			help='Pareto shape of books per user.',
+		)
+		parser.add_argument('--seed', type=int, default=42)
+		parser.add_argument(
+			'--chunk', type=int, default=200,
+			help='Users written per transaction.',
+		)
+		parser.add_argument(
+			'--workers', type=int, default=1,
+			help='Processes writing chunks in parallel.',
+		)
+		parser.add_argument('--prefix', default='perf')
+
+	def handle(self, *args, **options):
+		"""Entry for command"""
+		started = time.perf_counter()
+		first = get_user_model().objects.filter(
+			email__startswith=f'{options["prefix"]}-'
+		).count()
+		books_per_user = power_law_split(
+			options['books'], options['users'], options['alpha'],
+			random.Random(options['seed']),
+		)
+		job_options = {
+			'seed': options['seed'],
+			'prefix': options['prefix'],
+			'password': make_password(PASSWORD),
+		}
+		chunk = options['chunk']
+		jobs = [
+			(
+				index, first + start, books_per_user[start:start + chunk],
+				job_options,
+			)
+			for index, start in enumerate(range(0, options['users'], chunk))
+		]
+		written = 0
+		if options['workers'] > 1:
+			# Children must open their own connections.
+			connections.close_all()
+			context = multiprocessing.get_context('fork')
+			with context.Pool(options['workers']) as pool:
+				for count in pool.imap_unordered(seed_chunk, jobs):
+					written += count
+					self.stdout.write(f'{written} books')
+		else:
+			for job in jobs:
+				written += seed_chunk(job)
+				self.stdout.write(f'{written} books')
+		elapsed = time.perf_counter() - started
+		self.stdout.write(self.style.SUCCESS(
+			f'Seeded {options["users"]} users and {written} books in '
+			f'{elapsed:.1f}s ({written / elapsed:.0f} books/s). '
+			f'Password: {PASSWORD}'
+		))
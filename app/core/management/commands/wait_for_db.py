@@ -2,26 +2,56 @@
 Django command to wait for the DB to be available.
 """
 
+import random
 import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.db.utils import OperationalError
 
 from psycopg2 import OperationalError as Psycopg2OpError
 
+from core import health
+
 
 class Command(BaseCommand):
 	"""Command to wait for DB"""
 
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--timeout', type=float, default=60,
+			help='Give up after this many seconds.',
+		)
+		parser.add_argument(
+			'--max-delay', type=float, default=5,
+			help='Longest pause between attempts.',
+		)
+
+	def ping(self):
+		"""Open a connection and run a trivial query."""
+		try:
+			health.ping()
+		finally:
+			connections[DEFAULT_DB_ALIAS].close()
+
 	def handle(self, *args, **options):
 		"""Entry for command"""
 		self.stdout.write('Waiting for DB...')
-		db_up = False
-		while db_up is False:
+		deadline = time.monotonic() + options['timeout']
+		delay = 0.1
+		while True:
 			try:
-				self.check(databases=['default'])
-				db_up = True
+				self.ping()
+				break
 			except (Psycopg2OpError, OperationalError):
-				self.stdout.write('Database unavailable, waiting one sec...')
-				time.sleep(1)
-		self.stdout.write(self.style.SUCCESS('Data is here!'))
\ No newline at end of file
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					raise CommandError(
+						f'Database unavailable after {options["timeout"]:g}s.'
+					)
+				# Full jitter keeps restarting containers from retrying in step.
+				pause = min(random.uniform(0, delay), remaining)
+				self.stdout.write(f'Database unavailable, retrying in {pause:.2f}s...')
+				time.sleep(pause)
+				delay = min(delay * 2, options['max_delay'])
+		self.stdout.write(self.style.SUCCESS('Data is here!'))
@@ -0,0 +1,81 @@
+"""
+Prometheus metrics of the API process.
+
+Under uwsgi set PROMETHEUS_MULTIPROC_DIR to an empty directory before the
+workers start; every worker then writes its samples to memory-mapped
+files there and ``/metrics`` aggregates them.
+"""
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests handled.',
+    ['route', 'method', 'status'],
+)
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency.',
+    ['route', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Counter(
+    'db_queries_total', 'SQL queries executed.', ['route'],
+)
+DB_QUERY_SECONDS = Counter(
+    'db_query_seconds_total', 'Time spent executing SQL.', ['route'],
+)
+STATEMENT_CANCELS = Counter(
+    'db_statement_cancels_total',
+    'SQL statements cancelled by a statement timeout or client disconnect.',
+    ['route', 'reason'],
+)
+COALESCED_REQUESTS = Counter(
+    'coalesced_requests_total',
+    'Reads answered with the data of an identical concurrent request.',
+    ['route', 'scope'],
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by result.', ['cache', 'result'],
+)
+AUTH_FAILURES = Counter(
+    'auth_failures_total', 'Failed authentication attempts.', ['reason'],
+)
+UPLOAD_BYTES = Counter(
+    'upload_bytes_total', 'Bytes of uploaded files stored.', ['route'],
+)
+EVENT_STREAMS = Gauge(
+    'event_streams_open', 'Server-sent event streams open right now.',
+    multiprocess_mode='livesum',
+)
+IMAGES_IN_PROGRESS = Gauge(
+    'image_processing_in_progress', 'Book images being processed right now.',
+    multiprocess_mode='livesum',
+)
+
+
+def route_name(request):
+    """Return the URL name of a request, bounded to known routes."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.view_name:
+        return 'unmatched'
+    return match.view_name
+
+
+def render():
+    """Return the exposition text and content type for all workers."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
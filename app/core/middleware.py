@@ -0,0 +1,343 @@
+"""
+Middleware shared by all apps.
+
+Every class here is sync and async capable. Under ASGI Django only builds
+an async chain when all middleware are; a single sync one makes it run
+the whole request in a thread, and coroutine views would gain nothing.
+In an async chain the database connections belong to the request's sync
+thread, where Django runs sync views and core.asyncviews runs the ORM, so
+execute wrappers and other database work are handed to that thread.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+
+from core import (
+    compression, health, instrumentation, metrics, profiling, querywatch,
+)
+from core.db import routers
+
+logger = logging.getLogger(__name__)
+
+
+def enter_wrappers(stack, wrapper):
+    """Install ``wrapper`` on every connection of this thread."""
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+class HybridMiddleware:
+    """Base of middleware running in the mode of the chain around it.
+
+    Subclasses implement ``process`` and, as a coroutine, ``aprocess``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Marks instances as coroutine functions, like MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.aprocess(request)
+        return self.process(request)
+
+    async def wrapped(self, request, wrapper):
+        """Await the response with ``wrapper`` on the request's connections."""
+        stack = ExitStack()
+        await sync_to_async(enter_wrappers)(stack, wrapper)
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+
+
+class HealthCheckMiddleware(HybridMiddleware):
+    """Answer /healthz and /readyz before any other middleware.
+
+    Probes skip host validation, sessions, auth and metrics: they come
+    from the proxy or orchestrator, often by IP, and many times a second.
+    /healthz only says the process serves requests; /readyz also checks
+    the database and migrations, see core.health.
+    """
+
+    def probe(self, request):
+        if request.path == '/healthz':
+            return JsonResponse({'status': 'ok'})
+        ready, checks = health.readiness()
+        return JsonResponse(
+            {'status': 'ok' if ready else 'unavailable', 'checks': checks},
+            status=200 if ready else 503,
+        )
+
+    def process(self, request):
+        if request.path in ('/healthz', '/readyz'):
+            return self.probe(request)
+        return self.get_response(request)
+
+    async def aprocess(self, request):
+        if request.path in ('/healthz', '/readyz'):
+            return await sync_to_async(self.probe)(request)
+        return await self.get_response(request)
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """Profile requests of staff members asking for it, see core.profiling."""
+
+    def label(self, request, response, profile_id):
+        response['X-Profile-Id'] = profile_id
+        response['X-Profile-Url'] = request.build_absolute_uri(
+            reverse('debug_profile', args=[profile_id]),
+        )
+        return response
+
+    def process(self, request):
+        if not profiling.requested(request):
+            return self.get_response(request)
+        user = profiling.staff_user(request)
+        if user is None:
+            return self.get_response(request)
+        response, profile_id = profiling.profile(
+            self.get_response, request, user,
+        )
+        return self.label(request, response, profile_id)
+
+    async def aprocess(self, request):
+        if not profiling.requested(request):
+            return await self.get_response(request)
+        user = await sync_to_async(profiling.staff_user)(request)
+        if user is None:
+            return await self.get_response(request)
+        # cProfile follows one thread, so the rest of the chain is driven
+        # from the request's sync thread, where its sync code runs too.
+        response, profile_id = await sync_to_async(profiling.profile)(
+            async_to_sync(self.get_response), request, user,
+        )
+        return self.label(request, response, profile_id)
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """Let safe requests read from replicas, pin writers to primary."""
+
+    def process(self, request):
+        token = routers.begin_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            routers.end_request(token)
+
+    async def aprocess(self, request):
+        token = routers.begin_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(routers.pin_writer)(
+                routers.finish_request(token),
+            )
+
+
+class ServerTimingMiddleware(HybridMiddleware):
+    """Time a sample of requests, report via Server-Timing and the log."""
+
+    def process(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        token = instrumentation.start()
+        try:
+            with ExitStack() as stack:
+                enter_wrappers(stack, instrumentation.sql_wrapper)
+                response = self.get_response(request)
+        finally:
+            timings = instrumentation.stop(token)
+        return self.report(request, response, timings)
+
+    async def aprocess(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return await self.get_response(request)
+        token = instrumentation.start()
+        try:
+            response = await self.wrapped(request, instrumentation.sql_wrapper)
+        finally:
+            timings = instrumentation.stop(token)
+        return self.report(request, response, timings)
+
+    def report(self, request, response, timings):
+        response['Server-Timing'] = timings.server_timing()
+        match = request.resolver_match
+        logger.info(json.dumps(dict(
+            timings.as_dict(),
+            method=request.method,
+            route=match.view_name if match else None,
+            status=response.status_code,
+        )))
+        return response
+
+    def process_template_response(self, request, response):
+        """Time rendering of DRF and template responses."""
+        timings = instrumentation.current()
+        if timings is not None:
+            began = time.perf_counter()
+            response.add_post_render_callback(lambda r: timings.add(
+                'render', (time.perf_counter() - began) * 1000,
+            ))
+        return response
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Count requests, latency and SQL per route for /metrics."""
+
+    def process(self, request):
+        counter = SQLCounter()
+        began = time.perf_counter()
+        status = 500
+        try:
+            with ExitStack() as stack:
+                enter_wrappers(stack, counter)
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self.record(request, began, status, counter)
+
+    async def aprocess(self, request):
+        counter = SQLCounter()
+        began = time.perf_counter()
+        status = 500
+        try:
+            response = await self.wrapped(request, counter)
+            status = response.status_code
+            return response
+        finally:
+            self.record(request, began, status, counter)
+
+    def record(self, request, began, status, counter):
+        route = metrics.route_name(request)
+        metrics.REQUEST_LATENCY.labels(route, request.method).observe(
+            time.perf_counter() - began
+        )
+        metrics.REQUESTS.labels(route, request.method, status).inc()
+        if counter.count:
+            metrics.DB_QUERIES.labels(route).inc(counter.count)
+            metrics.DB_QUERY_SECONDS.labels(route).inc(counter.seconds)
+        if status == 401:
+            metrics.AUTH_FAILURES.labels('unauthorized').inc()
+
+
+class SQLCounter:
+    """Execute wrapper counting queries and their duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - began
+
+
+class QueryWatchMiddleware(HybridMiddleware):
+    """Flag N+1 queries, slow queries and views over their query budget."""
+
+    def process(self, request):
+        watcher = querywatch.QueryWatcher()
+        with ExitStack() as stack:
+            enter_wrappers(stack, watcher)
+            response = self.get_response(request)
+        return self.check(request, response, watcher)
+
+    async def aprocess(self, request):
+        watcher = querywatch.QueryWatcher()
+        response = await self.wrapped(request, watcher)
+        return self.check(request, response, watcher)
+
+    def check(self, request, response, watcher):
+        route = metrics.route_name(request)
+        for sql, (origin, stack_lines) in watcher.repeated.items():
+            logger.warning(
+                'N+1 on %s: %d x %s from %s\n%s',
+                route, watcher.statements[sql], querywatch.fingerprint(sql),
+                origin or 'unknown', ''.join(stack_lines),
+            )
+        budget = querywatch.query_budget(request)
+        if budget is not None and watcher.count > budget:
+            message = (
+                f'{route} ran {watcher.count} queries, budget is {budget}: '
+                f'{dict(watcher.fingerprints().most_common(5))}'
+            )
+            if settings.QUERY_BUDGETS_ENFORCED:
+                raise querywatch.QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class CompressionMiddleware(HybridMiddleware):
+    """Compress responses with brotli or gzip as negotiated by the client.
+
+    Bodies under COMPRESSION_MIN_BYTES are sent as is, streamed responses
+    are compressed chunk by chunk. Under ASGI compressing runs in the
+    request's thread, off the event loop.
+    """
+
+    def process(self, request):
+        return self.compress(request, self.get_response(request))
+
+    async def aprocess(self, request):
+        response = await self.get_response(request)
+        return await sync_to_async(self.compress)(request, response)
+
+    def compress(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if (
+            response.has_header('Content-Encoding')
+            or not compression.is_compressible(content_type)
+            or 'no-transform' in response.get('Cache-Control', '')
+        ):
+            return response
+        if (
+            not response.streaming
+            and len(response.content) < settings.COMPRESSION_MIN_BYTES
+        ):
+            return response
+        # The representation depends on Accept-Encoding from here on.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.negotiate(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+        )
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(
+                response.streaming_content, encoding,
+            )
+            response.headers.pop('Content-Length', None)
+        else:
+            compressed = compression.compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,60 @@
+# Generated by Django 4.0.6 on 2026-10-19 02:54
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+BACKFILL_SQL = """
+UPDATE core_book AS b
+SET tag_ids = s.ids, tag_names = s.names
+FROM (
+    SELECT bt.book_id,
+           array_agg(t.id ORDER BY t.id) AS ids,
+           array_agg(t.name ORDER BY t.id) AS names
+    FROM core_book_tags AS bt JOIN core_tag AS t ON t.id = bt.tag_id
+    GROUP BY bt.book_id
+) AS s
+WHERE b.id = s.book_id;
+
+UPDATE core_book AS b
+SET review_ids = s.ids
+FROM (
+    SELECT book_id, array_agg(review_id ORDER BY review_id) AS ids
+    FROM core_book_reviews
+    GROUP BY book_id
+) AS s
+WHERE b.id = s.book_id;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_book_image_alter_book_cost_review_book_reviews'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='review_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='tag_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='tag_names',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tag_ids'], name='core_book_tag_ids_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['review_ids'], name='core_book_review_ids_gin'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
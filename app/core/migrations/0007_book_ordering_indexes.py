@@ -0,0 +1,41 @@
+# Generated by Django 4.0.6 on 2026-10-19 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_book_facet_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='core_book_user_pages',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='core_book_user_cost',
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', 'id'], name='core_book_user_id'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', 'title', 'id'], name='core_book_user_title_id'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', 'author', 'id'], name='core_book_user_author_id'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', 'number_of_pages', 'id'], name='core_book_user_pages_id'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', 'cost', 'id'], name='core_book_user_cost_id'),
+        ),
+    ]
@@ -4,6 +4,8 @@ import uuid
 import os
 
 from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.conf import settings
 
@@ -78,6 +80,48 @@ class Book(models.Model):
     tags = models.ManyToManyField('Tag')
     reviews = models.ManyToManyField('Review')
     image = models.ImageField(null=True, upload_to=book_image_file_path)
+    # Copies of the M2M tables kept in sync by core.signals; tag_names[i]
+    # is the name of tag_ids[i].
+    tag_ids = ArrayField(
+        models.BigIntegerField(), default=list, blank=True, editable=False,
+    )
+    tag_names = ArrayField(
+        models.CharField(max_length=255), default=list, blank=True,
+        editable=False,
+    )
+    review_ids = ArrayField(
+        models.BigIntegerField(), default=list, blank=True, editable=False,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['tag_ids'], name='core_book_tag_ids_gin'),
+            GinIndex(fields=['review_ids'], name='core_book_review_ids_gin'),
+            # Facet filters of the book list, always scoped to one user.
+            models.Index(
+                fields=['user', 'category'], name='core_book_user_category',
+            ),
+            models.Index(
+                fields=['user', 'language'], name='core_book_user_language',
+            ),
+            # Sort keys of the book list with the id tie breaker, for
+            # keyset pages; they also serve the page and cost ranges.
+            models.Index(fields=['user', 'id'], name='core_book_user_id'),
+            models.Index(
+                fields=['user', 'title', 'id'], name='core_book_user_title_id',
+            ),
+            models.Index(
+                fields=['user', 'author', 'id'],
+                name='core_book_user_author_id',
+            ),
+            models.Index(
+                fields=['user', 'number_of_pages', 'id'],
+                name='core_book_user_pages_id',
+            ),
+            models.Index(
+                fields=['user', 'cost', 'id'], name='core_book_user_cost_id',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -105,3 +149,75 @@ class Review(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class SyncState(models.Model):
+    """Position of a user's change log."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    last_seq = models.BigIntegerField(default=0)
+    # Compaction may have dropped tombstones up to this seq.
+    floor_seq = models.BigIntegerField(default=0)
+
+
+class Change(models.Model):
+    """Entry of a user's change log, read by the sync endpoint."""
+
+    BOOK = 'book'
+    TAG = 'tag'
+    REVIEW = 'review'
+    KINDS = (
+        (BOOK, 'Book'),
+        (TAG, 'Tag'),
+        (REVIEW, 'Review'),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    seq = models.BigIntegerField()
+    kind = models.CharField(max_length=6, choices=KINDS)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'seq'], name='core_change_user_seq',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'kind', 'object_id'],
+                name='core_change_object',
+            ),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """Response stored for a user's Idempotency-Key, replayed on retries."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    key = models.CharField(max_length=255)
+    # sha256 of method, path and body; a reused key must match it.
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request is in flight.
+    status_code = models.PositiveSmallIntegerField(null=True)
+    # JSON text; jsonb would reorder the keys of the replayed response.
+    body = models.TextField(null=True)
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'], name='core_idempotencykey_user_key',
+            ),
+        ]
@@ -0,0 +1,226 @@
+"""
+Keyset pagination for lists sorted by unique keys.
+
+OFFSET pagination reads and throws away every row before a page, so each
+page is slower than the one before. A cursor here holds the sort keys of
+the row a page ended on instead, and the next page starts with a row
+comparison such as ``(title, id) > (%s, %s)`` that a ``(user, title, id)``
+index answers by seeking straight to it.
+
+The queryset must be ordered by its keys, all in one direction, ending
+with the primary key as the tie breaker. Only the first key may be NULL.
+Pagination is opt in: a list requested without ``page_size`` or
+``cursor`` is returned whole.
+"""
+
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _row(columns):
+    return f'({", ".join(columns)})'
+
+
+def seek(columns, values, descending, nullable=False):
+    """Return (sql, params) segments selecting the rows after ``values``.
+
+    The rows after are those of the first segment, then of the next, each
+    one an index seek. NULLs sort last ascending and first descending, as
+    in a Postgres index scanned forwards or backwards, and crossing from
+    NULLs to values or back takes a second segment: an OR of the two would
+    read the index from its start.
+    """
+    op = '<' if descending else '>'
+    after = f'{_row(columns)} {op} {_row(["%s"] * len(values))}'
+    if not nullable:
+        return [(after, values)]
+    first, rest = columns[0], columns[1:]
+    if values[0] is None:
+        placeholders = _row(['%s'] * len(rest))
+        rest_after = f'{first} IS NULL AND {_row(rest)} {op} {placeholders}'
+        if descending:
+            return [(rest_after, values[1:]), (f'{first} IS NOT NULL', [])]
+        return [(rest_after, values[1:])]
+    if descending:
+        return [(after, values)]
+    return [(after, values), (f'{first} IS NULL', [])]
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination seeking on the queryset's order_by keys."""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        """Return ``?page_size=``, capped at LIST_MAX_PAGE_SIZE."""
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return settings.LIST_PAGE_SIZE
+        try:
+            page_size = int(value)
+        except ValueError:
+            page_size = 0
+        if page_size < 1:
+            raise ValidationError({
+                self.page_size_query_param: 'A positive integer is required.',
+            })
+        return min(page_size, settings.LIST_MAX_PAGE_SIZE)
+
+    def _fields(self, queryset):
+        """Return the ordering fields and whether it is descending."""
+        ordering = list(queryset.query.order_by)
+        descending = ordering[0].startswith('-')
+        fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in ordering
+        ]
+        if (
+            any(field.startswith('-') != descending for field in ordering)
+            or not fields[-1].primary_key
+        ):
+            raise ValueError(f'Cannot paginate {ordering} by keyset.')
+        return fields, descending
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps(
+            {'o': self.ordering, 'v': values, 'r': reverse},
+            cls=DjangoJSONEncoder,
+        )
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor,
+        )
+
+    def decode_cursor(self, request):
+        """Return (values, reverse) of ``?cursor=``, or None."""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is None:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values, reverse = payload['v'], bool(payload['r'])
+            valid = (
+                payload['o'] == self.ordering
+                and isinstance(values, list)
+                and len(values) == len(self.fields)
+            )
+            if valid:
+                values = [
+                    field.to_python(value)
+                    for field, value in zip(self.fields, values)
+                ]
+                valid = all(
+                    value is not None or field.null
+                    for field, value in zip(self.fields, values)
+                )
+        except (
+            binascii.Error, ValueError, KeyError, TypeError,
+            DjangoValidationError,
+        ):
+            valid = False
+        if not valid:
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor.'})
+        return values, reverse
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if (
+            self.cursor_query_param not in params
+            and self.page_size_query_param not in params
+        ):
+            return None
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = list(queryset.query.order_by)
+        self.fields, descending = self._fields(queryset)
+        cursor = self.decode_cursor(request)
+        values, reverse = cursor or (None, False)
+
+        if reverse:
+            # A previous page walks back from its cursor and is flipped.
+            queryset = queryset.reverse()
+        if cursor is None:
+            rows = list(queryset[:self.page_size + 1])
+        else:
+            quote = connections[queryset.db].ops.quote_name
+            table = quote(queryset.model._meta.db_table)
+            segments = seek(
+                [f'{table}.{quote(field.column)}' for field in self.fields],
+                values, descending != reverse, nullable=self.fields[0].null,
+            )
+            rows = []
+            for sql, sql_params in segments:
+                if len(rows) > self.page_size:
+                    break
+                rows += queryset.filter(
+                    RawSQL(sql, sql_params, output_field=BooleanField()),
+                )[:self.page_size + 1 - len(rows)]
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next = self.previous = None
+        if rows and (more or reverse):
+            self.next = self.encode_cursor(self.keys(rows[-1]), False)
+        if rows and (more if reverse else cursor is not None):
+            self.previous = self.encode_cursor(self.keys(rows[0]), True)
+        return rows
+
+    def keys(self, row):
+        """Return the sort key values of ``row``."""
+        return [getattr(row, field.attname) for field in self.fields]
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next, 'previous': self.previous, 'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string', 'nullable': True, 'format': 'uri',
+                },
+                'previous': {
+                    'type': 'string', 'nullable': True, 'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': (
+                    'Cursor from the next or previous link of a page.'
+                ),
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': (
+                    f'Items per page, at most {settings.LIST_MAX_PAGE_SIZE}. '
+                    'Without page_size or cursor the whole list is returned.'
+                ),
+                'schema': {'type': 'integer'},
+            },
+        ]
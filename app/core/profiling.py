@@ -0,0 +1,154 @@
+"""
+On-demand profiles of single requests and worker memory snapshots.
+
+A staff member adds ``X-Profile: 1`` or ``?profile=1`` to a request; it
+then runs under cProfile and the stats are kept in the shared cache for
+PROFILE_TTL_SECONDS, to be downloaded from the URL in the X-Profile-Url
+response header as a .prof file (snakeviz, pstats) or as text. Requests
+without the flag only pay for a header and query string lookup.
+
+Memory snapshots use tracemalloc, which slows every allocation while it
+traces, so it only runs in a worker after staff started it there. Each
+snapshot is compared with the previous one of the same worker.
+"""
+
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import re
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+
+HEADER = 'HTTP_X_PROFILE'
+_FLAG = re.compile(r'(?:^|&)profile=1(?:&|$)')
+
+# Frames of the profiler and of imports are noise in memory diffs.
+_MEMORY_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+_baseline = None
+
+
+def requested(request):
+    """Return whether the request asks to be profiled."""
+    return (
+        request.META.get(HEADER) == '1'
+        or bool(_FLAG.search(request.META.get('QUERY_STRING', '')))
+    )
+
+
+def staff_user(request):
+    """Return the staff user behind a session or API token, or None."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            authenticated = TokenAuthentication().authenticate(
+                Request(request),
+            )
+        except AuthenticationFailed:
+            return None
+        user = authenticated[0] if authenticated else None
+    return user if user is not None and user.is_staff else None
+
+
+def cache_key(profile_id):
+    """Return the cache key of a stored profile."""
+    return f'profile:{profile_id}'
+
+
+def profile(get_response, request, user):
+    """Run ``get_response`` under cProfile and store the stats."""
+    profiler = cProfile.Profile()
+    began = time.perf_counter()
+    response = profiler.runcall(get_response, request)
+    elapsed = (time.perf_counter() - began) * 1000
+    profiler.create_stats()
+    profile_id = uuid.uuid4().hex
+    cache.set(cache_key(profile_id), {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'user_id': user.pk,
+        'pid': os.getpid(),
+        'total_ms': round(elapsed, 3),
+        'stats': marshal.dumps(profiler.stats),
+    }, settings.PROFILE_TTL_SECONDS)
+    return response, profile_id
+
+
+class _Stats:
+    """Stored stats in the shape pstats.Stats loads from a profiler."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def load(profile_id):
+    """Return a stored profile, or None once it expired."""
+    return cache.get(cache_key(profile_id))
+
+
+def render_text(entry, sort='cumulative', limit=40):
+    """Return a pstats report of a stored profile."""
+    out = io.StringIO()
+    out.write(
+        f'{entry["method"]} {entry["path"]} -> {entry["status"]} '
+        f'in {entry["total_ms"]}ms (pid {entry["pid"]})\n\n'
+    )
+    stats = pstats.Stats(_Stats(marshal.loads(entry['stats'])), stream=out)
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def start_tracing(frames):
+    """Start tracemalloc in this worker and take the baseline snapshot."""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _baseline = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+
+
+def stop_tracing():
+    """Stop tracemalloc and drop the baseline."""
+    global _baseline
+    _baseline = None
+    tracemalloc.stop()
+
+
+def snapshot_diff(group_by='lineno', limit=25):
+    """Compare a new snapshot with the baseline, which it then replaces.
+
+    Returns the allocation sites that grew or shrank most, or None when
+    this worker is not tracing.
+    """
+    global _baseline
+    if _baseline is None or not tracemalloc.is_tracing():
+        return None
+    current = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+    diff = current.compare_to(_baseline, group_by)
+    _baseline = current
+    return [
+        {
+            'traceback': [str(frame) for frame in stat.traceback],
+            'size_kb': round(stat.size / 1024, 1),
+            'size_diff_kb': round(stat.size_diff / 1024, 1),
+            'count': stat.count,
+            'count_diff': stat.count_diff,
+        }
+        for stat in diff[:limit]
+    ]
@@ -0,0 +1,142 @@
+"""
+Slow-query and N+1 detection based on SQL fingerprints.
+
+``QueryWatchMiddleware`` counts every query of a request by its SQL, which
+the ORM keeps the same whatever the parameters. A statement repeated
+``N_PLUS_ONE_THRESHOLD`` times is logged as an N+1 together with the
+serializer field that triggered it; a query slower than ``SLOW_QUERY_MS``
+is logged with its EXPLAIN plan. Reports group statements by fingerprint,
+the SQL with literals and placeholder lists collapsed, which is only
+worked out for the statements reported.
+
+Views declare the most queries an action may run::
+
+    query_budgets = {'list': 3, 'retrieve': 3}
+
+Over budget is a warning in production and a failure under the test
+runner, which sets ``QUERY_BUDGETS_ENFORCED``.
+"""
+
+import logging
+import re
+import sys
+import time
+import traceback
+from collections import Counter
+
+from django.conf import settings
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more queries than its declared budget."""
+
+
+def fingerprint(sql):
+    """Normalize SQL so queries differing only in literals compare equal."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _PLACEHOLDER_LIST.sub('(?)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def serializer_origin():
+    """Return 'Serializer.field' for the field being rendered, if any."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        local_vars = frame.f_locals
+        field = local_vars.get('field')
+        owner = local_vars.get('self')
+        if (
+            frame.f_code.co_name == 'to_representation'
+            and isinstance(owner, BaseSerializer)
+            and field is not None
+        ):
+            return f'{type(owner).__name__}.{field.field_name}'
+        frame = frame.f_back
+    return None
+
+
+def app_stack(limit=8):
+    """Return the innermost frames belonging to this project."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(base_dir)
+    ]
+    return traceback.format_list(frames[-limit:])
+
+
+def explain(connection, sql, params):
+    """Return the EXPLAIN output of a SELECT, or None if unavailable.
+
+    Inside a transaction the EXPLAIN runs in a savepoint so a failure
+    cannot break the request's own transaction.
+    """
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    in_atomic = connection.in_atomic_block
+    with connection.connection.cursor() as cursor:
+        try:
+            if in_atomic:
+                cursor.execute('SAVEPOINT querywatch_explain')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        except Exception:
+            if in_atomic:
+                cursor.execute('ROLLBACK TO SAVEPOINT querywatch_explain')
+            return None
+        if in_atomic:
+            cursor.execute('RELEASE SAVEPOINT querywatch_explain')
+    return plan
+
+
+class QueryWatcher:
+    """Database execute wrapper collecting fingerprints of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = Counter()
+        self.repeated = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        began = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - began) * 1000
+        self.count += 1
+        self.statements[sql] += 1
+        if self.statements[sql] == settings.N_PLUS_ONE_THRESHOLD:
+            self.repeated[sql] = (serializer_origin(), app_stack())
+        if duration_ms >= settings.SLOW_QUERY_MS:
+            logger.warning(
+                'Slow query (%.1f ms): %s\n%s',
+                duration_ms, sql, explain(context['connection'], sql, params),
+            )
+        return result
+
+    def fingerprints(self):
+        """Return the number of queries run by fingerprint."""
+        counts = Counter()
+        for sql, count in self.statements.items():
+            counts[fingerprint(sql)] += count
+        return counts
+
+
+def query_budget(request):
+    """Return the query budget declared for the view serving ``request``."""
+    match = request.resolver_match
+    view_class = getattr(match.func, 'cls', None) if match else None
+    budgets = getattr(view_class, 'query_budgets', None)
+    if not budgets:
+        return None
+    actions = getattr(match.func, 'actions', None) or {}
+    method = request.method.lower()
+    return budgets.get(actions.get(method, method))
@@ -0,0 +1,42 @@
+"""
+Test runner failing views that exceed their declared query budget.
+
+Tests also use the plain static storage, the manifest only exists after
+collectstatic, fresh throttle and coalescing state directories per run,
+and no sampled request timings, which would be logged among test output.
+"""
+
+import os
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class QueryBudgetRunner(DiscoverRunner):
+    """Discover runner with QUERY_BUDGETS_ENFORCED switched on."""
+
+    test_settings = {
+        'QUERY_BUDGETS_ENFORCED': True,
+        'STATICFILES_STORAGE': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+        'SERVER_TIMING_SAMPLE_RATE': 0,
+    }
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._throttle_dir = tempfile.TemporaryDirectory(
+            prefix='app-throttle-',
+        )
+        self._settings = override_settings(
+            THROTTLE_DIR=self._throttle_dir.name,
+            COALESCE_DIR=os.path.join(self._throttle_dir.name, 'coalesce'),
+            **self.test_settings,
+        )
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        self._throttle_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,73 @@
+"""
+Precomputed OpenAPI schema.
+
+Generating the schema introspects every view and serializer, so it is
+built once per code version and renderer and kept both in the process and
+in the default cache, together with its gzip encoding and an ETag derived
+from the content. The code version is a hash of the project's Python
+sources, so deploying changed code invalidates the stored schema without a
+manual step; ``manage.py build_schema`` warms it before workers start.
+"""
+
+import gzip
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+import drf_spectacular
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import translation
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.views import SpectacularAPIView
+
+_schemas = {}
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """Return a hash of the project sources the schema is generated from."""
+    digest = hashlib.sha256(drf_spectacular.__version__.encode())
+    base_dir = Path(settings.BASE_DIR)
+    for path in sorted(base_dir.rglob('*.py')):
+        digest.update(str(path.relative_to(base_dir)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def build(renderer):
+    """Generate and render the schema, returning its cache entry."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    data = generator.get_schema(request=None, public=True)
+    body = renderer.render(data, renderer.media_type, {})
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    return {
+        'body': body,
+        'gzip': gzip.compress(body, mtime=0),
+        'etag': hashlib.sha256(body).hexdigest()[:32],
+        'content_type': content_type,
+    }
+
+
+def get(renderer):
+    """Return the schema entry for ``renderer``, building it on a miss."""
+    key = (
+        f'openapi-schema:{code_version()}:{renderer.media_type}:'
+        f'{translation.get_language()}'
+    )
+    entry = _schemas.get(key)
+    if entry is None:
+        entry = cache.get(key)
+        if entry is None:
+            entry = build(renderer)
+            cache.set(key, entry, None)
+        _schemas[key] = entry
+    return entry
+
+
+def warm():
+    """Build the schema for every renderer of the schema view."""
+    for renderer_class in SpectacularAPIView.renderer_classes:
+        get(renderer_class())
@@ -0,0 +1,154 @@
+"""
+Signal handlers keeping the denormalized Book arrays and the sync change
+log up to date and feeding metrics.
+"""
+
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_login_failed
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete,
+)
+from django.dispatch import receiver
+
+from core import changelog, metrics
+from core.models import Book, Review, Tag
+
+BATCH_SIZE = 500
+
+
+def collect_book_arrays(book_ids):
+    """Return {book_id: (tag_ids, tag_names, review_ids)} from M2M tables."""
+    tags = defaultdict(list)
+    reviews = defaultdict(list)
+    tag_rows = Book.tags.through.objects.filter(
+        book_id__in=book_ids,
+    ).order_by('book_id', 'tag_id').values_list(
+        'book_id', 'tag_id', 'tag__name',
+    )
+    for book_id, tag_id, name in tag_rows:
+        tags[book_id].append((tag_id, name))
+    review_rows = Book.reviews.through.objects.filter(
+        book_id__in=book_ids,
+    ).order_by('book_id', 'review_id').values_list('book_id', 'review_id')
+    for book_id, review_id in review_rows:
+        reviews[book_id].append(review_id)
+
+    return {
+        book_id: (
+            [tag_id for tag_id, _ in tags[book_id]],
+            [name for _, name in tags[book_id]],
+            reviews[book_id],
+        )
+        for book_id in book_ids
+    }
+
+
+def refresh_book_arrays(book_ids, instances=()):
+    """Rebuild tag_ids, tag_names and review_ids from the M2M tables.
+
+    Book objects passed in ``instances`` are updated in memory too, so a
+    serializer holding them renders the new values without a reload.
+    The books are logged as changed for sync clients.
+    """
+    book_ids = set(book_ids)
+    if not book_ids:
+        return
+    loaded = {book.pk: book for book in instances}
+    books = []
+    for book_id, arrays in collect_book_arrays(book_ids).items():
+        book = loaded.get(book_id) or Book(pk=book_id)
+        book.tag_ids, book.tag_names, book.review_ids = arrays
+        books.append(book)
+    Book.objects.bulk_update(
+        books, ['tag_ids', 'tag_names', 'review_ids'], batch_size=BATCH_SIZE,
+    )
+    owners = {book.pk: book.user_id for book in instances}
+    missing = book_ids - owners.keys()
+    if missing:
+        owners.update(
+            Book.objects.filter(pk__in=missing).values_list('pk', 'user_id')
+        )
+    changelog.record_books(owners)
+
+
+def _books_changed(instance, action, reverse, pk_set):
+    """Refresh the books touched by an M2M change, forward or reverse."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_book_arrays([instance.pk], instances=[instance])
+        return
+    if action == 'pre_clear':
+        instance._cleared_book_ids = list(
+            instance.book_set.values_list('pk', flat=True)
+        )
+    elif action == 'post_clear':
+        refresh_book_arrays(instance.__dict__.pop('_cleared_book_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        refresh_book_arrays(pk_set)
+
+
+@receiver(m2m_changed, sender=Book.tags.through)
+def book_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _books_changed(instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Book.reviews.through)
+def book_reviews_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _books_changed(instance, action, reverse, pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, raw, **kwargs):
+    """Pick up renamed tags in tag_names."""
+    if created or raw:
+        return
+    refresh_book_arrays(
+        Book.objects.filter(
+            tag_ids__contains=[instance.pk],
+        ).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    refresh_book_arrays(
+        Book.objects.filter(
+            tag_ids__contains=[instance.pk],
+        ).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    refresh_book_arrays(
+        Book.objects.filter(
+            review_ids__contains=[instance.pk],
+        ).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Review)
+def log_saved(sender, instance, raw, **kwargs):
+    if not raw:
+        changelog.record_instance(instance)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Review)
+def log_deleted(sender, instance, **kwargs):
+    changelog.record_instance(instance, deleted=True)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def user_deleting(sender, instance, **kwargs):
+    changelog.deleting_user(instance.pk)
+
+
+@receiver(user_login_failed)
+def login_failed(sender, credentials, **kwargs):
+    metrics.AUTH_FAILURES.labels('credentials').inc()
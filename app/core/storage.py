@@ -0,0 +1,49 @@
+"""
+Static files storage writing precompressed copies of hashed files.
+"""
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+from core import compression
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.map', '.json', '.svg', '.html', '.txt', '.xml',
+    '.ttf', '.eot', '.ico',
+)
+# Tiny files gain nothing and cost nginx an extra open().
+MIN_SIZE = 256
+# Files are compressed once, so use the slowest, smallest levels.
+LEVELS = {'gzip': 9, 'br': 11}
+SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage adding .gz and .br siblings at collectstatic time.
+
+    nginx serves the siblings of the hashed, never changing names with
+    gzip_static (and brotli_static where the module is available).
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in set(self.hashed_files.values()):
+            if hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self._write_compressed(hashed_name)
+
+    def _write_compressed(self, name):
+        """Write the encodings of ``name`` that are smaller than it."""
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < MIN_SIZE:
+            return
+        for encoding in compression.available_encodings():
+            compressed = compression.compress(data, encoding, LEVELS[encoding])
+            if len(compressed) >= len(data):
+                continue
+            path = name + SUFFIXES[encoding]
+            if self.exists(path):
+                self.delete(path)
+            self._save(path, ContentFile(compressed))
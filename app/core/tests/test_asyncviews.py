@@ -0,0 +1,178 @@
+"""
+Tests for the async read actions of viewsets.
+"""
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import path
+
+from rest_framework.authtoken.models import Token
+
+from book.views import BookViewSet, TagViewSet
+from core.middleware import HealthCheckMiddleware
+from core.models import Book, Tag
+from core.timeouts import ASGIHandler
+
+with override_settings(ASYNC_VIEWS=True):
+    urlpatterns = [path('tags/', TagViewSet.as_view({'get': 'list'}))]
+
+
+def sample_book(user, **params):
+    """Create and return a sample book."""
+    defaults = {
+        'title': 'Sample title',
+        'category': 'Drama',
+        'number_of_pages': 121,
+        'language': 'Polski',
+    }
+    defaults.update(params)
+    return Book.objects.create(user=user, **defaults)
+
+
+@override_settings(ASYNC_VIEWS=True)
+class AsyncReadTests(TestCase):
+    """Test list and retrieve are served as coroutines."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.factory = RequestFactory(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}',
+        )
+
+    def _call(self, view, request, **kwargs):
+        """Run an async view and return its status and decoded body."""
+        response = async_to_sync(view)(request, **kwargs)
+        response.render()
+        return response.status_code, json.loads(response.content or 'null')
+
+    def test_list_and_retrieve_are_async(self):
+        """Test read views are coroutines returning the user's books."""
+        book = sample_book(self.user)
+        tag = Tag.objects.create(user=self.user, name='Funny')
+        book.tags.add(tag)
+        sample_book(get_user_model().objects.create_user(
+            'other@example.com', 'test123',
+        ))
+        list_view = BookViewSet.as_view({'get': 'list', 'post': 'create'})
+        detail_view = BookViewSet.as_view({'get': 'retrieve'})
+
+        self.assertTrue(asyncio.iscoroutinefunction(list_view))
+        status, data = self._call(list_view, self.factory.get('/'))
+        self.assertEqual(status, 200)
+        self.assertEqual([item['id'] for item in data], [book.id])
+        self.assertEqual(data[0]['tags'], [{'id': tag.id, 'name': 'Funny'}])
+
+        status, data = self._call(
+            detail_view, self.factory.get('/'), pk=book.id,
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(data['title'], 'Sample title')
+
+    def test_unauthenticated_and_missing(self):
+        """Test auth and not found errors are handled in async views."""
+        view = BookViewSet.as_view({'get': 'retrieve'})
+
+        status, _ = self._call(view, RequestFactory().get('/'), pk=1)
+        self.assertEqual(status, 401)
+        status, _ = self._call(view, self.factory.get('/'), pk=0)
+        self.assertEqual(status, 404)
+
+    def test_writes_fall_back_to_sync(self):
+        """Test write actions on an async view still run the sync handler."""
+        view = BookViewSet.as_view({'get': 'list', 'post': 'create'})
+        request = self.factory.post('/', {
+            'title': 'New', 'category': 'Drama', 'number_of_pages': 10,
+            'language': 'Polski',
+        }, content_type='application/json')
+
+        status, data = self._call(view, request)
+
+        self.assertEqual(status, 201)
+        self.assertTrue(
+            Book.objects.filter(id=data['id'], user=self.user).exists()
+        )
+
+    def test_tags_list_async(self):
+        """Test the tag list is served by the async path."""
+        Tag.objects.create(user=self.user, name='Funny')
+        view = TagViewSet.as_view({'get': 'list'})
+
+        status, data = self._call(view, self.factory.get('/'))
+
+        self.assertEqual(status, 200)
+        self.assertEqual([item['name'] for item in data], ['Funny'])
+
+    @override_settings(ASYNC_VIEWS=False)
+    def test_disabled_keeps_sync_views(self):
+        """Test views stay sync when ASYNC_VIEWS is off."""
+        view = BookViewSet.as_view({'get': 'list'})
+
+        self.assertFalse(asyncio.iscoroutinefunction(view))
+
+
+@override_settings(
+    ROOT_URLCONF=__name__, ALLOWED_HOSTS=['testserver'],
+    SERVER_TIMING_SAMPLE_RATE=1,
+)
+class AsyncChainTests(TransactionTestCase):
+    """Test ASGI requests run through an async middleware chain."""
+
+    def test_chain_is_async(self):
+        """Test no middleware forces the request into a thread."""
+        chain = ASGIHandler()._middleware_chain
+
+        self.assertTrue(asyncio.iscoroutinefunction(chain))
+        # Sync middleware would be wrapped in an adapter instead.
+        self.assertIsInstance(chain.__wrapped__, HealthCheckMiddleware)
+
+    # The request's thread ends with the request; like under ASGI
+    # serving, its connection must close with it.
+    @mock.patch.dict(connections.settings['default'], CONN_MAX_AGE=0)
+    def test_async_view_through_chain(self):
+        """Test execute wrappers see the queries of a coroutine view."""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        token = Token.objects.create(user=user)
+        Tag.objects.create(user=user, name='Funny')
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/tags/',
+            'query_string': b'',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {token.key}'.encode()),
+            ],
+        }
+        sent = []
+
+        async def request():
+            messages = [{'type': 'http.request', 'body': b''}]
+            connected = asyncio.Event()
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await connected.wait()
+
+            async def send(message):
+                sent.append(message)
+
+            await ASGIHandler()(scope, receive, send)
+
+        asyncio.run(request())
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(json.loads(sent[1]['body'])[0]['name'], 'Funny')
+        timing = dict(sent[0]['headers'])[b'Server-Timing']
+        self.assertIn(b'db;dur=', timing)
+        self.assertNotIn(b'"0 queries"', timing)
@@ -0,0 +1,161 @@
+"""
+Tests for running several API requests in one batch.
+"""
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, resolve, reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from book.views import BookViewSet
+from core import batch
+from core.models import Book, Tag
+from user.views import ManageUserView
+
+BATCH_URL = reverse('batch')
+BOOKS_URL = reverse('book:book-list')
+
+BOOK = {
+    'title': 'Sample', 'category': 'Drama', 'number_of_pages': 121,
+    'language': 'Polski',
+}
+CREATE = {'method': 'POST', 'path': BOOKS_URL, 'body': BOOK}
+INVALID = {'method': 'POST', 'path': BOOKS_URL, 'body': {'title': 'No pages'}}
+
+
+def statuses(res):
+    return [item['status'] for item in res.data]
+
+
+class BatchTests(TestCase):
+    """Test sub-requests run with the user of the batch."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def _batch(self, requests, **params):
+        return self.client.post(
+            BATCH_URL, {'requests': requests, **params}, format='json',
+        )
+
+    def test_start_screen(self):
+        """Test the reads of the start screen run with one token lookup."""
+        Tag.objects.create(user=self.user, name='Funny')
+        paths = [
+            reverse('user:me'), BOOKS_URL,
+            reverse('book:tag-list'), reverse('book:review-list'),
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self._batch([{'method': 'GET', 'path': p} for p in paths])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(statuses(res), [200] * 4)
+        self.assertEqual(res.data[0]['body']['email'], 'user@example.com')
+        self.assertEqual(res.data[1]['body'], [])
+        self.assertEqual(res.data[2]['body'][0]['name'], 'Funny')
+        token_queries = [q for q in queries if 'authtoken_token' in q['sql']]
+        self.assertEqual(len(token_queries), 1)
+
+    def test_writes_and_errors(self):
+        """Test each sub-request answers on its own without atomic."""
+        res = self._batch([
+            CREATE,
+            INVALID,
+            {'method': 'GET', 'path': f'{BOOKS_URL}?category=Drama'},
+            {'method': 'GET', 'path': '/api/book/unknown/'},
+        ])
+
+        self.assertEqual(statuses(res), [
+            status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST,
+            status.HTTP_200_OK, status.HTTP_404_NOT_FOUND,
+        ])
+        self.assertIn('number_of_pages', res.data[1]['body'])
+        titles = [book['title'] for book in res.data[2]['body']]
+        self.assertEqual(titles, ['Sample'])
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 1)
+
+    def test_atomic(self):
+        """Test a failing sub-request of an atomic batch rolls back all."""
+        res = self._batch([CREATE, INVALID, CREATE], atomic=True)
+
+        self.assertEqual(statuses(res), [
+            status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST,
+            status.HTTP_424_FAILED_DEPENDENCY,
+        ])
+        self.assertFalse(Book.objects.filter(user=self.user).exists())
+
+        res = self._batch([CREATE, CREATE], atomic=True)
+        self.assertEqual(statuses(res), [201, 201])
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 2)
+
+    @override_settings(STATEMENT_TIMEOUTS={'tag': 3000})
+    def test_atomic_statement_timeouts(self):
+        """Test a view's timeout does not outlive its sub-request."""
+        get_object = ManageUserView.get_object
+        seen = []
+
+        def show_timeout(view):
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW statement_timeout')
+                seen.append(cursor.fetchone()[0])
+            return get_object(view)
+
+        with mock.patch.object(ManageUserView, 'get_object', show_timeout):
+            res = self._batch([
+                {'method': 'GET', 'path': reverse('book:tag-list')},
+                {'method': 'GET', 'path': reverse('user:me')},
+            ], atomic=True)
+
+        self.assertEqual(statuses(res), [200, 200])
+        self.assertEqual(seen, ['0'])
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_limits(self):
+        """Test oversized batches and unbatchable paths are rejected."""
+        get = {'method': 'GET', 'path': BOOKS_URL}
+        cases = [
+            [get] * 3,
+            [],
+            [{'method': 'GET', 'path': '/admin/'}],
+            [{'method': 'POST', 'path': BATCH_URL}],
+            [{'method': 'HEAD', 'path': BOOKS_URL}],
+        ]
+        for requests in cases:
+            res = self._batch(requests)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.credentials()
+        res = self._batch([get])
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(ASYNC_VIEWS=True)
+    def test_async_view(self):
+        """Test coroutine views run to completion inside the batch."""
+        Book.objects.create(user=self.user, **BOOK)
+        view = BookViewSet.as_view({'get': 'list'})
+
+        def async_resolve(path):
+            match = resolve(path)
+            return ResolverMatch(
+                view, match.args, match.kwargs, match.url_name,
+                match.app_names,
+            )
+
+        with mock.patch.object(batch, 'resolve', async_resolve):
+            res = self._batch([{'method': 'GET', 'path': BOOKS_URL}])
+
+        self.assertEqual(res.data[0]['status'], 200)
+        titles = [book['title'] for book in res.data[0]['body']]
+        self.assertEqual(titles, ['Sample'])
@@ -0,0 +1,83 @@
+"""
+Tests for the benchmark helpers and the synthetic data seeder.
+"""
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from core import benchmarking
+from core.management.commands import benchmark_api
+from core.models import Book
+
+
+class BenchmarkingTests(SimpleTestCase):
+    """Test summarizing and comparing benchmark results."""
+
+    def test_summarize_percentiles(self):
+        """Test percentiles use the nearest rank."""
+        stats = benchmarking.summarize(range(1, 101))
+
+        self.assertEqual(stats['count'], 100)
+        self.assertEqual(stats['p50_ms'], 50)
+        self.assertEqual(stats['p95_ms'], 95)
+        self.assertEqual(stats['p99_ms'], 99)
+
+    def test_summarize_empty(self):
+        """Test an empty run summarizes to zeros."""
+        self.assertEqual(benchmarking.summarize([])['p95_ms'], 0.0)
+
+    def test_compare_with_baseline(self):
+        """Test relative changes are reported per shared scenario."""
+        current = {'scenarios': {
+            'list': {'p95_ms': 50, 'rps': 300},
+            'create': {'p95_ms': 20, 'rps': 100},
+        }}
+        baseline = {'scenarios': {'list': {'p95_ms': 100, 'rps': 200}}}
+
+        changes = benchmarking.compare(current, baseline)
+
+        self.assertEqual(
+            changes, {'list': {'p95_change': -0.5, 'rps_change': 0.5}},
+        )
+
+    def test_zero_baseline(self):
+        """Test changes from a zero baseline print as n/a."""
+        current = {'scenarios': {'list': {'p95_ms': 50, 'rps': 300}}}
+        baseline = {'scenarios': {'list': {'p95_ms': 0, 'rps': 200}}}
+
+        change = benchmarking.compare(current, baseline)['list']
+
+        self.assertEqual(benchmark_api.percent(change['p95_change']), 'n/a')
+        self.assertEqual(benchmark_api.percent(change['rps_change']), '+50.0%')
+
+    def test_detail_without_books(self):
+        """Test the detail scenario refuses users without books."""
+        fixtures = [{'email': 'perf-0@example.com', 'books': [], 'tags': []}]
+
+        with mock.patch.object(
+            benchmark_api.Command, '_fixtures', return_value=fixtures,
+        ), self.assertRaises(CommandError):
+            call_command('benchmark_api', scenarios='detail')
+
+
+class SeedPerfDataTests(TestCase):
+    """Test the seed_perf_data command."""
+
+    def test_seed_is_consistent(self):
+        """Test seeded books match the requested volume and M2M tables."""
+        call_command(
+            'seed_perf_data', users=5, books=200, chunk=2, prefix='t',
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(
+            get_user_model().objects.filter(email__startswith='t-').count(), 5,
+        )
+        self.assertEqual(Book.objects.count(), 200)
+        out = StringIO()
+        call_command('reconcile_book_arrays', dry_run=True, stdout=out)
+        self.assertIn('found 0', out.getvalue())
@@ -0,0 +1,221 @@
+"""
+Tests for single-flight coalescing of identical concurrent reads.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from book.views import BaseBookAttrViewSet
+from core import coalescing
+from core.models import Tag
+
+TAGS_URL = reverse('book:tag-list')
+
+
+def coalesced(route, scope):
+    """Return the requests of ``route`` coalesced within ``scope``."""
+    return REGISTRY.get_sample_value(
+        'coalesced_requests_total', {'route': route, 'scope': scope},
+    ) or 0
+
+
+class Computation:
+    """A slow computation counting how often it runs."""
+
+    def __init__(self, status_code=status.HTTP_200_OK, seconds=0.2):
+        self.status_code = status_code
+        self.seconds = seconds
+        self.calls = 0
+        self.running = self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.seconds)
+        with self.lock:
+            self.running -= 1
+        return Response(['data'], status=self.status_code)
+
+    async def run_async(self):
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        return Response(['data'], status=self.status_code)
+
+
+@override_settings(COALESCE_ACROSS_WORKERS=False)
+class SingleFlightTests(SimpleTestCase):
+    """Test concurrent callers of a key share one computation."""
+
+    def _concurrently(self, compute, key='k', callers=4):
+        with ThreadPoolExecutor(callers) as executor:
+            return list(executor.map(
+                lambda _: coalescing.single_flight(key, compute, 'test'),
+                range(callers),
+            ))
+
+    def test_shared(self):
+        """Test one computation answers all concurrent callers."""
+        compute = Computation()
+        before = coalesced('test', 'worker')
+
+        responses = self._concurrently(compute)
+
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual([res.data for res in responses], [['data']] * 4)
+        self.assertEqual(coalesced('test', 'worker'), before + 3)
+
+    def test_errors_not_shared(self):
+        """Test callers compute their own after a failed computation."""
+        compute = Computation(status.HTTP_404_NOT_FOUND)
+
+        responses = self._concurrently(compute)
+
+        self.assertEqual(compute.calls, 4)
+        self.assertTrue(all(res.status_code == 404 for res in responses))
+
+    def test_sequential_not_shared(self):
+        """Test a finished computation is not reused."""
+        compute = Computation(seconds=0)
+
+        coalescing.single_flight('k', compute, 'test')
+        coalescing.single_flight('k', compute, 'test')
+
+        self.assertEqual(compute.calls, 2)
+
+    def test_async(self):
+        """Test coroutines on one event loop share a computation."""
+        compute = Computation()
+
+        async def run():
+            return await asyncio.gather(*[
+                coalescing.single_flight_async('k', compute.run_async, 'test')
+                for _ in range(4)
+            ])
+
+        responses = asyncio.run(run())
+
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual([res.data for res in responses], [['data']] * 4)
+
+
+@override_settings(COALESCE_ACROSS_WORKERS=True)
+class AcrossWorkersTests(SimpleTestCase):
+    """Test workers share results through the lock file and cache."""
+
+    def setUp(self):
+        cache.delete(coalescing._result_key('shared'))
+
+    def _queued(self, compute, waiters=1):
+        """Run a caller of ``compute``, then ``waiters`` queued on it."""
+        with ThreadPoolExecutor(1 + waiters) as executor:
+            # Called directly, without the flights of this worker, the
+            # threads only meet on the lock like separate workers do.
+            first = executor.submit(
+                coalescing.across_workers, 'shared', compute,
+            )
+            time.sleep(0.05)
+            rest = [
+                executor.submit(coalescing.across_workers, 'shared', compute)
+                for _ in range(waiters)
+            ]
+        return first.result(), [future.result() for future in rest]
+
+    def test_waiting_worker_shares(self):
+        """Test a caller queued on the lock takes the fresh result."""
+        compute = Computation()
+
+        first, [(response, shared)] = self._queued(compute)
+
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(first[1], False)
+        self.assertTrue(shared)
+        self.assertEqual(response.data, ['data'])
+        self.assertEqual(os.listdir(settings.COALESCE_DIR), [])
+
+        coalescing.across_workers('shared', compute)
+        self.assertEqual(compute.calls, 2)
+
+    def test_published_for_waiters_only(self):
+        """Test a caller nobody waits for leaves the cache alone."""
+        response, shared = coalescing.across_workers(
+            'shared', Computation(seconds=0),
+        )
+
+        self.assertFalse(shared)
+        self.assertIsNone(cache.get(coalescing._result_key('shared')))
+        self.assertEqual(os.listdir(settings.COALESCE_DIR), [])
+
+    def test_waiters_compute_in_parallel(self):
+        """Test waiters without a shared result do not queue on another."""
+        compute = Computation(status.HTTP_404_NOT_FOUND)
+
+        first, rest = self._queued(compute, waiters=3)
+
+        self.assertEqual(compute.calls, 4)
+        self.assertEqual([shared for _, shared in rest], [False] * 3)
+        self.assertGreaterEqual(compute.peak, 2)
+        self.assertEqual(os.listdir(settings.COALESCE_DIR), [])
+
+
+class CoalescedTagListTests(TransactionTestCase):
+    """Test identical concurrent tag lists run the query once."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        Tag.objects.create(user=self.user, name='Funny')
+
+    def _get(self, user, params=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        try:
+            return client.get(TAGS_URL, params)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_lists(self):
+        """Test concurrent identical lists are answered by one query."""
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'test123',
+        )
+        get_queryset = BaseBookAttrViewSet.get_queryset
+        calls = []
+
+        def slow_queryset(view):
+            calls.append(view.request.user.pk)
+            time.sleep(0.3)
+            return get_queryset(view)
+
+        before = coalesced('book:tag-list', 'worker')
+        with mock.patch.object(
+            BaseBookAttrViewSet, 'get_queryset', slow_queryset,
+        ), ThreadPoolExecutor(5) as executor:
+            responses = list(executor.map(
+                lambda user: self._get(user), [self.user] * 4 + [other],
+            ))
+
+        self.assertEqual(sorted(calls), sorted([self.user.pk, other.pk]))
+        self.assertTrue(all(res.status_code == 200 for res in responses))
+        names = [res.data[0]['name'] for res in responses[:4]]
+        self.assertEqual(names, ['Funny'] * 4)
+        self.assertEqual(responses[4].data, [])
+        self.assertEqual(coalesced('book:tag-list', 'worker'), before + 3)
@@ -1,33 +1,146 @@
 '''Test custom Django management commands.'''
 
+import os
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 
+from rest_framework.authtoken.models import Token
 
-@patch('core.management.commands.wait_for_db.Command.check')
+from core.management.commands import bulk_create_users
+
+
+@patch('core.management.commands.wait_for_db.Command.ping')
 class CommandTest(SimpleTestCase):
 	'''Test commands'''
 
-	def test_wait_for_db_ready(self, patched_check):
+	def test_wait_for_db_ready(self, patched_ping):
 		'''Test waiting for DB if DB is ready'''
-		patched_check.return_value = True
+		patched_ping.return_value = None
 
 		call_command('wait_for_db')
 
-		patched_check.assert_called_once_with(databases=['default'])
+		patched_ping.assert_called_once_with()
 
 
 	@patch('time.sleep')
-	def test_wait_for_db_delay(self, patched_sleep, patched_check):
+	def test_wait_for_db_delay(self, patched_sleep, patched_ping):
 		'''Test waiting for DB when getting Operational Err'''
-		patched_check.side_effect = [Psycopg2Error] * 2 + \
-		                            [OperationalError] * 3 + [True]
-		call_command('wait_for_db')
+		patched_ping.side_effect = (
+			[Psycopg2Error] * 2 + [OperationalError] * 3 + [None]
+		)
+		call_command('wait_for_db', max_delay=0.4)
+
+		self.assertEqual(patched_ping.call_count, 6)
+		pauses = [call.args[0] for call in patched_sleep.call_args_list]
+		self.assertEqual(len(pauses), 5)
+		for attempt, pause in enumerate(pauses):
+			self.assertLessEqual(pause, min(0.1 * 2 ** attempt, 0.4))
+
+	@patch('time.sleep')
+	def test_wait_for_db_timeout(self, patched_sleep, patched_ping):
+		'''Test waiting for DB gives up after the timeout'''
+		patched_ping.side_effect = OperationalError
+
+		with self.assertRaises(CommandError):
+			call_command('wait_for_db', timeout=0)
+
+		patched_ping.assert_called_once_with()
+
+
+@override_settings(
+	PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class BulkCreateUsersTest(TransactionTestCase):
+	'''Test creating users from a CSV file'''
+
+	def _csv(self, text):
+		file = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+		with file:
+			file.write(text)
+		self.addCleanup(os.remove, file.name)
+		return file.name
+
+	def _run(self, text, **options):
+		out = StringIO()
+		call_command('bulk_create_users', self._csv(text), stdout=out, **options)
+		return out.getvalue()
+
+	def test_create_in_parallel(self):
+		'''Test users are created with hashed passwords and tokens'''
+		lines = [f'user{i}@Example.com,pass{i},User {i}' for i in range(120)]
+		lines.append('user0@example.com,again,')
+
+		text = 'email,password,name\n' + '\n'.join(lines)
+		out = self._run(text, workers=2, batch=50)
+
+		users = get_user_model().objects.order_by('id')
+		self.assertEqual(users.count(), 120)
+		self.assertIn('Created 120 users, updated 0, skipped 0', out)
+		self.assertTrue(users.get(email='user7@example.com').check_password('pass7'))
+		self.assertTrue(users.get(email='user0@example.com').check_password('again'))
+		self.assertEqual(Token.objects.count(), 120)
+
+	def test_existing_emails(self):
+		'''Test existing emails are skipped, or updated on request'''
+		user = get_user_model().objects.create_user(
+			'old@example.com', 'oldpass', name='Old',
+		)
+		text = 'email,password\nold@example.com,newpass\nnew@example.com,\n'
+
+		out = self._run(text, workers=1)
+
+		self.assertIn('Created 1 users, updated 0, skipped 1', out)
+		user.refresh_from_db()
+		self.assertTrue(user.check_password('oldpass'))
+		new = get_user_model().objects.get(email='new@example.com')
+		self.assertFalse(new.has_usable_password())
+
+		out = self._run(text, workers=1, update=True)
+
+		self.assertIn('Created 0 users, updated 2, skipped 0', out)
+		user.refresh_from_db()
+		self.assertTrue(user.check_password('newpass'))
+		self.assertEqual(user.name, 'Old')
+		self.assertTrue(Token.objects.filter(user=user).exists())
+
+	def test_created_meanwhile(self):
+		'''Test emails created during the run are skipped, not fatal'''
+		user = get_user_model().objects.create_user('old@example.com', 'oldpass')
+		find_users = bulk_create_users.find_users
+		lookups = []
+
+		def lookup(emails):
+			# The first lookup ran before old@example.com was created.
+			lookups.append(emails)
+			return find_users(emails) if len(lookups) > 1 else {}
+
+		text = 'email,password\nold@example.com,newpass\nnew@example.com,x\n'
+		err = StringIO()
+		with patch.object(bulk_create_users, 'find_users', lookup):
+			out = self._run(text, workers=1, stderr=err)
+
+		self.assertIn('Created 1 users, updated 0, skipped 1', out)
+		self.assertIn(
+			'1 users were created meanwhile, skipping them.', err.getvalue(),
+		)
+		user.refresh_from_db()
+		self.assertTrue(user.check_password('oldpass'))
+		users = get_user_model().objects.filter(email='new@example.com')
+		self.assertTrue(users.exists())
 
-		self.assertEqual(patched_check.call_count, 6)
-		patched_check.assert_called_with(databases=['default'])
+	def test_invalid_file(self):
+		'''Test files without required columns or emails are refused'''
+		with self.assertRaises(CommandError):
+			self._run('email,name\na@example.com,A\n')
+		with self.assertRaises(CommandError):
+			self._run('email,password\n,secret\n')
+		self.assertFalse(get_user_model().objects.exists())
@@ -0,0 +1,135 @@
+"""
+Tests for response compression and precompressed static files.
+"""
+import gzip
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+import brotli
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import compression
+from core.middleware import CompressionMiddleware
+from core.models import Book
+
+BOOKS_URL = reverse('book:book-list')
+
+
+class NegotiationTests(SimpleTestCase):
+    """Test choosing an encoding from Accept-Encoding."""
+
+    def test_negotiate(self):
+        """Test brotli is preferred and q=0 excludes an encoding."""
+        self.assertEqual(compression.negotiate('gzip, deflate, br'), 'br')
+        self.assertEqual(compression.negotiate('gzip, br;q=0'), 'gzip')
+        self.assertEqual(compression.negotiate('*'), 'br')
+        self.assertIsNone(compression.negotiate('identity'))
+        self.assertIsNone(compression.negotiate(''))
+
+
+class CompressionMiddlewareTests(TestCase):
+    """Test API responses are compressed as negotiated."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for index in range(20):
+            Book.objects.create(
+                user=self.user, title=f'Book {index}', category='Drama',
+                number_of_pages=121, language='Polski',
+            )
+
+    def test_list_compressed(self):
+        """Test large JSON responses are gzip or brotli encoded."""
+        plain = self.client.get(BOOKS_URL)
+        gzipped = self.client.get(BOOKS_URL, HTTP_ACCEPT_ENCODING='gzip')
+        brotlied = self.client.get(BOOKS_URL, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        self.assertEqual(brotlied['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(brotlied.content), plain.content)
+        self.assertLess(len(brotlied.content), len(plain.content) / 4)
+
+    @override_settings(COMPRESSION_MIN_BYTES=10 ** 6)
+    def test_small_response_not_compressed(self):
+        """Test responses under the threshold are sent as is."""
+        res = self.client.get(BOOKS_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertNotIn('Content-Encoding', res)
+        self.assertEqual(len(json.loads(res.content)), 20)
+
+
+class CompressionStreamingTests(SimpleTestCase):
+    """Test streamed responses are compressed incrementally."""
+
+    def _middleware(self, response):
+        return CompressionMiddleware(lambda request: response)
+
+    def test_streaming_chunks_flushed(self):
+        """Test each streamed chunk is emitted before the next is produced."""
+        produced = []
+
+        def rows():
+            for index in range(3):
+                produced.append(index)
+                yield f'row {index}\n'.encode()
+
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = self._middleware(
+            StreamingHttpResponse(rows(), content_type='text/csv'),
+        )(request)
+
+        chunks = iter(response.streaming_content)
+        first = next(chunks)
+        self.assertEqual(produced, [0])
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(first + b''.join(chunks))
+        self.assertEqual(body, b'row 0\nrow 1\nrow 2\n')
+
+    def test_binary_content_skipped(self):
+        """Test already compressed content types are left alone."""
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = self._middleware(
+            HttpResponse(b'x' * 5000, content_type='image/png'),
+        )(request)
+
+        self.assertNotIn('Content-Encoding', response)
+
+
+class CompressedStaticStorageTests(SimpleTestCase):
+    """Test collectstatic writes hashed files with compressed siblings."""
+
+    def test_collectstatic_writes_siblings(self):
+        """Test .gz and .br files are written next to hashed assets."""
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            STATIC_ROOT=root,
+            STATICFILES_STORAGE=(
+                'core.storage.CompressedManifestStaticFilesStorage'
+            ),
+        ):
+            call_command('collectstatic', interactive=False, stdout=StringIO())
+
+            manifest = json.loads(
+                (Path(root) / 'staticfiles.json').read_text(),
+            )
+            hashed = Path(root) / manifest['paths']['admin/css/base.css']
+            data = hashed.read_bytes()
+            for suffix, codec in (('gz', gzip), ('br', brotli)):
+                compressed = Path(f'{hashed}.{suffix}').read_bytes()
+                self.assertEqual(codec.decompress(compressed), data)
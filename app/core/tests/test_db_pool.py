@@ -0,0 +1,148 @@
+"""
+Tests for the pooled PostgreSQL backend.
+"""
+import threading
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from psycopg2.extensions import (
+    TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS,
+)
+
+from core.db.backends.postgresql.base import DatabaseWrapper
+from core.db.backends.postgresql.pool import ConnectionPool, PoolTimeout
+
+
+def fake_connection():
+    """Create and return a stand-in for a psycopg2 connection."""
+    conn = MagicMock(closed=0)
+    conn.get_transaction_status.return_value = TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test the in-process connection pool."""
+
+    def setUp(self):
+        self.connect = MagicMock(side_effect=fake_connection)
+
+    def test_connection_is_reused(self):
+        """Test a released connection is handed out again."""
+        pool = ConnectionPool(self.connect, max_size=2)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_acquire_timeout(self):
+        """Test acquiring from an exhausted pool times out."""
+        pool = ConnectionPool(self.connect, max_size=1, timeout=0.01)
+        pool.getconn()
+
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_dirty_connection_rolled_back(self):
+        """Test a connection left in a transaction is rolled back."""
+        pool = ConnectionPool(self.connect)
+        conn = pool.getconn()
+        conn.get_transaction_status.return_value = TRANSACTION_STATUS_INTRANS
+        pool.putconn(conn)
+
+        conn.rollback.assert_called_once()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_discarded_connection_closed(self):
+        """Test discarded and closed connections are not reused."""
+        pool = ConnectionPool(self.connect)
+        conn = pool.getconn()
+        pool.putconn(conn, discard=True)
+
+        conn.close.assert_called_once()
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['closed'], 1)
+
+    def test_stale_connection_pinged(self):
+        """Test idle connections past the check interval are pinged."""
+        pool = ConnectionPool(self.connect, check_interval=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.cursor.side_effect = Exception('server closed the connection')
+
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_ping_outside_lock(self):
+        """Test a slow ping does not block other threads on the pool."""
+        pool = ConnectionPool(self.connect, check_interval=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        locked = []
+
+        def try_lock():
+            acquired = pool._lock.acquire(blocking=False)
+            locked.append(not acquired)
+            if acquired:
+                pool._lock.release()
+
+        def ping(*args):
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+
+        conn.cursor.return_value.__enter__.return_value.execute = ping
+
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(locked, [False])
+
+    @patch('core.db.backends.postgresql.pool.os.getpid')
+    def test_pool_reset_after_fork(self, patched_getpid):
+        """Test inherited connections are abandoned in a forked child."""
+        patched_getpid.return_value = 1
+        pool = ConnectionPool(self.connect)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        patched_getpid.return_value = 2
+        stats = pool.stats()
+
+        self.assertEqual(stats['idle'], 0)
+        conn.close.assert_not_called()
+
+
+class HealthCheckTests(SimpleTestCase):
+    """Test persistent connection health checks."""
+
+    def setUp(self):
+        settings_dict = dict(
+            connection.settings_dict,
+            ENGINE='core.db.backends.postgresql',
+            CONN_HEALTH_CHECKS=True,
+            POOL=None,
+        )
+        self.wrapper = DatabaseWrapper(settings_dict, alias='health')
+        self.wrapper.connection = fake_connection()
+        self.wrapper.autocommit = True
+
+    @patch.object(DatabaseWrapper, 'connect')
+    @patch.object(DatabaseWrapper, 'is_usable', return_value=False)
+    def test_dead_connection_replaced(self, patched_usable, patched_connect):
+        """Test a dead connection is closed and reopened once per request."""
+        self.wrapper.close_if_unusable_or_obsolete()
+        self.wrapper.ensure_connection()
+
+        patched_usable.assert_called_once()
+        patched_connect.assert_called_once()
+
+    @patch.object(DatabaseWrapper, 'is_usable', return_value=True)
+    def test_checked_once_per_request(self, patched_usable):
+        """Test the health check runs only on first use in a request."""
+        self.wrapper.close_if_unusable_or_obsolete()
+        self.wrapper.ensure_connection()
+        self.wrapper.ensure_connection()
+
+        patched_usable.assert_called_once()
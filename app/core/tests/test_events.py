@@ -0,0 +1,227 @@
+"""
+Tests for the server-sent event stream of library changes.
+"""
+import asyncio
+import time
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from core import events
+from core.models import Book, SyncState, Tag
+
+
+class Stream:
+    """A client of the event stream app."""
+
+    def __init__(self, token=None, headers=(), query_string=b''):
+        headers = list(headers)
+        if token is not None:
+            headers.append((b'authorization', f'Token {token.key}'.encode()))
+        self.scope = {
+            'type': 'http', 'method': 'GET', 'path': events.PATH,
+            'query_string': query_string, 'headers': headers,
+        }
+        self.sent = []
+        self.gone = asyncio.Event()
+        self.task = asyncio.ensure_future(
+            events.stream(self.scope, self.receive, self.send),
+        )
+
+    async def receive(self):
+        await self.gone.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    @property
+    def status(self):
+        return self.sent[0]['status']
+
+    @property
+    def body(self):
+        return b''.join(m.get('body', b'') for m in self.sent[1:])
+
+    async def expect(self, text, seconds=3):
+        """Wait until the body contains ``text``."""
+        deadline = time.monotonic() + seconds
+        while text not in self.body:
+            if self.task.done() or time.monotonic() > deadline:
+                raise AssertionError(f'{text!r} not in {self.body!r}')
+            await asyncio.sleep(0.01)
+
+    async def close(self):
+        self.gone.set()
+        await asyncio.wait_for(self.task, 3)
+        # The stream read the log in the sync thread, with its own
+        # connection.
+        await sync_to_async(connections.close_all)()
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(email, 'test123')
+
+
+@override_settings(EVENTS_BUS='local')
+class EventStreamTests(TransactionTestCase):
+    """Test changes are pushed to the streams of their user."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+
+    def _create_book(self, user=None):
+        return Book.objects.create(
+            user=user or self.user, title='Sample', category='Drama',
+            number_of_pages=121, language='Polski',
+        ).pk
+
+    def test_pushes_changes(self):
+        """Test saves and deletes of the user arrive as events."""
+        other = create_user('other@example.com')
+
+        async def run():
+            stream = Stream(self.token)
+            await stream.expect(b'retry: 3000\n\n')
+            self.assertEqual(stream.status, status.HTTP_200_OK)
+            self.assertIn(
+                (b'content-type', b'text/event-stream'),
+                stream.sent[0]['headers'],
+            )
+
+            await sync_to_async(self._create_book)(other)
+            book_id = await sync_to_async(self._create_book)()
+            await stream.expect(
+                f'event: book\ndata: {{"id": {book_id}'.encode(),
+            )
+            tag = await sync_to_async(Tag.objects.create)(
+                user=self.user, name='Funny',
+            )
+            tag_id = tag.pk
+            await sync_to_async(tag.delete)()
+            await stream.expect(
+                f'event: tag\ndata: {{"id": {tag_id}, "deleted": true}}'
+                .encode(),
+            )
+            await stream.close()
+            return stream.body
+
+        body = asyncio.run(run())
+
+        self.assertEqual(body.count(b'event: '), 3)
+        seqs = [
+            int(line[4:]) for line in body.split(b'\n')
+            if line.startswith(b'id: ')
+        ]
+        self.assertEqual(seqs, [1, 2, 3])
+
+    def test_resume(self):
+        """Test a stream resumes after Last-Event-ID or since."""
+        first = self._create_book()
+        second = self._create_book()
+
+        async def run(**kwargs):
+            stream = Stream(self.token, **kwargs)
+            await stream.expect(f'"id": {second}'.encode())
+            await stream.close()
+            return stream.body
+
+        body = asyncio.run(run(headers=[(b'last-event-id', b'1')]))
+        self.assertNotIn(f'"id": {first},'.encode(), body)
+        self.assertIn(b'id: 2\n', body)
+        body = asyncio.run(run(query_string=b'since=0'))
+        self.assertIn(f'"id": {first},'.encode(), body)
+
+    @override_settings(EVENTS_HEARTBEAT_SECONDS=0.05)
+    def test_heartbeat(self):
+        """Test idle streams get a comment every heartbeat."""
+        async def run():
+            stream = Stream(self.token)
+            await stream.expect(b': heartbeat\n\n: heartbeat\n\n')
+            await stream.close()
+
+        asyncio.run(run())
+
+    def test_rejected(self):
+        """Test unauthenticated and expired streams are refused."""
+        self._create_book()
+        SyncState.objects.filter(user=self.user).update(floor_seq=1)
+        cases = [
+            (None, b'', status.HTTP_401_UNAUTHORIZED),
+            (self.token, b'since=0', status.HTTP_410_GONE),
+            (self.token, b'since=2', status.HTTP_410_GONE),
+            (self.token, b'since=x', status.HTTP_400_BAD_REQUEST),
+        ]
+
+        async def run(token, query_string):
+            stream = Stream(token, query_string=query_string)
+            await asyncio.wait_for(stream.task, 3)
+            await sync_to_async(connections.close_all)()
+            return stream.status
+
+        for token, query_string, expected in cases:
+            self.assertEqual(asyncio.run(run(token, query_string)), expected)
+
+
+@override_settings(EVENTS_BUS='postgres')
+class ListenNotifyTests(TransactionTestCase):
+    """Test commits of other processes wake streams through NOTIFY."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+        self.addCleanup(events.hub.stop)
+
+    def test_notified(self):
+        """Test a committed change reaches the stream via the listener."""
+        async def run():
+            stream = Stream(self.token)
+            await stream.expect(b'retry:')
+            # Give the listener time to LISTEN before the commit.
+            await asyncio.sleep(0.3)
+            tag = await sync_to_async(Tag.objects.create)(
+                user=self.user, name='Funny',
+            )
+            await stream.expect(
+                f'event: tag\ndata: {{"id": {tag.pk}, "deleted": false}}'
+                .encode(),
+            )
+            await stream.close()
+
+        asyncio.run(run())
+
+
+@override_settings(EVENTS_BUS='off')
+class BusOffTests(TestCase):
+    """Test writes notify nobody when the bus is off."""
+
+    def test_no_notify(self):
+        """Test seqs are taken without NOTIFY or waking the hub."""
+        user = create_user()
+
+        with mock.patch.object(events.hub, 'wake') as wake:
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    Tag.objects.create(user=user, name='Funny')
+
+        self.assertFalse(any('pg_notify' in q['sql'] for q in queries))
+        wake.assert_not_called()
+
+    def test_not_served(self):
+        """Test the stream path is left to the wrapped app."""
+        application = mock.AsyncMock()
+        scope = {'type': 'http', 'method': 'GET', 'path': events.PATH}
+
+        asyncio.run(
+            events.with_event_stream(application)(scope, None, None),
+        )
+
+        application.assert_awaited_once_with(scope, None, None)
@@ -0,0 +1,55 @@
+"""
+Tests for the liveness and readiness endpoints.
+"""
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db.utils import OperationalError
+from django.test import TestCase
+
+from core import health
+
+
+class HealthCheckTests(TestCase):
+    """Test /healthz and /readyz."""
+
+    def setUp(self):
+        cache.delete(health.CACHE_KEY)
+        self.addCleanup(cache.delete, health.CACHE_KEY)
+
+    def test_healthz(self):
+        """Test liveness needs no database and accepts any host."""
+        with self.assertNumQueries(0):
+            res = self.client.get('/healthz', HTTP_HOST='10.0.0.5')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+
+    def test_readyz(self):
+        """Test readiness checks the database once per cache interval."""
+        res = self.client.get('/readyz', HTTP_HOST='10.0.0.5')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.json()['checks'], {'database': 'ok', 'migrations': 'ok'},
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/readyz').status_code, 200)
+
+    @patch('core.health.ping', side_effect=OperationalError)
+    def test_readyz_database_down(self, patched_ping):
+        """Test readiness fails, and stays cached, while the DB is down."""
+        res = self.client.get('/readyz')
+        self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks']['database'], 'unreachable')
+        patched_ping.assert_called_once_with()
+
+    @patch('core.health.unapplied_migrations', return_value=['core.0099_next'])
+    def test_readyz_unapplied_migrations(self, patched_unapplied):
+        """Test readiness fails until migrations are applied."""
+        res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks']['migrations'], '1 unapplied')
@@ -0,0 +1,149 @@
+"""
+Tests for Idempotency-Key handling.
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Book, IdempotencyKey, Tag
+
+BOOKS_URL = reverse('book:book-list')
+
+PAYLOAD = {
+    'title': 'Sample title',
+    'category': 'Drama',
+    'number_of_pages': 121,
+    'language': 'Polski',
+    'tags': [{'name': 'Funny'}],
+}
+
+
+def create_user(email='user@example.com', password='test123'):
+    """Create a return a new user."""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+class IdempotencyTests(TestCase):
+    """Test retried writes are applied once."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _post(self, key, payload=PAYLOAD):
+        return self.client.post(
+            BOOKS_URL, payload, format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_response(self):
+        """Test a retried create returns the first response only."""
+        first = self._post('key-1')
+        second = self._post('key-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(Tag.objects.count(), 1)
+
+        self._post('key-2')
+
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_reused_key_different_request(self):
+        """Test a key reused for another payload is rejected."""
+        self._post('key-1')
+
+        res = self._post('key-1', dict(PAYLOAD, title='Other'))
+
+        self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Book.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_in_flight_duplicate_rejected(self):
+        """Test a duplicate of a running request gets 409."""
+        self._post('key-1')
+        IdempotencyKey.objects.update(status_code=None, body=None)
+
+        res = self._post('key-1')
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Book.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_LOCK_SECONDS=10)
+    def test_abandoned_claim_taken_over(self):
+        """Test a claim left by a crashed request does not block forever."""
+        self._post('key-1')
+        IdempotencyKey.objects.update(
+            status_code=None, body=None,
+            created_at=timezone.now() - timedelta(seconds=30),
+        )
+
+        res = self._post('key-1')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_keys_scoped_per_user(self):
+        """Test the same key of another user is independent."""
+        self._post('key-1')
+        self.client.force_authenticate(create_user('other@example.com'))
+
+        res = self._post('key-1')
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_update_replayed(self):
+        """Test tag updates honour the header too."""
+        tag = Tag.objects.create(user=self.user, name='Old')
+        url = reverse('book:tag-detail', args=[tag.id])
+
+        self.client.patch(url, {'name': 'New'}, HTTP_IDEMPOTENCY_KEY='key-1')
+        tag.name = 'Changed'
+        tag.save()
+        res = self.client.patch(
+            url, {'name': 'New'}, HTTP_IDEMPOTENCY_KEY='key-1',
+        )
+
+        self.assertEqual(res.json()['name'], 'New')
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Changed')
+
+    def test_expired_keys(self):
+        """Test expired keys run again and are purged by the sweep."""
+        self._post('key-1')
+        IdempotencyKey.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+
+        res = self._post('key-1')
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Book.objects.count(), 2)
+
+        IdempotencyKey.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        call_command('purge_idempotency_keys', stdout=StringIO())
+
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_invalid_key(self):
+        """Test overlong keys are rejected."""
+        res = self._post('x' * 256)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Book.objects.exists())
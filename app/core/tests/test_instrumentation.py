@@ -0,0 +1,67 @@
+"""
+Tests for per-request timing instrumentation.
+"""
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import instrumentation
+
+BOOKS_URL = reverse('book:book-list')
+
+
+class SpanTests(SimpleTestCase):
+    """Test collecting spans."""
+
+    def test_span_without_request_is_noop(self):
+        """Test spans outside a sampled request do nothing."""
+        with instrumentation.span('work'):
+            pass
+
+        self.assertIsNone(instrumentation.current())
+
+    def test_nested_spans_count_once(self):
+        """Test a span nested in one of the same name is not double counted."""
+        token = instrumentation.start()
+        with instrumentation.span('serialize'):
+            with instrumentation.span('serialize'):
+                pass
+        timings = instrumentation.stop(token)
+
+        self.assertEqual(timings.spans['serialize'][0], 1)
+        self.assertIn('serialize;dur=', timings.server_timing())
+
+
+class ServerTimingMiddlewareTests(TestCase):
+    """Test the Server-Timing middleware."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        self.client.force_authenticate(self.user)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1.0)
+    def test_sampled_request_reports_timings(self):
+        """Test sampled requests get a header and a log line."""
+        with self.assertLogs('core.middleware', level='INFO') as logs:
+            res = self.client.get(BOOKS_URL)
+
+        header = res['Server-Timing']
+        for metric in ('total;dur=', 'db;dur=', 'render;dur='):
+            self.assertIn(metric, header)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['route'], 'book:book-list')
+        self.assertGreater(record['sql_count'], 0)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0.0)
+    def test_unsampled_request_untouched(self):
+        """Test requests outside the sample carry no header."""
+        res = self.client.get(BOOKS_URL)
+
+        self.assertFalse(res.has_header('Server-Timing'))
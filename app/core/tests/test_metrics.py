@@ -0,0 +1,60 @@
+"""
+Tests for the metrics endpoint.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+METRICS_URL = reverse('metrics')
+BOOKS_URL = reverse('book:book-list')
+TOKEN_URL = reverse('user:token')
+
+
+class MetricsTests(TestCase):
+    """Test metrics are exposed in Prometheus format."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _metrics(self):
+        """Return the current metrics exposition text."""
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        return res.content.decode()
+
+    def test_request_counted_per_route(self):
+        """Test requests are counted under their route name."""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        self.client.force_authenticate(user)
+        self.client.get(BOOKS_URL)
+
+        body = self._metrics()
+
+        self.assertIn(
+            'http_requests_total'
+            '{method="GET",route="book:book-list",status="200"}',
+            body,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket'
+            '{le="0.005",method="GET",route="book:book-list"}',
+            body,
+        )
+        self.assertIn('db_queries_total{route="book:book-list"}', body)
+
+    def test_auth_failures_counted(self):
+        """Test unauthenticated requests and bad credentials are counted."""
+        self.client.get(BOOKS_URL)
+        self.client.post(
+            TOKEN_URL, {'email': 'no@example.com', 'password': 'bad'},
+        )
+
+        body = self._metrics()
+
+        self.assertIn('auth_failures_total{reason="unauthorized"}', body)
+        self.assertIn('auth_failures_total{reason="credentials"}', body)
@@ -0,0 +1,135 @@
+"""
+Tests for on-demand request profiles and memory snapshots.
+"""
+import marshal
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+BOOKS_URL = reverse('book:book-list')
+MEMORY_URL = reverse('debug_memory')
+
+
+def token_client(user):
+    """Return a client sending the user's API token."""
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+class ProfilingTests(TestCase):
+    """Test staff can profile single requests."""
+
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(
+            'staff@example.com', 'test123', is_staff=True,
+        )
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+
+    def test_profile_request(self):
+        """Test a flagged staff request is profiled and downloadable."""
+        client = token_client(self.staff)
+
+        res = client.get(BOOKS_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        profile_id = res['X-Profile-Id']
+        url = res['X-Profile-Url']
+        self.assertTrue(url.endswith(f'/api/debug/profiles/{profile_id}/'))
+        download = client.get(reverse('debug_profile', args=[profile_id]))
+        self.assertEqual(download['Content-Type'], 'application/octet-stream')
+        self.assertTrue(marshal.loads(download.content))
+        text = client.get(
+            reverse('debug_profile', args=[profile_id]), {'output': 'text'},
+        )
+        self.assertIn('function calls', text.content.decode())
+        self.assertIn(f'GET {BOOKS_URL}', text.content.decode())
+
+    def test_text_sort(self):
+        """Test the text report sorts by pstats keys only."""
+        client = token_client(self.staff)
+        profile_id = client.get(BOOKS_URL, HTTP_X_PROFILE='1')['X-Profile-Id']
+        url = reverse('debug_profile', args=[profile_id])
+
+        res = client.get(url, {'output': 'text', 'sort': 'calls'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('call count', res.content.decode())
+
+        res = client.get(url, {'output': 'text', 'sort': 'bogus'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('sort', res.data)
+
+    def test_download_with_session(self):
+        """Test staff signed in to the site can open the profile URL."""
+        profile_id = token_client(self.staff).get(
+            BOOKS_URL, HTTP_X_PROFILE='1',
+        )['X-Profile-Id']
+        client = APIClient()
+        client.force_login(self.staff)
+
+        res = client.get(reverse('debug_profile', args=[profile_id]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        client.force_login(self.user)
+        res = client.get(reverse('debug_profile', args=[profile_id]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_query_flag(self):
+        """Test ?profile=1 works like the header."""
+        res = token_client(self.staff).get(BOOKS_URL, {'profile': '1'})
+
+        self.assertIn('X-Profile-Id', res)
+
+    def test_not_profiled(self):
+        """Test unflagged and non-staff requests are not profiled."""
+        res = token_client(self.staff).get(BOOKS_URL)
+        self.assertNotIn('X-Profile-Id', res)
+
+        client = token_client(self.user)
+        res = client.get(BOOKS_URL, HTTP_X_PROFILE='1')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', res)
+        res = client.get(reverse('debug_profile', args=['abc']))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unknown_profile(self):
+        """Test expired profiles are not found."""
+        client = token_client(self.staff)
+        res = client.get(reverse('debug_profile', args=['abc']))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_memory_snapshots(self):
+        """Test snapshots start tracing, then report growth, until stopped."""
+        self.addCleanup(tracemalloc.stop)
+        client = token_client(self.staff)
+
+        res = client.post(MEMORY_URL)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(tracemalloc.is_tracing())
+
+        kept = [bytearray(1024) for _ in range(100)]
+        res = client.post(f'{MEMORY_URL}?limit=5')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(res.data['stats']), 5)
+        self.assertTrue(any(
+            'test_profiling.py' in stat['traceback'][0]
+            and stat['size_diff_kb'] >= 100
+            for stat in res.data['stats']
+        ))
+        del kept
+
+        res = client.delete(MEMORY_URL)
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(tracemalloc.is_tracing())
+        res = token_client(self.user).post(MEMORY_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,103 @@
+"""
+Tests for slow-query and N+1 detection.
+"""
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from book.serializers import BookSerializer
+from book.views import BookViewSet
+from core import querywatch
+from core.models import Book, Review
+
+BOOKS_URL = reverse('book:book-list')
+
+
+class FingerprintTests(SimpleTestCase):
+    """Test SQL fingerprinting."""
+
+    def test_literals_normalized(self):
+        """Test queries differing in literals share a fingerprint."""
+        self.assertEqual(
+            querywatch.fingerprint(
+                "SELECT * FROM t WHERE id = 1 AND name = 'a'",
+            ),
+            querywatch.fingerprint(
+                "SELECT *  FROM t WHERE id = 22 AND name = 'b''c'",
+            ),
+        )
+
+    def test_placeholder_lists_collapsed(self):
+        """Test IN lists of any length share a fingerprint."""
+        self.assertEqual(
+            querywatch.fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            'SELECT * FROM t WHERE id IN (?)',
+        )
+
+    def test_budgets_enforced_under_test_runner(self):
+        """Test the test runner turns budget overruns into failures."""
+        self.assertTrue(settings.QUERY_BUDGETS_ENFORCED)
+
+
+@override_settings(N_PLUS_ONE_THRESHOLD=3)
+class QueryWatcherTests(TestCase):
+    """Test detection of repeated queries."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        for index in range(3):
+            book = Book.objects.create(
+                user=self.user, title=f'Book {index}', category='Drama',
+                number_of_pages=100, language='Polski',
+            )
+            book.reviews.add(
+                Review.objects.create(user=self.user, name='good'),
+            )
+
+    def test_n_plus_one_traced_to_serializer_field(self):
+        """Test an N+1 is attributed to the nested serializer field."""
+        watcher = querywatch.QueryWatcher()
+        with connection.execute_wrapper(watcher):
+            BookSerializer(Book.objects.all(), many=True).data
+
+        (origin, stack), = watcher.repeated.values()
+        self.assertEqual(origin, 'BookSerializer.reviews')
+        self.assertTrue(any('test_querywatch.py' in line for line in stack))
+
+    def test_fingerprints_only_reported(self):
+        """Test statements are not fingerprinted while they are counted."""
+        watcher = querywatch.QueryWatcher()
+        with patch.object(querywatch, 'fingerprint') as patched:
+            with connection.execute_wrapper(watcher):
+                BookSerializer(Book.objects.all(), many=True).data
+            patched.assert_not_called()
+
+        self.assertEqual(watcher.count, 4)
+        self.assertEqual(max(watcher.fingerprints().values()), 3)
+
+    def test_over_budget_fails(self):
+        """Test a view exceeding its query budget fails under tests."""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with patch.object(BookViewSet, 'query_budgets', {'list': 1}):
+            with self.assertRaises(querywatch.QueryBudgetExceeded):
+                client.get(BOOKS_URL)
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_query_logged_with_plan(self):
+        """Test slow queries are logged with their EXPLAIN output."""
+        watcher = querywatch.QueryWatcher()
+        with self.assertLogs('core.querywatch', level='WARNING') as logs:
+            with connection.execute_wrapper(watcher):
+                list(Book.objects.filter(title='Book 1'))
+
+        self.assertIn('Scan', logs.output[0])
@@ -0,0 +1,81 @@
+"""
+Tests for read replica routing.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from rest_framework.authtoken.models import Token
+
+from core.db import routers
+from core.models import Book
+
+REPLICA_SETTINGS = {
+    'DATABASE_REPLICAS': ['replica1'],
+    'REPLICA_PIN_SECONDS': 5,
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    },
+}
+
+
+@override_settings(**REPLICA_SETTINGS)
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Test routing of reads and writes."""
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        self.user = get_user_model()(pk=1, email='user@example.com')
+        cache.clear()
+
+    def _route_read(self, method='get', user=None, model=Book):
+        """Start a request and return the alias chosen for a read."""
+        request = getattr(self.factory, method)('/api/book/books/')
+        request.user = user or self.user
+        token = routers.begin_request(request)
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            routers.end_request(token)
+
+    def test_reads_outside_requests_use_primary(self):
+        """Test reads from commands and shells use primary."""
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+    def test_safe_request_reads_from_replica(self):
+        """Test GET requests read from a replica."""
+        self.assertEqual(self._route_read(), 'replica1')
+
+    def test_unsafe_request_reads_from_primary(self):
+        """Test reads during POST requests use primary."""
+        self.assertEqual(self._route_read(method='post'), 'default')
+
+    def test_auth_models_read_from_primary(self):
+        """Test token lookups never hit a lagging replica."""
+        self.assertEqual(self._route_read(model=Token), 'default')
+
+    def test_anonymous_reads_from_replica(self):
+        """Test reads before authentication may use a replica."""
+        self.assertEqual(self._route_read(user=AnonymousUser()), 'replica1')
+
+    def test_write_pins_user_to_primary(self):
+        """Test a user's reads go to primary after their write."""
+        request = self.factory.post('/api/book/books/')
+        request.user = self.user
+        token = routers.begin_request(request)
+        self.assertEqual(self.router.db_for_write(Book), 'default')
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+        routers.end_request(token)
+
+        self.assertEqual(self._route_read(), 'default')
+        other_user = get_user_model()(pk=2, email='other@example.com')
+        self.assertEqual(self._route_read(user=other_user), 'replica1')
+
+    def test_no_migrations_on_replica(self):
+        """Test migrations only run against primary."""
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
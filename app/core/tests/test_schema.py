@@ -0,0 +1,60 @@
+"""
+Tests for the precomputed OpenAPI schema.
+"""
+import gzip
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import schema
+
+SCHEMA_URL = reverse('api_schema')
+
+
+class SchemaTests(TestCase):
+    """Test the schema is built once and served with caching headers."""
+
+    def setUp(self):
+        self.client = APIClient()
+        schema._schemas.clear()
+
+    def test_schema_served_with_etag(self):
+        """Test the schema is served and revalidated with its ETag."""
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'/api/book/books/', res.content)
+        etag = res['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+
+    def test_schema_gzipped(self):
+        """Test clients accepting gzip get the compressed schema."""
+        plain = self.client.get(SCHEMA_URL)
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res['Vary'])
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+
+    def test_schema_built_once_per_code_version(self):
+        """Test the schema is generated again only when code changes."""
+        with mock.patch.object(schema, 'build', wraps=schema.build) as build, \
+                mock.patch.object(schema, 'code_version', return_value='v1'):
+            schema.cache.delete_many([
+                f'openapi-schema:v{n}:application/vnd.oai.openapi:en-us'
+                for n in (1, 2)
+            ])
+            self.client.get(SCHEMA_URL)
+            self.client.get(SCHEMA_URL)
+            self.assertEqual(build.call_count, 1)
+
+            schema.code_version.return_value = 'v2'
+            self.client.get(SCHEMA_URL)
+            self.assertEqual(build.call_count, 2)
@@ -0,0 +1,88 @@
+"""
+Tests for keeping the denormalized book arrays in sync.
+"""
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import Book, Review, Tag
+
+
+class BookArraysTests(TestCase):
+    """Test Book.tag_ids, tag_names and review_ids follow the M2M tables."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        self.book = Book.objects.create(
+            user=self.user, title='Sample title', category='Drama',
+            number_of_pages=121, language='Polski',
+        )
+        self.tag1 = Tag.objects.create(user=self.user, name='Funny')
+        self.tag2 = Tag.objects.create(user=self.user, name='Sad')
+
+    def assertArrays(self, tag_ids, tag_names, review_ids=()):
+        """Check the arrays both in memory and in the database."""
+        stored = Book.objects.get(pk=self.book.pk)
+        for book in (self.book, stored):
+            self.assertEqual(book.tag_ids, list(tag_ids))
+            self.assertEqual(book.tag_names, list(tag_names))
+            self.assertEqual(book.review_ids, list(review_ids))
+
+    def test_add_and_remove_tags(self):
+        """Test adding and removing tags updates the arrays."""
+        self.book.tags.add(self.tag2, self.tag1)
+        self.assertArrays([self.tag1.id, self.tag2.id], ['Funny', 'Sad'])
+
+        self.book.tags.remove(self.tag1)
+        self.assertArrays([self.tag2.id], ['Sad'])
+
+        self.book.tags.clear()
+        self.assertArrays([], [])
+
+    def test_reverse_changes(self):
+        """Test changes made from the tag side update the books."""
+        self.tag1.book_set.add(self.book)
+        self.book.refresh_from_db()
+        self.assertArrays([self.tag1.id], ['Funny'])
+
+        self.tag1.book_set.clear()
+        self.book.refresh_from_db()
+        self.assertArrays([], [])
+
+    def test_rename_and_delete_tag(self):
+        """Test renamed and deleted tags are reflected."""
+        self.book.tags.add(self.tag1, self.tag2)
+        self.tag1.name = 'Very funny'
+        self.tag1.save()
+        self.book.refresh_from_db()
+        self.assertArrays([self.tag1.id, self.tag2.id], ['Very funny', 'Sad'])
+
+        self.tag2.delete()
+        self.book.refresh_from_db()
+        self.assertArrays([self.tag1.id], ['Very funny'])
+
+    def test_reviews(self):
+        """Test review links and deletes update review_ids."""
+        review = Review.objects.create(user=self.user, name='some text')
+        self.book.reviews.add(review)
+        self.assertArrays([], [], [review.id])
+
+        review.delete()
+        self.book.refresh_from_db()
+        self.assertArrays([], [], [])
+
+    def test_reconcile_command(self):
+        """Test the reconcile command repairs drifted arrays."""
+        self.book.tags.add(self.tag1)
+        Book.objects.filter(pk=self.book.pk).update(tag_ids=[], tag_names=[])
+        out = StringIO()
+
+        call_command('reconcile_book_arrays', stdout=out)
+
+        self.book.refresh_from_db()
+        self.assertArrays([self.tag1.id], ['Funny'])
+        self.assertIn('fixed 1', out.getvalue())
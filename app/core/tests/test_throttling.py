@@ -0,0 +1,142 @@
+"""
+Tests for the token bucket throttles and concurrency caps.
+"""
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from book.views import BookViewSet
+from core import throttling
+
+BOOKS_URL = reverse('book:book-list')
+
+
+def _take(key):
+    return throttling.take(key, 5, 0.001)
+
+
+class BucketTests(SimpleTestCase):
+    """Test the file backed buckets and slots."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(THROTTLE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_parse_rate(self):
+        """Test rates give capacity and refill per second."""
+        self.assertEqual(throttling.parse_rate('120/min'), (120, 2))
+        self.assertEqual(throttling.parse_rate('10/s'), (10, 10))
+
+    def test_token_bucket(self):
+        """Test a bucket allows bursts up to capacity, then refills."""
+        self.assertEqual(throttling.take('k', 2, 1, now=100), 0)
+        self.assertEqual(throttling.take('k', 2, 1, now=100), 0)
+        self.assertEqual(throttling.take('k', 2, 1, now=100), 1)
+        self.assertEqual(throttling.take('k', 2, 1, now=100.5), 0.5)
+        self.assertEqual(throttling.take('k', 2, 1, now=101), 0)
+        self.assertEqual(throttling.take('other', 2, 1, now=101), 0)
+
+    def test_bucket_shared_by_processes(self):
+        """Test workers in separate processes draw from one bucket."""
+        with ProcessPoolExecutor(4) as executor:
+            waits = list(executor.map(_take, ['shared'] * 20))
+
+        self.assertEqual(waits.count(0), 5)
+
+    def test_slots(self):
+        """Test slots are limited and freed when closed."""
+        first = throttling.acquire('k', 2)
+        second = throttling.acquire('k', 2)
+
+        self.assertIsNone(throttling.acquire('k', 2))
+        first.close()
+        third = throttling.acquire('k', 2)
+        self.assertIsNotNone(third)
+        second.close()
+        third.close()
+
+
+class ThrottledApiTests(TestCase):
+    """Test the book API enforces rates and concurrency caps."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(
+        THROTTLE_RATES={'book': '100/min', 'book.list': '2/min'},
+    )
+    def test_rate_per_action(self):
+        """Test list is throttled by its own bucket with Retry-After."""
+        for _ in range(2):
+            res = self.client.get(BOOKS_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+        res = self.client.get(reverse('book:book-detail', args=[1]))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(THROTTLE_RATES={'book.list': '1/min'})
+    def test_rate_per_user(self):
+        """Test each user has their own bucket."""
+        self.client.get(BOOKS_URL)
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                'other@example.com', 'test123',
+            ),
+        )
+
+        res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(
+        CONCURRENCY_LIMITS={'book.list': 1}, CONCURRENCY_RETRY_AFTER=2,
+    )
+    def test_concurrency_cap(self):
+        """Test requests over the in-flight cap wait for a free slot."""
+        running = throttling.acquire(f'book.list:user:{self.user.pk}', 1)
+
+        res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '2')
+        running.close()
+        for _ in range(2):
+            res = self.client.get(BOOKS_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(CONCURRENCY_LIMITS={'book.list': 1})
+    def test_server_error_frees_slot(self):
+        """Test a request failing with a 500 gives its slot back."""
+        self.client.raise_request_exception = False
+        failing = mock.patch.object(
+            BookViewSet, 'get_queryset', side_effect=ValueError,
+        )
+
+        with failing:
+            for _ in range(2):
+                res = self.client.get(BOOKS_URL)
+                self.assertEqual(
+                    res.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR,
+                )
+            slot = throttling.acquire(f'book.list:user:{self.user.pk}', 1)
+
+        self.assertIsNotNone(slot)
+        slot.close()
@@ -0,0 +1,137 @@
+"""
+Tests for statement timeouts and cancelling queries of gone clients.
+"""
+import asyncio
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import connection, connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from book.views import BookViewSet
+from core.models import Book
+from core.timeouts import ASGIHandler
+
+BOOKS_URL = reverse('book:book-list')
+
+
+def cancels(reason):
+    """Return the statements of the book list cancelled for ``reason``."""
+    return REGISTRY.get_sample_value(
+        'db_statement_cancels_total',
+        {'route': 'book:book-list', 'reason': reason},
+    ) or 0
+
+
+def slow_books(seconds):
+    """Return a get_queryset sleeping ``seconds`` per book."""
+    where = [f'pg_sleep({seconds}) IS NOT NULL']
+    return lambda view: Book.objects.extra(where=where)
+
+
+class StatementTimeoutTests(TransactionTestCase):
+    """Test slow statements are cut off with a 503."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'test123',
+        )
+        Book.objects.create(
+            user=self.user, title='Sample', category='Drama',
+            number_of_pages=121, language='Polski',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(STATEMENT_TIMEOUTS={'book': 10000, 'book.list': 50})
+    def test_timeout(self):
+        """Test a statement over the action's timeout gives a 503."""
+        before = cancels('timeout')
+
+        with mock.patch.object(BookViewSet, 'get_queryset', slow_books(1)):
+            began = time.perf_counter()
+            res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertLess(time.perf_counter() - began, 0.9)
+        self.assertEqual(cancels('timeout'), before + 1)
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], '0')
+
+    @override_settings(STATEMENT_TIMEOUTS={'book.list': 500})
+    def test_within_timeout(self):
+        """Test statements under the timeout are not affected."""
+        with mock.patch.object(BookViewSet, 'get_queryset', slow_books(0.1)):
+            res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(STATEMENT_TIMEOUTS={'book.list': 500})
+    def test_wrapper_removed_on_error(self):
+        """Test the timeout wrapper does not outlive a request that failed."""
+        self.client.raise_request_exception = False
+        failing = mock.patch.object(
+            BookViewSet, 'get_queryset', side_effect=ValueError,
+        )
+
+        with failing:
+            res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(
+            res.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+        self.assertEqual(connection.execute_wrappers, [])
+
+    @override_settings(STATEMENT_TIMEOUTS={}, ALLOWED_HOSTS=['testserver'])
+    def test_cancel_on_disconnect(self):
+        """Test the ASGI handler cancels the query of a client that left."""
+        token = Token.objects.create(user=self.user)
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': BOOKS_URL,
+            'query_string': b'',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {token.key}'.encode()),
+            ],
+        }
+        sent = []
+
+        async def request():
+            messages = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await asyncio.sleep(0.3)
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            await ASGIHandler()(scope, receive, send)
+
+        def close_connections(**kwargs):
+            # The view ran in the request's own thread and connection.
+            connections.close_all()
+
+        before = cancels('disconnect')
+        request_finished.connect(close_connections)
+        self.addCleanup(request_finished.disconnect, close_connections)
+        with mock.patch.object(BookViewSet, 'get_queryset', slow_books(5)):
+            began = time.perf_counter()
+            asyncio.run(request())
+
+        self.assertLess(time.perf_counter() - began, 3)
+        self.assertEqual(
+            sent[0]['status'], status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+        self.assertEqual(cancels('disconnect'), before + 1)
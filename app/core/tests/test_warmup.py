@@ -0,0 +1,40 @@
+"""
+Tests for the warm boot module.
+"""
+import gc
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+
+from book import serializers as book_serializers
+from core import warmup
+from user import serializers as user_serializers
+
+
+class WarmupTests(SimpleTestCase):
+    """Test loading the app before the workers fork."""
+
+    def test_local_serializers(self):
+        """Test project serializers are found, list serializers skipped."""
+        found = warmup.local_serializers()
+
+        self.assertIn(book_serializers.BookDetailSerializer, found)
+        self.assertIn(user_serializers.UserSerializer, found)
+        self.assertNotIn(book_serializers.BookTagsSerializer, found)
+        self.assertTrue(all(
+            cls.__module__.split('.')[0] in {'book', 'core', 'user'}
+            for cls in found
+        ))
+
+    def test_warm_freezes_and_survives_failures(self):
+        """Test a failing step is logged and the heap is frozen."""
+        self.addCleanup(gc.unfreeze)
+        failing = Mock(side_effect=RuntimeError)
+        steps = [('urls', warmup.load_urls), ('broken', failing)]
+
+        with patch.object(warmup, 'STEPS', steps), \
+                self.assertLogs('core.warmup', 'ERROR'):
+            timings = warmup.warm()
+
+        self.assertEqual(set(timings), {'urls', 'broken'})
+        self.assertGreater(gc.get_freeze_count(), 0)
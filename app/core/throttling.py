@@ -0,0 +1,154 @@
+"""
+Token bucket throttles and in-flight request caps shared by workers.
+
+State lives in small files under THROTTLE_DIR, so every worker process
+on the host sees the same buckets. A bucket is read and rewritten under
+an exclusive flock. A running request holds a non-blocking flock on one
+of the slot files of its user; the kernel drops the lock when the file
+is closed or the worker dies, so a crash never leaks a slot.
+
+Limits are looked up by scope: the view's ``throttle_scope`` with the
+action appended, e.g. 'book.list', falling back to the bare scope.
+Requests are counted per user, anonymous ones per client address.
+"""
+
+import fcntl
+import hashlib
+import os
+import struct
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {
+    's': 1, 'sec': 1, 'm': 60, 'min': 60,
+    'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400,
+}
+
+# Tokens left and the time they were counted.
+_BUCKET = struct.Struct('dd')
+
+
+def parse_rate(rate):
+    """Return (capacity, tokens per second) of a 'requests/period' rate."""
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period]
+
+
+def lookup(limits, view):
+    """Return the limit for the view's action, else its scope, or None."""
+    scope = getattr(view, 'throttle_scope', None)
+    if scope is None:
+        return None, None
+    for key in (f'{scope}.{getattr(view, "action", None)}', scope):
+        if limits.get(key):
+            return key, limits[key]
+    return None, None
+
+
+def _open(kind, key, mode):
+    """Open the state file of ``key``, creating THROTTLE_DIR if needed."""
+    name = hashlib.sha1(key.encode()).hexdigest()
+    path = os.path.join(settings.THROTTLE_DIR, f'{kind}-{name}')
+    try:
+        return open(path, mode)
+    except FileNotFoundError:
+        os.makedirs(settings.THROTTLE_DIR, exist_ok=True)
+        return open(path, mode)
+
+
+def take(key, capacity, refill, now=None):
+    """Take a token from the bucket; return 0, or seconds until one is free."""
+    now = time.time() if now is None else now
+    with _open('bucket', key, 'a+b') as bucket:
+        fcntl.flock(bucket, fcntl.LOCK_EX)
+        bucket.seek(0)
+        data = bucket.read()
+        if len(data) == _BUCKET.size:
+            tokens, counted = _BUCKET.unpack(data)
+            tokens = min(capacity, tokens + max(now - counted, 0) * refill)
+        else:
+            tokens = capacity
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0
+        else:
+            wait = (1 - tokens) / refill
+        bucket.seek(0)
+        bucket.truncate()
+        bucket.write(_BUCKET.pack(tokens, now))
+    return wait
+
+
+def acquire(key, limit):
+    """Lock one of ``limit`` slots of ``key``; return its file or None."""
+    for index in range(limit):
+        slot = _open('slot', f'{key}.{index}', 'ab')
+        try:
+            fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            slot.close()
+        else:
+            return slot
+    return None
+
+
+def ident(request):
+    """Return the key requests are counted by."""
+    if request.user and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'addr:{BaseThrottle().get_ident(request)}'
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket per scope and user with rates from THROTTLE_RATES."""
+
+    def allow_request(self, request, view):
+        scope, rate = lookup(settings.THROTTLE_RATES, view)
+        if rate is None:
+            return True
+        capacity, refill = parse_rate(rate)
+        self.seconds = take(f'{scope}:{ident(request)}', capacity, refill)
+        return self.seconds == 0
+
+    def wait(self):
+        return self.seconds
+
+
+class ConcurrencyLimitMixin:
+    """Cap the requests a user runs at once per scope, see CONCURRENCY_LIMITS.
+
+    The slot is taken in ``initial``, after authentication and throttles,
+    and given back in ``finalize_response``, or in ``handle_exception``
+    as DRF skips ``finalize_response`` for errors it re-raises.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.concurrency_slot = None
+        scope, limit = lookup(settings.CONCURRENCY_LIMITS, self)
+        if limit is None:
+            return
+        self.concurrency_slot = acquire(f'{scope}:{ident(request)}', limit)
+        if self.concurrency_slot is None:
+            raise Throttled(
+                wait=settings.CONCURRENCY_RETRY_AFTER,
+                detail='Too many requests in progress.',
+            )
+
+    def release_concurrency_slot(self):
+        slot = getattr(self, 'concurrency_slot', None)
+        if slot is not None:
+            self.concurrency_slot = None
+            slot.close()
+
+    def handle_exception(self, exc):
+        self.release_concurrency_slot()
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        self.release_concurrency_slot()
+        return super().finalize_response(request, response, *args, **kwargs)
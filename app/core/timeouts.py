@@ -0,0 +1,164 @@
+"""
+Statement timeouts per view and cancelling queries of gone clients.
+
+``StatementTimeoutMixin`` limits every SQL statement a view runs to the
+milliseconds in STATEMENT_TIMEOUTS for its throttle scope and action. The
+limit is sent as ``SET LOCAL statement_timeout`` in front of each
+statement: in autocommit Postgres runs both as one implicit transaction,
+so the setting ends with the statement and never leaks into a pooled
+connection, and inside ``atomic()`` it ends with the transaction. A
+statement over the limit is cancelled by the server and the request gets
+a 503.
+
+Under ASGI, ``ASGIHandler`` also listens for the client disconnecting
+while the response is being computed and cancels the statement running
+for it. WSGI servers only notice a gone client when writing the
+response, so there the timeout is the only bound.
+"""
+
+import asyncio
+import threading
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler as BaseASGIHandler
+from django.db import OperationalError, connections
+from psycopg2.errors import QueryCanceled
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core import metrics
+from core.throttling import lookup
+
+_in_flight = ContextVar('in_flight', default=None)
+
+
+class StatementTimeout(APIException):
+    """A statement ran over its timeout or the client went away."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The request took too long, try a narrower query.'
+    default_code = 'statement_timeout'
+
+
+class InFlight:
+    """Database connections running a statement for one ASGI request."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.watcher = None
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def add(self, connection):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCanceled('Client disconnected.')
+            self._connections.add(connection)
+
+    def discard(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+    def cancel(self):
+        """Cancel the running statements; later ones fail at once."""
+        with self._lock:
+            self.cancelled = True
+            running = list(self._connections)
+        for connection in running:
+            # Sends a cancel request on a separate connection.
+            connection.cancel()
+
+
+def timeout_wrapper(milliseconds):
+    """Return an execute wrapper limiting statements to ``milliseconds``."""
+    prefix = f'SET LOCAL statement_timeout = {int(milliseconds or 0)}; '
+
+    def wrapper(execute, sql, params, many, context):
+        named = getattr(context['cursor'].cursor, 'name', None)
+        if milliseconds and not named:
+            # Named (server side) cursors are declared around the query.
+            sql = prefix + sql
+        in_flight = _in_flight.get()
+        if in_flight is None:
+            return execute(sql, params, many, context)
+        connection = context['connection'].connection
+        in_flight.add(connection)
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            in_flight.discard(connection)
+
+    return wrapper
+
+
+class StatementTimeoutMixin:
+    """Apply STATEMENT_TIMEOUTS to the view's SQL, mapping it to a 503."""
+
+    def initial(self, request, *args, **kwargs):
+        self.statement_timeout = ExitStack()
+        milliseconds = lookup(settings.STATEMENT_TIMEOUTS, self)[1]
+        if milliseconds or _in_flight.get() is not None:
+            wrapper = timeout_wrapper(milliseconds)
+            for connection in connections.all():
+                self.statement_timeout.enter_context(
+                    connection.execute_wrapper(wrapper),
+                )
+        super().initial(request, *args, **kwargs)
+
+    def close_statement_timeout(self):
+        stack = getattr(self, 'statement_timeout', None)
+        if stack is not None:
+            self.statement_timeout = None
+            stack.close()
+
+    def handle_exception(self, exc):
+        # Pop the wrapper now: DRF skips finalize_response for errors it
+        # re-raises, and the middleware's wrappers must not be popped first.
+        self.close_statement_timeout()
+        cause = exc.__cause__ if isinstance(exc, OperationalError) else exc
+        if isinstance(cause, QueryCanceled):
+            in_flight = _in_flight.get()
+            if in_flight is not None and in_flight.cancelled:
+                reason = 'disconnect'
+            else:
+                reason = 'timeout'
+            route = metrics.route_name(self.request)
+            metrics.STATEMENT_CANCELS.labels(route, reason).inc()
+            exc = StatementTimeout()
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        self.close_statement_timeout()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ASGIHandler(BaseASGIHandler):
+    """Django's ASGI handler, cancelling queries when the client leaves."""
+
+    async def handle(self, scope, receive, send):
+        in_flight = InFlight()
+        token = _in_flight.set(in_flight)
+        try:
+            await super().handle(scope, receive, send)
+        finally:
+            _in_flight.reset(token)
+            if in_flight.watcher is not None:
+                in_flight.watcher.cancel()
+
+    async def read_body(self, receive):
+        """Read the body, then keep listening for a disconnect."""
+        body_file = await super().read_body(receive)
+        in_flight = _in_flight.get()
+        if in_flight is not None:
+            in_flight.watcher = asyncio.ensure_future(
+                self.watch(receive, in_flight),
+            )
+        return body_file
+
+    async def watch(self, receive, in_flight):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                await asyncio.to_thread(in_flight.cancel)
+                return
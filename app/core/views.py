@@ -0,0 +1,157 @@
+"""
+Views for operational endpoints.
+"""
+
+import os
+import pstats
+import re
+import tracemalloc
+
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.http import require_GET
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SpectacularAPIView
+from rest_framework import status
+from rest_framework.authentication import (
+    SessionAuthentication, TokenAuthentication,
+)
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import metrics as metrics_registry
+from core import batch, profiling, schema
+
+_GZIP = re.compile(r'\bgzip\b')
+
+
+@require_GET
+def metrics(request):
+    """Expose Prometheus metrics of all worker processes."""
+    body, content_type = metrics_registry.render()
+    return HttpResponse(body, content_type=content_type)
+
+
+class CachedSchemaView(SpectacularAPIView):
+    """Serve the precomputed OpenAPI schema with ETag and gzip."""
+
+    def _get_schema_response(self, request):
+        entry = schema.get(request.accepted_renderer)
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        gzipped = bool(_GZIP.search(accept_encoding))
+        # The gzip body is the same document, so its ETag is weak.
+        etag = f'W/"{entry["etag"]}"' if gzipped else f'"{entry["etag"]}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                entry['gzip'] if gzipped else entry['body'],
+                content_type=entry['content_type'],
+            )
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+@extend_schema(exclude=True)
+class ProfileView(APIView):
+    """Download a stored request profile, as .prof or ?output=text.
+
+    Sessions are accepted too, so staff profiling in a browser can open
+    the X-Profile-Url of a response.
+    """
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    permission_classes = [IsAdminUser]
+    sort_keys = tuple(key.value for key in pstats.SortKey)
+
+    def get(self, request, profile_id):
+        entry = profiling.load(profile_id)
+        if entry is None:
+            raise Http404('Profile expired or unknown.')
+        if request.query_params.get('output') == 'text':
+            sort = request.query_params.get('sort', 'cumulative')
+            if sort not in self.sort_keys:
+                raise ValidationError({
+                    'sort': f'Choose from: {", ".join(self.sort_keys)}.',
+                })
+            return HttpResponse(
+                profiling.render_text(entry, sort),
+                content_type='text/plain; charset=utf-8',
+            )
+        response = HttpResponse(
+            entry['stats'], content_type='application/octet-stream',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{profile_id}.prof"'
+        )
+        return response
+
+
+@extend_schema(exclude=True)
+class MemorySnapshotView(APIView):
+    """tracemalloc snapshots of the worker serving the request.
+
+    The first POST starts tracing, later ones return the growth since the
+    previous snapshot; DELETE stops tracing.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAdminUser]
+    group_by = ('lineno', 'filename', 'traceback')
+
+    def _int_param(self, name, default):
+        """Return a positive integer query parameter."""
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            value = 0
+        if value < 1:
+            raise ValidationError({name: 'A positive integer is required.'})
+        return value
+
+    def post(self, request):
+        group_by = request.query_params.get('group_by', 'lineno')
+        if group_by not in self.group_by:
+            raise ValidationError({
+                'group_by': f'Choose from: {", ".join(self.group_by)}.',
+            })
+        limit = self._int_param('limit', 25)
+        stats = profiling.snapshot_diff(group_by, limit)
+        if stats is None:
+            profiling.start_tracing(self._int_param('frames', 1))
+            status_code = status.HTTP_201_CREATED
+        else:
+            status_code = status.HTTP_200_OK
+        traced, peak = tracemalloc.get_traced_memory()
+        return Response({
+            'pid': os.getpid(),
+            'traced_kb': round(traced / 1024, 1),
+            'peak_kb': round(peak / 1024, 1),
+            'stats': stats or [],
+        }, status=status_code)
+
+    def delete(self, request):
+        profiling.stop_tracing()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BatchView(APIView):
+    """Run several API requests of the user in one round trip."""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        request=batch.BatchSerializer,
+        responses=batch.SubResponseSerializer(many=True),
+    )
+    def post(self, request):
+        """Return the responses of the sub-requests, in order."""
+        serializer = batch.BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(batch.execute(
+            request, serializer.validated_data['requests'],
+            atomic=serializer.validated_data['atomic'],
+        ))
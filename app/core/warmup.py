@@ -0,0 +1,111 @@
+"""
+Warm boot: load the application in the server's master before it forks.
+
+uwsgi (and gunicorn with --preload) import the WSGI module once in the
+master and fork the workers from it. Django itself only imports the
+URLconf, views, serializers and their dependencies on the first request,
+so without this every worker pays for that on its first requests and
+keeps a private copy of it all.
+
+After loading, database connections are closed so no socket is shared
+by the workers, and the surviving objects are moved to the permanent GC
+generation: collections in the workers then skip them and do not write
+to their pages, which stay shared copy-on-write.
+"""
+
+import gc
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+from django.utils import translation
+from rest_framework import serializers
+
+from core import health, schema
+from core.db.backends.postgresql.pool import all_pools
+
+logger = logging.getLogger(__name__)
+
+
+def local_serializers():
+    """Return the serializer classes defined by the project's apps."""
+    modules = tuple(
+        f'{config.name}.' for config in apps.get_app_configs()
+        if config.path.startswith(str(settings.BASE_DIR))
+    )
+    found, pending = [], [serializers.BaseSerializer]
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        if cls.__module__.startswith(modules) and not issubclass(
+            cls, serializers.ListSerializer,
+        ):
+            found.append(cls)
+    return found
+
+
+def load_urls():
+    """Import the URLconf with every view and build the reverse lookups."""
+    get_resolver().reverse_dict
+
+
+def load_serializers():
+    """Build the fields of every project serializer once."""
+    for cls in local_serializers():
+        cls().fields
+
+
+def load_images():
+    """Import Pillow and register all of its format plugins."""
+    from PIL import Image
+
+    Image.init()
+
+
+def load_translations():
+    """Load the message catalogs of the default language."""
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('')
+
+
+def check_database():
+    """Ping the database, then close every connection before the fork."""
+    try:
+        health.ping()
+    finally:
+        connections.close_all()
+        for pool in all_pools().values():
+            pool.closeall()
+
+
+STEPS = [
+    ('urls', load_urls),
+    ('serializers', load_serializers),
+    ('images', load_images),
+    ('translations', load_translations),
+    ('schema', schema.warm),
+    ('database', check_database),
+]
+
+
+def warm():
+    """Run every warm-up step, then freeze the surviving objects.
+
+    A failing step is logged and skipped: workers still load what is
+    missing on their first requests.
+    """
+    timings = {}
+    for name, step in STEPS:
+        began = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception('Warm boot step %s failed', name)
+        timings[name] = round((time.perf_counter() - began) * 1000, 1)
+    gc.collect()
+    gc.freeze()
+    logger.info('Warm boot done in ms: %s', timings)
+    return timings
@@ -1,13 +1,49 @@
 server {
     listen ${LISTEN_PORT};
 
+    # Names hashed by collectstatic never change, so they are immutable.
+    # .gz siblings are written by core.storage; builds with ngx_brotli can
+    # add brotli_static on.
+    location ~ "^/static/static/(.+\.[0-9a-f]{12}\.[A-Za-z0-9]+(\.gz|\.br)?)$" {
+        alias /vol/static/static/$1;
+        gzip_static on;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
+    # The unhashed copies change with every deploy.
+    location /static/static/ {
+        alias /vol/static/static/;
+        gzip_static on;
+        add_header Cache-Control "public, max-age=300";
+    }
+
     location /static {
         alias /vol/static;
     }
 
+    # Metrics are only served on the internal listener below.
+    location = /metrics {
+        return 404;
+    }
+
     location / {
         uwsgi_pass              ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;
         client_max_body_size    10M;
     }
+}
+
+# For Prometheus on the internal network; METRICS_PORT is not published.
+# The host it scrapes, e.g. proxy, must be in DJANGO_ALLOWED_HOSTS.
+server {
+    listen ${METRICS_PORT};
+
+    location = /metrics {
+        uwsgi_pass              ${APP_HOST}:${APP_PORT};
+        include                 /etc/nginx/uwsgi_params;
+    }
+
+    location / {
+        return 404;
+    }
 }
\ No newline at end of file
@@ -0,0 +1,33 @@
+#!/bin/sh
+
+# Benchmark the same code served by uwsgi and by ASGI workers side by side,
+# with slow clients holding connections open during the run. Run from the
+# app directory against a database seeded with seed_perf_data; extra
+# arguments are passed to benchmark_api.
+
+set -e
+
+OUT=${OUT:-/tmp/benchmark}
+WORKERS=${WORKERS:-4}
+ARGS="--requests ${REQUESTS:-5000} --concurrency ${CONCURRENCY:-64} --slow-clients ${SLOW_CLIENTS:-16}"
+mkdir -p "$OUT"
+
+# The per-user rates and in-flight caps would answer most of this load from
+# a few users with 429s; lift them so the servers are what gets measured.
+export THROTTLE_BOOK= THROTTLE_BOOK_LIST= THROTTLE_BOOK_CREATE= \
+    THROTTLE_BOOK_UPLOAD_IMAGE=
+export CONCURRENCY_BOOK=0 CONCURRENCY_BOOK_LIST=0 \
+    CONCURRENCY_BOOK_UPLOAD_IMAGE=0
+
+uwsgi --http-socket :8001 --workers "$WORKERS" --master --enable-threads \
+    --module app.wsgi --pidfile "$OUT/uwsgi.pid" --daemonize "$OUT/uwsgi.log"
+gunicorn app.asgi:application --worker-class uvicorn.workers.UvicornWorker \
+    --workers "$WORKERS" --bind :8002 --pid "$OUT/asgi.pid" --daemon \
+    --error-logfile "$OUT/asgi.log"
+trap 'kill -INT $(cat "$OUT/uwsgi.pid") $(cat "$OUT/asgi.pid")' EXIT INT TERM
+sleep 5
+
+python manage.py benchmark_api --base-url http://localhost:8001 $ARGS "$@" \
+    --output "$OUT/uwsgi.json"
+python manage.py benchmark_api --base-url http://localhost:8002 $ARGS "$@" \
+    --output "$OUT/asgi.json" --baseline "$OUT/uwsgi.json"
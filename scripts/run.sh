@@ -5,5 +5,22 @@ set -e
 python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
+python manage.py build_schema
+
+# Metrics of all uwsgi workers are aggregated through files in this directory.
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# The app is loaded and warmed in the master before the workers fork, see
+# core/warmup.py.
+export WARM_BOOT=${WARM_BOOT:-1}
+
+# SERVER_MODE=asgi serves through ASGI workers, so slow clients wait on the
+# event loop instead of pinning a worker; the proxy must speak HTTP to it.
+if [ "${SERVER_MODE:-uwsgi}" = "asgi" ]; then
+    exec gunicorn app.asgi:application --worker-class uvicorn.workers.UvicornWorker \
+        --workers 4 --bind :9000 --preload
+fi
 
 uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file